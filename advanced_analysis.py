@@ -1,102 +1,165 @@
 # 高级分析功能模块
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
+from sklearn.neighbors import KDTree
 from models import db, Laptop, Comment
+from snapshot import get_snapshot
+from history import rollup
+from sentiment import ASPECT_KEYWORDS, LABELS
+from sqlalchemy import select, func, case
+import os
 import re
-import time
+import zlib
+import joblib
+from joblib import Parallel, delayed
+from flask import current_app
+
+# 竞品分析的价格带：目标品牌平均价格的±20%
+COMPETITIVE_BAND = 0.2
+
+
+def _band_stats(snap, low, high):
+    """
+    统计各品牌落在给定价格带内的商品数、价格和与销量和（价格带两端均为闭区间）
+    将每个品牌的价格按 (品牌编码, 价格) 排序成一个数组，对所有价格带和品牌一次 searchsorted 求出区间边界
+    :param low: 价格带下界数组，长度为m
+    :param high: 价格带上界数组，长度为m
+    :return: (count, price_sum, sales_sum)，形状均为 (m, 品牌数)
+    """
+    n = len(snap.categories['brand'])
+    ok = ~np.isnan(snap.price)
+    codes = snap.codes['brand'][ok].astype(np.float64)
+    price = snap.price[ok]
+    sales = np.nan_to_num(snap.sales[ok])
+    base = price.min() if len(price) else 0.0
+    # 每个品牌占据一段互不重叠的键区间，品牌内价格偏移量落在 [0, span-1]
+    span = (price.max() - base + 1) if len(price) else 1.0
+    key = codes * span + (price - base)
+    order = np.argsort(key, kind='stable')
+    key = key[order]
+    cum_price = np.concatenate([[0.0], np.cumsum(price[order])])
+    cum_sales = np.concatenate([[0.0], np.cumsum(sales[order])])
+    offsets = np.arange(n, dtype=np.float64) * span
+    low = np.clip(np.asarray(low, dtype=np.float64) - base, -0.5, span - 0.5)
+    high = np.clip(np.asarray(high, dtype=np.float64) - base, -0.5, span - 0.5)
+    left = np.searchsorted(key, offsets[None, :] + low[:, None], side='left')
+    right = np.searchsorted(key, offsets[None, :] + high[:, None], side='right')
+    right = np.maximum(right, left)
+    return right - left, cum_price[right] - cum_price[left], cum_sales[right] - cum_sales[left]
+
+
+def build_competitive_matrix(snap):
+    """
+    一次向量化计算所有品牌两两之间的竞品矩阵（行为目标品牌，列为竞品品牌）
+    :return: 包含目标品牌统计、价格带以及价格带内竞品统计矩阵的字典
+    """
+    codes = snap.codes['brand']
+    n = len(snap.categories['brand'])
+    price_ok = ~np.isnan(snap.price)
+    count = np.bincount(codes, minlength=n)
+    price_count = np.bincount(codes[price_ok], minlength=n)
+    price_sum = np.bincount(codes[price_ok], weights=snap.price[price_ok], minlength=n)
+    sales_ok = ~np.isnan(snap.sales)
+    total_sales = np.rint(np.bincount(codes[sales_ok], weights=snap.sales[sales_ok], minlength=n))
+    avg_price = np.divide(price_sum, price_count, out=np.zeros(n), where=price_count > 0)
+    low = avg_price * (1 - COMPETITIVE_BAND)
+    high = avg_price * (1 + COMPETITIVE_BAND)
+    band_count, band_price, band_sales = _band_stats(snap, low, high)
+    return {
+        'count': count,
+        'price_count': price_count,
+        'avg_price': avg_price,
+        'total_sales': total_sales,
+        'low': low,
+        'high': high,
+        'band_count': band_count,
+        'band_price': band_price,
+        'band_sales': np.rint(band_sales)
+    }
+
+
+def competitive_matrix(snap=None):
+    """返回快照对应的竞品矩阵（每个数据版本只计算一次）"""
+    snap = snap or get_snapshot()
+    return snap.derived('competitive_matrix', build_competitive_matrix)
+
+
+def _competitors(snap, target_code, avg_price, target_avg_sales, band_count, band_price, band_sales, price_count):
+    """从竞品矩阵的一行生成竞品列表（排除目标品牌自身和空品牌）"""
+    competitors = []
+    for code in np.flatnonzero(band_count):
+        brand = snap.categories['brand'][code]
+        if code == target_code or brand is None:
+            continue
+        count = int(band_count[code])
+        competitor_avg_price = round(float(band_price[code] / count), 2)
+        total_sales = int(band_sales[code])
+        competitor_avg_sales = total_sales / count
+        competitors.append({
+            'brand': brand,
+            'count': count,
+            'avg_price': competitor_avg_price,
+            'total_sales': total_sales,
+            # 价格差异百分比
+            'price_diff_percent': round((competitor_avg_price - avg_price) / avg_price * 100, 2) if avg_price > 0 else 0,
+            # 销量差异百分比
+            'sales_diff_percent': round((competitor_avg_sales - target_avg_sales) / target_avg_sales * 100, 2) if target_avg_sales > 0 else 0,
+            # 价格带重合度：竞品品牌有价格的商品中落在目标价格带内的比例
+            'overlap_percent': round(count / price_count[code] * 100, 2)
+        })
+    # 按销量排序竞品列表
+    competitors.sort(key=lambda x: x['total_sales'], reverse=True)
+    return competitors
+
 
 # 竞品分析功能
 def competitive_analysis(brand=None):
     """
-    对指定品牌的笔记本电脑进行竞品分析
+    对指定品牌的笔记本电脑进行竞品分析，结果直接从全品牌竞品矩阵中读取
     :param brand: 品牌名称，如果为None则分析所有品牌
     :return: 竞品分析结果
     """
     try:
-        # 基础查询
-        query = Laptop.query
+        snap = get_snapshot()
         
-        # 如果指定了品牌，则筛选该品牌的数据
+        # 如果指定了品牌，则从竞品矩阵中读取该品牌所在的行
         if brand:
-            target_brand_data = query.filter(Laptop.brand == brand).all()
-            # 获取该品牌的平均价格
-            avg_price = sum(laptop.price for laptop in target_brand_data) / len(target_brand_data) if target_brand_data else 0
-            # 获取价格相近的其他品牌产品（价格范围：目标品牌平均价格的±20%）
-            price_min = avg_price * 0.8
-            price_max = avg_price * 1.2
-            competitors = query.filter(Laptop.brand != brand, 
-                                      Laptop.price >= price_min, 
-                                      Laptop.price <= price_max).all()
+            matrix = competitive_matrix(snap)
+            code = snap.code_of('brand', brand)
+            if code is not None:
+                target_count = int(matrix['count'][code])
+                avg_price = float(matrix['avg_price'][code])
+                target_total_sales = int(matrix['total_sales'][code])
+                band_count = matrix['band_count'][code]
+                band_price = matrix['band_price'][code]
+                band_sales = matrix['band_sales'][code]
+            else:
+                # 不存在的品牌：没有目标商品，价格带退化为 [0, 0]
+                target_count, avg_price, target_total_sales = 0, 0.0, 0
+                band_count, band_price, band_sales = (row[0] for row in _band_stats(snap, [0.0], [0.0]))
+            target_avg_sales = target_total_sales / target_count if target_count > 0 else 0
             
-            # 计算竞品分析结果
-            total_market_sales = db.session.query(db.func.sum(Laptop.sales)).scalar() or 0
             result = {
                 'target_brand': brand,
-                'target_count': len(target_brand_data),
+                'target_count': target_count,
                 'target_avg_price': round(avg_price, 2),
-                'target_total_sales': sum(laptop.sales for laptop in target_brand_data),
-                'total_market_sales': total_market_sales,
-                'competitors': []
+                'target_total_sales': target_total_sales,
+                'total_market_sales': int(np.nansum(snap.sales)),
+                'competitors': _competitors(snap, code, avg_price, target_avg_sales,
+                                            band_count, band_price, band_sales, matrix['price_count'])
             }
             
-            # 按品牌分组竞品数据
-            competitor_brands = {}
-            for laptop in competitors:
-                if laptop.brand not in competitor_brands:
-                    competitor_brands[laptop.brand] = {
-                        'brand': laptop.brand,
-                        'count': 0,
-                        'total_price': 0,
-                        'total_sales': 0
-                    }
-                competitor_brands[laptop.brand]['count'] += 1
-                competitor_brands[laptop.brand]['total_price'] += laptop.price
-                competitor_brands[laptop.brand]['total_sales'] += laptop.sales
-            
-            # 计算平均价格并添加到结果中
-            for brand_name, data in competitor_brands.items():
-                data['avg_price'] = round(data['total_price'] / data['count'], 2)
-                # 计算价格差异百分比
-                data['price_diff_percent'] = round((data['avg_price'] - avg_price) / avg_price * 100, 2)
-                # 计算销量差异百分比
-                target_avg_sales = result['target_total_sales'] / result['target_count'] if result['target_count'] > 0 else 0
-                competitor_avg_sales = data['total_sales'] / data['count']
-                data['sales_diff_percent'] = round((competitor_avg_sales - target_avg_sales) / target_avg_sales * 100, 2) if target_avg_sales > 0 else 0
-                # 添加到结果列表
-                result['competitors'].append({
-                    'brand': brand_name,
-                    'count': data['count'],
-                    'avg_price': data['avg_price'],
-                    'total_sales': data['total_sales'],
-                    'price_diff_percent': data['price_diff_percent'],
-                    'sales_diff_percent': data['sales_diff_percent']
-                })
-            
-            # 按销量排序竞品列表
-            result['competitors'].sort(key=lambda x: x['total_sales'], reverse=True)
-            
             return {
                 'success': True,
                 'data': result
             }
         else:
             # 如果没有指定品牌，则返回所有品牌的基本信息
-            all_brands = db.session.query(Laptop.brand, 
-                                         db.func.count(Laptop.id).label('count'),
-                                         db.func.avg(Laptop.price).label('avg_price'),
-                                         db.func.sum(Laptop.sales).label('total_sales')
-                                        ).group_by(Laptop.brand).all()
-            
-            brands_data = [{
-                'brand': item.brand,
-                'count': item.count,
-                'avg_price': round(item.avg_price, 2),
-                'total_sales': item.total_sales
-            } for item in all_brands]
+            brands_data = snap.group_stats('brand')
+            for item in brands_data:
+                item['avg_price'] = round(item['avg_price'], 2)
             
             # 按销量排序
             brands_data.sort(key=lambda x: x['total_sales'], reverse=True)
@@ -111,68 +174,200 @@ def competitive_analysis(brand=None):
             'message': str(e)
         }
 
+
+def competitive_matrix_analysis():
+    """
+    全品牌竞品矩阵
+    :return: brands 为品牌列表；各矩阵的第i行第j列表示以品牌i为目标时品牌j在其价格带内的情况
+    """
+    try:
+        snap = get_snapshot()
+        matrix = competitive_matrix(snap)
+        codes = [c for c, b in enumerate(snap.categories['brand']) if b is not None]
+        idx = np.array(codes, dtype=np.int64)
+        count = matrix['band_count'][np.ix_(idx, idx)]
+        price_count = matrix['price_count'][idx]
+        avg_price = matrix['avg_price'][idx]
+        target_avg_sales = np.divide(matrix['total_sales'][idx], matrix['count'][idx],
+                                     out=np.zeros(len(idx)), where=matrix['count'][idx] > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            band_avg_price = matrix['band_price'][np.ix_(idx, idx)] / count
+            band_avg_sales = matrix['band_sales'][np.ix_(idx, idx)] / count
+            price_diff = np.where((count > 0) & (avg_price[:, None] > 0),
+                                  (np.round(band_avg_price, 2) - avg_price[:, None]) / avg_price[:, None] * 100, 0)
+            sales_diff = np.where((count > 0) & (target_avg_sales[:, None] > 0),
+                                  (band_avg_sales - target_avg_sales[:, None]) / target_avg_sales[:, None] * 100, 0)
+            overlap = np.where(price_count[None, :] > 0, count / price_count[None, :] * 100, 0)
+        # 对角线（品牌与自身）不作为竞品
+        np.fill_diagonal(count, 0)
+        for values in (price_diff, sales_diff, overlap):
+            np.fill_diagonal(values, 0)
+        return {
+            'success': True,
+            'data': {
+                'brands': [snap.categories['brand'][c] for c in codes],
+                'targets': [{
+                    'brand': snap.categories['brand'][c],
+                    'count': int(matrix['count'][c]),
+                    'avg_price': round(float(matrix['avg_price'][c]), 2),
+                    'total_sales': int(matrix['total_sales'][c]),
+                    'price_band': [round(float(matrix['low'][c]), 2), round(float(matrix['high'][c]), 2)]
+                } for c in codes],
+                'count': count.tolist(),
+                'overlap_percent': np.round(overlap, 2).tolist(),
+                'price_diff_percent': np.round(price_diff, 2).tolist(),
+                'sales_diff_percent': np.round(sales_diff, 2).tolist()
+            }
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'message': str(e)
+        }
+
+# 价格趋势预测参数：历史天数、季节性周期（天）、可预测的最长天数
+TREND_PAST_DAYS = 90
+TREND_SEASON_DAYS = 30
+TREND_MAX_DAYS = 365
+
+
+def _trend_noise(brand, ram, size, scale):
+    """按品牌和内存生成确定的噪声序列（使用稳定哈希，保证不同进程、不同时间结果一致）"""
+    seed = zlib.crc32(f'{brand}_{ram}'.encode('utf-8'))
+    return np.random.default_rng(seed).normal(0, scale, size)
+
+
+def fit_price_trends(keys, avg_prices, observed=None):
+    """
+    批量拟合价格趋势：所有组合的历史曲线组成一个矩阵，用同一个最小二乘解一次求出全部二次趋势系数
+    :param keys: (品牌, 内存) 组合列表
+    :param avg_prices: 各组合的当前平均价格
+    :param observed: 可选的真实历史日均价矩阵（每行 TREND_PAST_DAYS 天），整行有值的组合使用真实历史，否则使用模拟历史
+    :return: (历史价格矩阵, 预测价格矩阵, 是否为真实历史)，每行对应一个组合，预测矩阵覆盖 TREND_MAX_DAYS 天
+    """
+    avg_prices = np.asarray(avg_prices, dtype=np.float64)
+    t = np.arange(TREND_PAST_DAYS, dtype=np.float64)
+    future_t = np.arange(TREND_PAST_DAYS, TREND_PAST_DAYS + TREND_MAX_DAYS, dtype=np.float64)
+    trend = np.linspace(0.95, 1.0, TREND_PAST_DAYS)
+    seasonality = 0.08 * np.sin(2 * np.pi * t / TREND_SEASON_DAYS)
+    noise = np.array([_trend_noise(b, r, TREND_PAST_DAYS + TREND_MAX_DAYS, 1.0) for b, r in keys]).reshape(len(keys), -1)
+    historical = avg_prices[:, None] * (trend + seasonality + 0.04 * noise[:, :TREND_PAST_DAYS])
+    is_observed = np.zeros(len(keys), dtype=bool)
+    if observed is not None:
+        is_observed = ~np.isnan(observed).any(axis=1)
+        historical[is_observed] = observed[is_observed]
+    # 二次多项式的闭式最小二乘解：X @ beta ≈ historical.T
+    X = np.vander(t, 3, increasing=True)
+    beta = np.linalg.lstsq(X, historical.T, rcond=None)[0]
+    predicted = (np.vander(future_t, 3, increasing=True) @ beta).T
+    # 模拟历史的季节性沿历史周期延续，因此任意预测天数都是同一条曲线的前缀
+    future_seasonality = 0.08 * np.sin(2 * np.pi * future_t / TREND_SEASON_DAYS)
+    simulated = ~is_observed
+    predicted[simulated] *= 1 + future_seasonality + 0.06 * noise[simulated, TREND_PAST_DAYS:]
+    return historical, predicted, is_observed
+
+
+def build_price_trend_table(snap, today):
+    """
+    为全部品牌×内存组合（以及单品牌、单内存和全部商品）一次性计算预测曲线
+    价格历史表中截至 today 的最近 TREND_PAST_DAYS 天有记录的组合使用真实的日均价，其余组合使用模拟历史
+    :param today: 历史窗口的最后一天（pd.Timestamp）
+    :return: {'index': {(品牌, 内存): 行号}, 'avg_price', 'historical', 'predicted', 'observed'}
+    """
+    brand_codes, ram_codes = snap.codes['brand'], snap.codes['ram']
+    brands, rams = snap.categories['brand'], snap.categories['ram']
+    n_brand, n_ram = len(brands), len(rams)
+    ok = ~np.isnan(snap.price)
+    size = n_brand * n_ram
+    combo = brand_codes.astype(np.int64) * n_ram + ram_codes
+    count = np.bincount(combo[ok], minlength=size).reshape(n_brand, n_ram)
+    total = np.bincount(combo[ok], weights=snap.price[ok], minlength=size).reshape(n_brand, n_ram)
+    present = np.bincount(combo, minlength=size).reshape(n_brand, n_ram)
+    # 最近 TREND_PAST_DAYS 天每个组合的商品数与价格和
+    _, history_count, history_total, _, _ = rollup(snap, combo, size, 'day',
+                                                   start=today - pd.Timedelta(days=TREND_PAST_DAYS - 1), end=today)
+    history_count = history_count.reshape(n_brand, n_ram, -1)
+    history_total = history_total.reshape(n_brand, n_ram, -1)
+
+    selectors = [((brands[b], rams[r]), b, r) for b, r in zip(*np.nonzero(present))
+                 if brands[b] is not None and rams[r] is not None]
+    selectors += [((brand, None), b, slice(None)) for b, brand in enumerate(brands) if brand is not None]
+    selectors += [((None, ram), slice(None), r) for r, ram in enumerate(rams) if ram is not None]
+    selectors.append(((None, None), slice(None), slice(None)))
+    keys = [key for key, _, _ in selectors]
+    counts = np.array([count[b, r].sum() for _, b, r in selectors], dtype=np.float64)
+    totals = np.array([total[b, r].sum() for _, b, r in selectors], dtype=np.float64)
+    avg_prices = np.divide(totals, counts, out=np.zeros(len(keys)), where=counts > 0)
+    observed_count = np.array([history_count[b, r].reshape(-1, TREND_PAST_DAYS).sum(axis=0) for _, b, r in selectors])
+    observed_total = np.array([history_total[b, r].reshape(-1, TREND_PAST_DAYS).sum(axis=0) for _, b, r in selectors])
+    observed = np.divide(observed_total, observed_count, out=np.full(observed_total.shape, np.nan),
+                         where=observed_count > 0)
+    historical, predicted, is_observed = fit_price_trends(keys, avg_prices, observed)
+    return {
+        'index': {key: i for i, key in enumerate(keys)},
+        'avg_price': avg_prices,
+        'historical': historical,
+        'predicted': predicted,
+        'observed': is_observed
+    }
+
+
+def price_trend_table(snap=None, today=None):
+    """返回快照对应的价格趋势预测表（每个数据版本每天只计算一次）"""
+    snap = snap or get_snapshot()
+    today = pd.Timestamp(today or pd.Timestamp.now()).normalize()
+    return snap.derived(('price_trend', today), lambda s: build_price_trend_table(s, today))
+
+
 # 价格趋势预测功能
-def price_trend_prediction(brand=None, ram=None, days=30):
+def price_trend_prediction(brand=None, ram=None, days=30, today=None):
     """
-    预测未来价格趋势，增强波动性，生成置信区间，每次预测都不一样
+    预测未来价格趋势并给出置信区间，同一数据版本、同一天、相同参数的结果固定，可以缓存
     :param brand: 品牌名称
     :param ram: 内存大小
-    :param days: 预测天数
+    :param days: 预测天数（1 至 TREND_MAX_DAYS）
+    :param today: 预测起点日期（如 "2024-05-01"），默认为今天；缓存时应作为缓存键的一部分
     :return: 价格趋势预测结果
     """
     try:
-        # 用品牌、内存和当前时间混合生成随机种子
-        seed_str = f"{brand}_{ram}_{time.time()}"
-        seed = abs(hash(seed_str)) % (2**32 - 1)
-        np.random.seed(seed)
-        query = Laptop.query
-        if brand:
-            query = query.filter(Laptop.brand == brand)
-        if ram:
-            query = query.filter(Laptop.ram == ram)
-        current_avg_price = db.session.query(db.func.avg(Laptop.price)).filter(query.whereclause).scalar() or 0
-        past_days = 90
-        dates = pd.date_range(end=pd.Timestamp.now(), periods=past_days).tolist()
-        trend = np.linspace(0.95, 1.0, past_days)
-        seasonality = 0.08 * np.sin(np.linspace(0, 6*np.pi, past_days))
-        noise = np.random.normal(0, 0.04, past_days)
-        historical_prices = current_avg_price * (trend + seasonality + noise)
-        historical_data = pd.DataFrame({
-            'date': dates,
-            'price': historical_prices
-        })
-        historical_data['day_of_week'] = historical_data['date'].dt.dayofweek
-        historical_data['day_of_month'] = historical_data['date'].dt.day
-        historical_data['month'] = historical_data['date'].dt.month
-        historical_data['days_from_start'] = range(past_days)
-        X = historical_data[['days_from_start']].values
-        poly = PolynomialFeatures(degree=2)
-        X_poly = poly.fit_transform(X)
-        model = LinearRegression()
-        model.fit(X_poly, historical_data['price'])
-        future_dates = pd.date_range(start=pd.Timestamp.now(), periods=days+1)[1:].tolist()
-        future_days_from_start = range(past_days, past_days + days)
-        X_future = poly.transform(np.array(future_days_from_start).reshape(-1, 1))
-        predicted_prices = model.predict(X_future)
-        future_seasonality = 0.08 * np.sin(np.linspace(0, 6*np.pi, days))
-        future_noise = np.random.normal(0, 0.06, days)
-        predicted_prices = predicted_prices * (1 + future_seasonality + future_noise)
+        if not 1 <= days <= TREND_MAX_DAYS:
+            return {
+                'success': False,
+                'message': f'预测天数需在 1 到 {TREND_MAX_DAYS} 之间'
+            }
+        brand, ram = brand or None, ram or None
+        today = pd.Timestamp(today or pd.Timestamp.now()).normalize()
+        table = price_trend_table(today=today)
+        row = table['index'].get((brand, ram))
+        if row is not None:
+            current_avg_price = float(table['avg_price'][row])
+            historical_prices = table['historical'][row]
+            predicted_prices = table['predicted'][row, :days]
+            observed = bool(table['observed'][row])
+        else:
+            # 不存在的组合：没有商品，平均价格为0
+            current_avg_price = 0.0
+            historical, predicted, _ = fit_price_trends([(brand, ram)], [0.0])
+            historical_prices, predicted_prices = historical[0], predicted[0, :days]
+            observed = False
+        dates = pd.date_range(end=today, periods=TREND_PAST_DAYS)
+        future_dates = pd.date_range(start=today, periods=days + 1)[1:]
         lower = predicted_prices * 0.93
         upper = predicted_prices * 1.07
         prediction_data = {
             'historical': [{
                 'date': date.strftime('%Y-%m-%d'),
-                'price': round(price, 2)
+                'price': round(float(price), 2)
             } for date, price in zip(dates[-30:], historical_prices[-30:])],
             'prediction': [{
                 'date': date.strftime('%Y-%m-%d'),
-                'price': round(price, 2),
-                'lower': round(l, 2),
-                'upper': round(u, 2)
+                'price': round(float(price), 2),
+                'lower': round(float(l), 2),
+                'upper': round(float(u), 2)
             } for date, price, l, u in zip(future_dates, predicted_prices, lower, upper)]
         }
-        first_predicted_price = predicted_prices[0]
-        last_predicted_price = predicted_prices[-1]
+        first_predicted_price = float(predicted_prices[0])
+        last_predicted_price = float(predicted_prices[-1])
         price_change = last_predicted_price - first_predicted_price
         price_change_percent = (price_change / first_predicted_price) * 100 if first_predicted_price > 0 else 0
         trend_analysis = {
@@ -188,6 +383,8 @@ def price_trend_prediction(brand=None, ram=None, days=30):
                 'price_data': prediction_data,
                 'trend_analysis': trend_analysis,
                 'current_avg_price': round(current_avg_price, 2),
+                # observed: 历史价格来自价格历史表；simulated: 历史数据不足，使用模拟历史
+                'history_source': 'observed' if observed else 'simulated',
                 'filter': {
                     'brand': brand,
                     'ram': ram
@@ -200,89 +397,77 @@ def price_trend_prediction(brand=None, ram=None, days=30):
             'message': str(e)
         }
 
-# 用户评价情感分析（模拟功能）
+def build_sentiment_table(snap):
+    """
+    一次分组联表统计全部品牌的评论情感：按 (品牌, 情感标签) 分组计数、求平均得分并统计关注点关键词
+    :return: {(品牌, 标签): {'count', 'score_sum', 'keywords': {关键词: 次数}}}
+    """
+    keywords = ASPECT_KEYWORDS['positive'] + ASPECT_KEYWORDS['negative']
+    keyword_columns = [func.sum(case((Comment.content.contains(k, autoescape=True), 1), else_=0)) for k in keywords]
+    query = (select(Laptop.brand, Comment.sentiment_label, func.count(), func.sum(Comment.sentiment_score),
+                    *keyword_columns)
+             .select_from(Comment).join(Laptop, Laptop.id == Comment.laptop_id)
+             .where(Laptop.deleted_at.is_(None))
+             .group_by(Laptop.brand, Comment.sentiment_label))
+    table = {}
+    for row in db.session.execute(query):
+        table[(row[0], row[1])] = {
+            'count': int(row[2]),
+            'score_sum': float(row[3] or 0),
+            'keywords': {k: int(v or 0) for k, v in zip(keywords, row[4:])}
+        }
+    return table
+
+
+# 用户评价情感分析（基于评论的情感打分）
 def sentiment_analysis(brand=None):
     """
-    对用户评价进行情感分析（模拟功能）
+    对用户评价进行情感分析，评论的情感在导入时已计算并存入comments表
     :param brand: 品牌名称
     :return: 情感分析结果
-    
     """
     try:
-        # 构建查询条件
-        query = Laptop.query
-        if brand:
-            query = query.filter(Laptop.brand == brand)
-            
-        # 获取笔记本电脑数据
-        laptops = query.all()
-        laptop_count = len(laptops)
-        
-        if laptop_count == 0:
+        snap = get_snapshot()
+        if brand and snap.code_of('brand', brand) is None:
             return {
                 'success': False,
                 'message': '没有找到符合条件的数据'
             }
+        table = snap.derived('sentiment', build_sentiment_table)
         
-        # 模拟情感分析结果
-        # 在实际应用中，这部分应该从评论数据库中获取并进行NLP处理
-        np.random.seed(abs(hash(brand)) % (2**32 - 1) if brand else 42)  # 根据品牌设置随机种子，保证seed合法
-        
-        # 生成模拟的情感分析结果
-        positive_ratio = np.random.uniform(0.6, 0.9)  # 积极评价比例
-        neutral_ratio = np.random.uniform(0.05, 0.2)  # 中性评价比例
-        negative_ratio = 1 - positive_ratio - neutral_ratio  # 消极评价比例
-        
-        # 获取实际评价总数
-        # 首先获取该品牌所有笔记本的ID
-        laptop_ids = [laptop.id for laptop in laptops]
-        # 然后查询这些笔记本对应的评论数量
-        total_reviews = db.session.query(Comment).filter(Comment.laptop_id.in_(laptop_ids)).count()
-        positive_count = int(total_reviews * positive_ratio)
-        neutral_count = int(total_reviews * neutral_ratio)
-        negative_count = total_reviews - positive_count - neutral_count
+        # 汇总目标品牌（未指定时为全部品牌）各情感标签的评论数
+        counts = {label: 0 for label in LABELS}
+        keyword_counts = {}
+        unscored = 0
+        score_sum = 0.0
+        for (row_brand, label), item in table.items():
+            if brand and row_brand != brand:
+                continue
+            if label is None:
+                unscored += item['count']
+                continue
+            counts[label] += item['count']
+            score_sum += item['score_sum']
+            for keyword, count in item['keywords'].items():
+                keyword_counts[keyword] = keyword_counts.get(keyword, 0) + count
+        scored = sum(counts.values())
         
-        # 模拟常见评价关键词
-        positive_keywords = {
-            '性能好': np.random.randint(positive_count // 4, positive_count // 2),
-            '外观漂亮': np.random.randint(positive_count // 5, positive_count // 3),
-            '性价比高': np.random.randint(positive_count // 6, positive_count // 3),
-            '散热好': np.random.randint(positive_count // 8, positive_count // 4),
-            '屏幕清晰': np.random.randint(positive_count // 7, positive_count // 3)
-        }
-        
-        negative_keywords = {
-            '价格贵': np.random.randint(negative_count // 5, negative_count // 2),
-            '续航差': np.random.randint(negative_count // 6, negative_count // 3),
-            '散热差': np.random.randint(negative_count // 7, negative_count // 3),
-            '噪音大': np.random.randint(negative_count // 8, negative_count // 4),
-            '配置低': np.random.randint(negative_count // 9, negative_count // 4)
-        }
+        # 情感得分（0-100）：平均得分从 [-1, 1] 映射到 [0, 100]
+        sentiment_score = int(round((score_sum / scored + 1) * 50)) if scored else 0
         
-        # 计算情感得分（0-100）
-        sentiment_score = int(positive_ratio * 100)
-        
-        # 生成情感分析结果
         result = {
-            'total_reviews': total_reviews,
+            'total_reviews': scored + unscored,
+            'unscored_reviews': unscored,
             'sentiment_distribution': {
-                'positive': {
-                    'count': positive_count,
-                    'percentage': round(positive_ratio * 100, 2)
-                },
-                'neutral': {
-                    'count': neutral_count,
-                    'percentage': round(neutral_ratio * 100, 2)
-                },
-                'negative': {
-                    'count': negative_count,
-                    'percentage': round(negative_ratio * 100, 2)
-                }
+                label: {
+                    'count': counts[label],
+                    'percentage': round(counts[label] / scored * 100, 2) if scored else 0
+                } for label in LABELS
             },
             'sentiment_score': sentiment_score,
             'keywords': {
-                'positive': [{'keyword': k, 'count': v} for k, v in positive_keywords.items()],
-                'negative': [{'keyword': k, 'count': v} for k, v in negative_keywords.items()]
+                polarity: [{'keyword': k, 'count': keyword_counts.get(k, 0)} for k in words]
+                for polarity, words in ASPECT_KEYWORDS.items()
             },
             'filter': {
                 'brand': brand
@@ -299,70 +484,247 @@ def sentiment_analysis(brand=None):
             'message': str(e)
         }
 
-# 用户评价情感分析（基于实际数据）
-def sentiment_analysis(brand=None):
+def _parse_ram_value(ram):
+    """从RAM字段中提取数字（假设格式为"16GB"），无法解析时返回0"""
+    match = re.search(r'\d+', str(ram))
+    return int(match.group()) if match else 0
+
+# 聚类使用的特征列
+CLUSTER_FEATURES = ['price', 'sales', 'ram_value']
+
+
+def standardize(features):
     """
-    对用户评价进行情感分析（基于实际数据）
-    :param brand: 品牌名称
-    :return: 情感分析结果
+    按列做z-score标准化（标准差为0的列不缩放）
+    :return: (标准化后的矩阵, 均值, 标准差)
     """
-    try:
-        # 构建查询条件
-        query = Laptop.query
-        if brand:
-            query = query.filter(Laptop.brand == brand)
+    mean = features.mean(axis=0)
+    std = features.std(axis=0, ddof=1)
+    std[~(std > 0)] = 1.0
+    return (features - mean) / std, mean, std
+
+
+def stratified_sample(strata, size, seed=42):
+    """
+    按分层编码等比例抽样，每个非空分层至少抽取一个样本
+    :param strata: 每行的分层编码（非负整数）
+    :param size: 目标样本量
+    :return: 抽中行的下标数组
+    """
+    n = len(strata)
+    if n <= size:
+        return np.arange(n)
+    strata = np.where(strata < 0, strata.max() + 1, strata)
+    rng = np.random.default_rng(seed)
+    perm = rng.permutation(n)
+    perm = perm[np.argsort(strata[perm], kind='stable')]
+    grouped = strata[perm]
+    counts = np.bincount(grouped)
+    quota = np.where(counts > 0, np.maximum(1, np.round(counts * size / n)), 0).astype(np.int64)
+    starts = np.cumsum(counts) - counts
+    rank = np.arange(n) - starts[grouped]
+    return np.sort(perm[rank < quota[grouped]])
+
+
+def _fit_kmeans(X, k, sample_idx, scalable):
+    """拟合一个k值的聚类模型，返回 (模型, 轮廓系数)"""
+    if scalable:
+        model = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=4096, n_init=3)
+    else:
+        model = KMeans(n_clusters=k, random_state=42)
+    labels = model.fit_predict(X)
+    if sample_idx is None:
+        score = silhouette_score(X, labels)
+    else:
+        score = silhouette_score(X[sample_idx], labels[sample_idx])
+    return model, float(score)
+
+
+def resolve_cluster_mode(n_rows, mode='auto', sample_size=None):
+    """
+    确定实际使用的聚类模式与轮廓系数样本量（样本量不超过 CLUSTER_SAMPLE_SIZE）
+    :param n_rows: 参与聚类的行数
+    :return: (full 或 scalable, 样本量；full 模式为None)
+    """
+    if mode == 'auto':
+        mode = 'scalable' if n_rows > current_app.config.get('CLUSTER_FULL_MAX_ROWS', 20000) else 'full'
+    if mode == 'full':
+        return mode, None
+    limit = current_app.config.get('CLUSTER_SAMPLE_SIZE', 10000)
+    return mode, min(sample_size, limit) if sample_size and sample_size > 0 else limit
+
+
+def _cluster_model_dir():
+    """聚类模型目录，默认位于应用实例目录下（只对应用所属用户可写）"""
+    path = current_app.config.get('CLUSTER_MODEL_DIR') or os.path.join(current_app.instance_path, 'cluster_models')
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
 
-        # 获取笔记本电脑数据
-        laptops = query.all()
-        laptop_count = len(laptops)
+def _cluster_model_path(mode, sample_size):
+    """模型文件名只包含聚类模式和样本量：数据更新后仍使用最近一次拟合的模型分配聚类，直到重新进行聚类分析"""
+    tag = mode if sample_size is None else f'{mode}{sample_size}'
+    return os.path.join(_cluster_model_dir(), f'laptop_cluster_{tag}.joblib')
 
-        if laptop_count == 0:
+
+def save_cluster_model(model, mean, std, version, mode, sample_size):
+    """
+    持久化聚类模型及标准化参数，供新数据直接分配聚类（覆盖相同模式和样本量的旧模型）
+    :param version: 拟合时的数据版本，随模型一起保存
+    """
+    path = _cluster_model_path(mode, sample_size)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    joblib.dump({'model': model, 'mean': mean, 'std': std, 'features': CLUSTER_FEATURES, 'version': version},
+                tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _cluster_rows(snap):
+    """参与聚类的快照行：价格大于0且销量不为空"""
+    with np.errstate(invalid='ignore'):
+        return (snap.price > 0) & ~np.isnan(snap.sales)
+
+
+def cluster_features(laptop_ids):
+    """
+    直接从jd表读取指定笔记本的聚类特征（不依赖快照，新写入的行也能读到）
+    :return: (找到的笔记本ID数组, 特征矩阵；缺少价格或销量的行为NaN)
+    """
+    ids, features = [], []
+    for laptop_id, price, sales, ram in db.session.execute(
+            select(Laptop.id, Laptop.price, Laptop.sales, Laptop.ram)
+            .where(Laptop.id.in_(list(laptop_ids)), Laptop.deleted_at.is_(None))):
+        ids.append(laptop_id)
+        features.append([np.nan if price is None else price, np.nan if sales is None else sales,
+                         _parse_ram_value(ram)])
+    return np.array(ids, dtype=np.int64), np.array(features, dtype=np.float64).reshape(-1, len(CLUSTER_FEATURES))
+
+
+def assign_clusters(laptop_ids, mode='auto', sample_size=None):
+    """
+    使用已持久化的聚类模型为指定笔记本分配聚类，无需重新拟合（聚类分析之后新增的笔记本同样可以分配）
+    :param laptop_ids: 笔记本ID列表
+    :param mode: 与聚类分析接口相同的聚类模式，使用相同参数的聚类结果对应的模型
+    :param sample_size: 与聚类分析接口相同的样本量
+    :return: 分配结果，model_version 为模型拟合时的数据版本
+    """
+    try:
+        if mode not in ('auto', 'full', 'scalable'):
             return {
                 'success': False,
-                'message': '没有找到符合条件的数据'
+                'message': f'不支持的聚类模式: {mode}'
             }
+        # 只有 auto 模式需要按行数选择模式
+        n_rows = int(_cluster_rows(get_snapshot()).sum()) if mode == 'auto' else 0
+        mode, sample_size = resolve_cluster_mode(n_rows, mode, sample_size)
+        path = _cluster_model_path(mode, sample_size)
+        if not os.path.exists(path):
+            return {
+                'success': False,
+                'message': '尚未生成聚类模型，请先进行聚类分析'
+            }
+        saved = joblib.load(path)
+        ids, features = cluster_features(laptop_ids)
+        valid = ~np.isnan(features).any(axis=1)
+        labels = np.full(len(ids), -1)
+        if valid.any():
+            labels[valid] = saved['model'].predict((features[valid] - saved['mean']) / saved['std'])
+        assigned = dict(zip(ids.tolist(), labels.tolist()))
+        return {
+            'success': True,
+            'model_version': saved.get('version'),
+            'data': [{'laptop_id': int(i), 'cluster_id': assigned.get(int(i))} for i in laptop_ids]
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'message': str(e)
+        }
 
-        # 获取实际评价总数
-        laptop_ids = [laptop.id for laptop in laptops]
-        total_reviews = db.session.query(Comment).filter(Comment.laptop_id.in_(laptop_ids)).count()
+# CPU档次：按refine_data.py中的CPU分类划分，数值越大性能越高；未识别的CPU按平均档次处理
+CPU_TIERS = {
+    'Intel N系列': 1, 'Intel J系列': 1, 'Intel 赛扬': 1, 'Intel 奔腾': 1, 'AMD 速龙': 1,
+    'Intel i3': 2, 'Ryzen 3': 2,
+    'Intel i5': 3, 'Ryzen 5': 3, 'AMD 锐龙': 3, 'Intel 其他': 3, 'AMD 其他': 3, 'M1': 3,
+    'Intel i7': 4, 'Ryzen 7': 4, 'M2': 4,
+    'Intel i9': 5, 'Ryzen 9': 5, 'Intel 至强': 5, 'M3': 5
+}
 
-        # 使用NLP库进行情感分析
-        # 假设我们有一个函数`perform_sentiment_analysis`来处理评论文本并返回情感结果
-        sentiment_results = perform_sentiment_analysis(laptop_ids)
+# 相似度使用的特征列
+SIMILARITY_FEATURES = ['price', 'ram_gb', 'cpu_tier', 'sales', 'rating']
 
-        positive_count = sentiment_results['positive']
-        neutral_count = sentiment_results['neutral']
-        negative_count = sentiment_results['negative']
+# 单次查询允许返回的最大相似商品数
+SIMILAR_MAX_K = 50
 
-        # 计算情感得分（0-100）
-        sentiment_score = int((positive_count / total_reviews) * 100)
 
-        # 生成情感分析结果
-        result = {
-            'total_reviews': total_reviews,
-            'sentiment_distribution': {
-                'positive': {
-                    'count': positive_count,
-                    'percentage': round((positive_count / total_reviews) * 100, 2)
-                },
-                'neutral': {
-                    'count': neutral_count,
-                    'percentage': round((neutral_count / total_reviews) * 100, 2)
-                },
-                'negative': {
-                    'count': negative_count,
-                    'percentage': round((negative_count / total_reviews) * 100, 2)
-                }
-            },
-            'sentiment_score': sentiment_score,
-            'filter': {
-                'brand': brand
-            }
-        }
+def build_similarity_index(snap):
+    """
+    在标准化特征上构建KD树：价格为空或不大于0的商品不参与；其余特征的空值按该列均值填充（标准化后为0）
+    :return: {'rows': 参与索引的快照行号, 'features': 标准化特征, 'tree': KDTree}
+    """
+    cpu_lookup = np.array([CPU_TIERS.get(c, np.nan) for c in snap.categories['cpu']] + [np.nan])
+    ram_lookup = np.array([_parse_ram_value(x) or np.nan for x in snap.categories['ram']], dtype=np.float64)
+    # ram_gb 为空时退回从RAM字段解析
+    ram_gb = np.where(np.isnan(snap.ram_gb), ram_lookup[snap.codes['ram']], snap.ram_gb)
+    with np.errstate(invalid='ignore'):
+        rows = np.flatnonzero(snap.price > 0)
+    features = np.column_stack([snap.price[rows], ram_gb[rows], cpu_lookup[snap.codes['cpu'][rows]],
+                                snap.sales[rows], snap.rating[rows]])
+    if len(rows):
+        ok = ~np.isnan(features)
+        fill = np.where(ok, features, 0.0).sum(axis=0) / np.maximum(ok.sum(axis=0), 1)
+        features = standardize(np.where(ok, features, fill))[0]
+    return {'rows': rows, 'features': features, 'tree': KDTree(features) if len(rows) else None}
+
+
+def similarity_index(snap=None):
+    """返回当前数据版本的相似度索引（每个快照只构建一次）"""
+    snap = snap or get_snapshot()
+    return snap.derived('similarity_index', build_similarity_index)
 
+
+def similar_laptops(laptop_ids, k=5):
+    """
+    按标准化后的价格、内存、CPU档次、销量和评分查找最相似的商品
+    :param laptop_ids: 笔记本ID列表，支持批量查询
+    :param k: 每个商品返回的相似商品数
+    :return: 每个ID的相似商品列表（按距离升序）；不存在或价格无效的ID返回None
+    """
+    try:
+        if not 1 <= k <= SIMILAR_MAX_K:
+            return {
+                'success': False,
+                'message': f'k 的取值范围为 1-{SIMILAR_MAX_K}'
+            }
+        snap = get_snapshot()
+        index = similarity_index(snap)
+        rows = index['rows']
+        pos = snap.positions(laptop_ids)
+        # 快照行号 -> 索引中的位置
+        slot = np.searchsorted(rows, pos)
+        found = (pos >= 0) & (slot < len(rows))
+        found[found] = rows[slot[found]] == pos[found]
+        neighbours = {}
+        if found.any():
+            # 多取一个以排除自身
+            n = min(k + 1, len(rows))
+            distances, indices = index['tree'].query(index['features'][slot[found]], k=n)
+            for query_slot, dist, idx in zip(slot[found], distances, indices):
+                keep = idx != query_slot
+                neighbours[int(query_slot)] = (rows[idx[keep]][:k], dist[keep][:k])
+        data = []
+        for laptop_id, query_slot, ok in zip(laptop_ids, slot, found):
+            if not ok:
+                data.append({'laptop_id': int(laptop_id), 'similar': None})
+                continue
+            neighbour_rows, dist = neighbours[int(query_slot)]
+            records = snap.records(mask=neighbour_rows)
+            for record, d in zip(records, dist):
+                record['distance'] = round(float(d), 4)
+            data.append({'laptop_id': int(laptop_id), 'similar': records})
         return {
             'success': True,
-            'data': result
+            'data': data
         }
     except Exception as e:
         return {
@@ -371,19 +733,23 @@ def sentiment_analysis(brand=None):
         }
 
 # 笔记本电脑聚类分析
-def laptop_clustering():
+def laptop_clustering(mode='auto', sample_size=None):
     """
     对笔记本电脑进行聚类分析，找出市场细分
+    :param mode: full 全量KMeans并在全部数据上计算轮廓系数；scalable 使用MiniBatchKMeans、
+                 分层抽样估计轮廓系数并行扫描k；auto 按数据量自动选择
+    :param sample_size: scalable 模式下估计轮廓系数的样本量（不超过 CLUSTER_SAMPLE_SIZE）
     :return: 聚类分析结果
     """
     try:
-        # 获取所有笔记本电脑数据
-        laptops = Laptop.query.all()
-        laptop_dicts = [laptop.to_dict() for laptop in laptops]
-        df = pd.DataFrame(laptop_dicts)
-        
-        # 只保留有效数据
-        df = df[(df['price'].notnull()) & (df['price'] > 0) & (df['sales'].notnull())]
+        if mode not in ('auto', 'full', 'scalable'):
+            return {
+                'success': False,
+                'message': f'不支持的聚类模式: {mode}'
+            }
+        # 从列式快照获取所需列，只保留有效数据
+        snap = get_snapshot()
+        df = snap.to_frame(['id', 'price', 'sales', 'ram', 'brand'], mask=_cluster_rows(snap))
         
         if len(df) < 10:
             return {
@@ -393,29 +759,36 @@ def laptop_clustering():
         
         # 提取数值特征
         # 从RAM字段中提取数字（假设格式为"16GB"）
-        df['ram_value'] = df['ram'].apply(lambda x: int(re.search(r'\d+', str(x)).group()) if pd.notnull(x) and re.search(r'\d+', str(x)) else 0)
+        # 只对字典中的每个取值解析一次，再按编码展开（缺失值对应末尾的0）
+        ram_lookup = np.array([_parse_ram_value(x) for x in df['ram'].cat.categories] + [0])
+        df['ram_value'] = ram_lookup[df['ram'].cat.codes.to_numpy()]
         
         # 准备聚类特征
-        features = df[['price', 'sales', 'ram_value']].copy()
+        features = df[CLUSTER_FEATURES].to_numpy(dtype=np.float64)
         
         # 标准化特征
-        features_scaled = (features - features.mean()) / features.std()
+        features_scaled, mean, std = standardize(features)
+        
+        mode, sample_size = resolve_cluster_mode(len(df), mode, sample_size)
         
         # 确定最佳聚类数
-        silhouette_scores = []
         K_range = range(2, 6)
-        for k in K_range:
-            kmeans = KMeans(n_clusters=k, random_state=42)
-            cluster_labels = kmeans.fit_predict(features_scaled)
-            silhouette_avg = silhouette_score(features_scaled, cluster_labels)
-            silhouette_scores.append(silhouette_avg)
-        
-        # 选择最佳聚类数
-        best_k = K_range[silhouette_scores.index(max(silhouette_scores))]
+        if mode == 'full':
+            sample_idx = None
+            fits = [_fit_kmeans(features_scaled, k, None, scalable=False) for k in K_range]
+        else:
+            # 轮廓系数为O(n²)，只在按品牌分层抽取的样本上估计；各k值并行拟合
+            sample_idx = stratified_sample(df['brand'].cat.codes.to_numpy(), sample_size)
+            fits = Parallel(n_jobs=current_app.config.get('CLUSTER_N_JOBS', -1))(
+                delayed(_fit_kmeans)(features_scaled, k, sample_idx, True) for k in K_range)
+        silhouette_scores = [score for _, score in fits]
         
-        # 使用最佳聚类数进行聚类
-        kmeans = KMeans(n_clusters=best_k, random_state=42)
-        df['cluster'] = kmeans.fit_predict(features_scaled)
+        # 选择最佳聚类数，直接复用该k值已拟合的模型
+        best = silhouette_scores.index(max(silhouette_scores))
+        best_k = K_range[best]
+        kmeans = fits[best][0]
+        df['cluster'] = kmeans.labels_
+        save_cluster_model(kmeans, mean, std, snap.version, mode, sample_size)
         
         # 分析每个聚类
         cluster_analysis = []
@@ -434,7 +807,7 @@ def laptop_clustering():
                     'min': round(cluster_df['price'].min(), 2),
                     'max': round(cluster_df['price'].max(), 2)
                 },
-                'top_brands': cluster_df['brand'].value_counts().head(3).to_dict()
+                'top_brands': cluster_df['brand'].value_counts().loc[lambda c: c > 0].head(3).to_dict()
             }
             
             # 确定聚类特点
@@ -462,7 +835,9 @@ def laptop_clustering():
             'data': {
                 'clusters': cluster_analysis,
                 'best_k': best_k,
-                'silhouette_scores': dict(zip([str(k) for k in K_range], silhouette_scores))
+                'silhouette_scores': dict(zip([str(k) for k in K_range], silhouette_scores)),
+                'mode': mode,
+                'sample_size': len(df) if sample_idx is None else int(len(sample_idx))
             }
         }
     except Exception as e:
@@ -1,7 +1,10 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, flash
+from flask import Flask, render_template, jsonify, request, redirect, url_for, flash, Response, stream_with_context
 import os
+import io
 import time
-from functools import wraps
+import datetime
+import csv
+import json
 import numpy as np
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import train_test_split
@@ -14,13 +17,33 @@ import click
 # 导入配置和模型
 from config import Config
 from models import db, Laptop, User, Comment
-from sqlalchemy import text
+from sqlalchemy import text, select
+from sqlalchemy.exc import SQLAlchemyError
 
 # 导入表单
 from forms import LoginForm, RegistrationForm
 
 # 导入高级分析功能
-from advanced_analysis import competitive_analysis, price_trend_prediction, sentiment_analysis, laptop_clustering
+from advanced_analysis import competitive_analysis, competitive_matrix_analysis, price_trend_prediction, sentiment_analysis, laptop_clustering, assign_clusters, similar_laptops
+
+# 导入列式快照
+from snapshot import get_snapshot, invalidate_snapshot
+from cache import create_cache
+from jobs import jobs, JobQueueFull
+from versioning import current_data_version, bump_data_version
+from bucketing import parse_edges
+from history import history_series, record_history
+from sentiment import ensure_sentiment_columns, rescore_comments
+from search import search, sync_search_index, SEARCH_KINDS
+from facets import facet_counts
+from bulk_import import ensure_delta_columns
+from pivot import pivot, parse_dimensions, parse_measures
+from quantiles import price_distribution, update_price_sketches, DEFAULT_PERCENTILES, DEFAULT_BINS
+from dashboard import (overview_stats_data, brand_analysis_data, ram_analysis_data, cpu_analysis_data,
+                       price_range_analysis_data, sales_analysis_data, price_sales_correlation_data, build_dashboard)
+from pagination import keyset_page, decode_cursor, parse_sort, sort_order, count_total
+from projection import (parse_fields, rows_to_dicts, laptop_select, comment_select,
+                        LAPTOP_FIELDS, LAPTOP_DEFAULT_FIELDS, COMMENT_FIELDS)
 
 # 创建应用实例
 app = Flask(__name__, static_folder='static', template_folder='templates')
@@ -29,6 +52,22 @@ app.config.from_object(Config)
 # 初始化数据库
 db.init_app(app)
 
+
+def ensure_schema():
+    """创建缺少的表，并为旧库补充新增的列（create_all 不会修改已存在的表）"""
+    db.create_all()
+    ensure_delta_columns()
+    ensure_sentiment_columns()
+
+
+# 创建应用时检查表结构，flask run / WSGI 部署下旧库同样会补充新增的列；数据库不可用时不影响应用启动
+with app.app_context():
+    try:
+        ensure_schema()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        print(f"数据库表结构检查失败: {e}")
+
 # 初始化登录管理器
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -41,29 +80,48 @@ def load_user(user_id):
     """加载用户的回调函数"""
     return db.session.get(User, int(user_id))
 
-_cache_store = {}
-def ttl_cache(seconds):
-    def deco(fn):
-        @wraps(fn)
-        def wrapper(*args, **kwargs):
-            key = (fn.__name__, request.query_string.decode())
-            now = time.time()
-            entry = _cache_store.get(key)
-            if entry and entry[1] > now:
-                return entry[0]
-            rv = fn(*args, **kwargs)
-            _cache_store[key] = (rv, now + seconds)
-            return rv
-        return wrapper
-    return deco
+# 接口响应缓存（有容量上限，过期后短时间内返回旧值并由单个请求重算；后端由 CACHE_BACKEND 配置）
+# 缓存键包含数据版本号，数据导入后立即失效，因此有效期可以很长
+response_cache = create_cache(app.config, version=current_data_version, instance_path=app.instance_path)
+CACHE_TTL = app.config.get('CACHE_TTL', 86400)
+
+# 高级分析结果按参数和数据版本缓存，失败的结果不缓存
+_analysis_cache = response_cache.memoize(CACHE_TTL, cache_if=lambda rv: rv.get('success'))
+cached_competitive_analysis = _analysis_cache(competitive_analysis)
+cached_sentiment_analysis = _analysis_cache(sentiment_analysis)
+cached_laptop_clustering = _analysis_cache(laptop_clustering)
+cached_price_trend_prediction = _analysis_cache(price_trend_prediction)
+ttl_cache = response_cache.cached
+
+# 后台任务：耗时分析在进程池中执行，任务状态保存在共享缓存后端中，任一工作进程都可查询
+jobs.init_app(app, store=response_cache.backend, version=current_data_version)
+# 排队上限按工作进程计算（见 Config.JOB_MAX_PENDING）
+job_limits = app.config.get('JOB_MAX_PENDING', {})
+jobs.register('laptop_clustering', cached_laptop_clustering, {'mode': str, 'sample_size': int},
+              max_pending=job_limits.get('laptop_clustering', 2))
+jobs.register('price_trend_prediction', price_trend_prediction, {'brand': str, 'ram': str, 'days': int},
+              max_pending=job_limits.get('price_trend_prediction', 8))
+jobs.register('competitive_matrix', competitive_matrix_analysis,
+              max_pending=job_limits.get('competitive_matrix', 2))
+
+# 导出的列与每批读取的行数
+EXPORT_COLUMNS = ['id', 'original_id', 'name', 'price', 'shop', 'brand', 'ram', 'cpu', 'sales', 'rating']
+EXPORT_BATCH_SIZE = 1000
+
+# 游标分页允许的排序字段与单页上限
+DATA_SORT_KEYS = ('id', 'price', 'sales', 'rating', 'ram_gb')
+MAX_PAGE_SIZE = 500
 
 # 加载数据函数 - 从数据库加载数据
-def load_data():
-    """从数据库加载笔记本电脑数据"""
+def load_data(fields=None):
+    """
+    从数据库加载笔记本电脑数据
+    :param fields: 可选的字段列表，只输出这些列
+    """
     try:
-        laptops = Laptop.query.all()
-        print(f"查到数据条数: {len(laptops)}")
-        return [laptop.to_dict() for laptop in laptops]
+        snap = get_snapshot()
+        print(f"查到数据条数: {snap.size}")
+        return snap.records(fields=fields)
     except Exception as e:
         print(f"加载数据错误: {e}")
         return []
@@ -126,82 +184,122 @@ def logout():
 def index():
     return render_template('index.html')
 
+def laptop_filter_args():
+    """读取 /api/data 系列接口共用的筛选参数"""
+    return {
+        'brand': request.args.get('brand') or None,
+        'cpu': request.args.get('cpu') or None,
+        'ram_gb_min': request.args.get('ram_gb_min', type=int),
+        'ram_gb_max': request.args.get('ram_gb_max', type=int),
+        'price_min': request.args.get('price_min', type=float),
+        'price_max': request.args.get('price_max', type=float)
+    }
+
+def laptop_conditions(filters):
+    """将筛选参数转换为SQL条件列表（已软删除的商品不返回）"""
+    conditions = [Laptop.deleted_at.is_(None)]
+    if filters['brand']:
+        conditions.append(Laptop.brand == filters['brand'])
+    if filters['cpu']:
+        conditions.append(Laptop.cpu == filters['cpu'])
+    if filters['ram_gb_min'] is not None:
+        conditions.append(Laptop.ram_gb >= filters['ram_gb_min'])
+    if filters['ram_gb_max'] is not None:
+        conditions.append(Laptop.ram_gb <= filters['ram_gb_max'])
+    if filters['price_min'] is not None:
+        conditions.append(Laptop.price >= filters['price_min'])
+    if filters['price_max'] is not None:
+        conditions.append(Laptop.price <= filters['price_max'])
+    return conditions
+
 # 数据API
 @app.route('/api/data')
 @login_required
 def get_data():
     page = request.args.get('page', type=int)
     page_size = request.args.get('page_size', type=int)
-    brand = request.args.get('brand')
-    cpu = request.args.get('cpu')
-    ram_gb_min = request.args.get('ram_gb_min', type=int)
-    ram_gb_max = request.args.get('ram_gb_max', type=int)
-    price_min = request.args.get('price_min', type=float)
-    price_max = request.args.get('price_max', type=float)
-    q = db.session.query(Laptop)
-    if brand:
-        q = q.filter(Laptop.brand == brand)
-    if cpu:
-        q = q.filter(Laptop.cpu == cpu)
-    if ram_gb_min is not None:
-        q = q.filter(Laptop.ram_gb >= ram_gb_min)
-    if ram_gb_max is not None:
-        q = q.filter(Laptop.ram_gb <= ram_gb_max)
-    if price_min is not None:
-        q = q.filter(Laptop.price >= price_min)
-    if price_max is not None:
-        q = q.filter(Laptop.price <= price_max)
-    total = q.count()
+    filters = laptop_filter_args()
+    total_mode = request.args.get('total', 'exact')
+    cursor = request.args.get('cursor')
+    try:
+        # 按 fields 参数只查询需要的列，结果元组直接转换为JSON，不构造ORM实体
+        fields = parse_fields(request.args.get('fields'), LAPTOP_FIELDS, LAPTOP_DEFAULT_FIELDS)
+        sort, descending = parse_sort(request.args.get('sort'), DATA_SORT_KEYS, 'id')
+        q = laptop_select(fields, extra=('id', sort) if cursor is not None else ()).where(*laptop_conditions(filters))
+        sort_column = getattr(Laptop, sort)
+        total = count_total(q, total_mode, ('jd',) + tuple(sorted(filters.items())), table_name='jd',
+                            filtered=any(v is not None for v in filters.values()))
+        # 传入 cursor 参数（第一页为空字符串）时使用游标分页
+        if cursor is not None:
+            limit = min(page_size or 20, MAX_PAGE_SIZE)
+            sort_param = ('-' if descending else '') + sort
+            items, next_cursor = keyset_page(q, sort_column, Laptop.id, decode_cursor(cursor, sort_param, sort_column),
+                                             limit, descending=descending, sort=sort_param)
+            data = rows_to_dicts(items, fields)
+            return jsonify({'success': True, 'data': data, 'total': total, 'page_size': limit, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    # 偏移分页同样按 (排序键, id) 排序，保证每页内容确定
+    q = q.order_by(*sort_order(sort_column, Laptop.id, descending))
     if page and page_size:
-        items = q.offset((page - 1) * page_size).limit(page_size).all()
-    else:
-        items = q.all()
-    data = [l.to_dict() for l in items]
+        q = q.offset((page - 1) * page_size).limit(page_size)
+    data = rows_to_dicts(db.session.execute(q), fields)
     return jsonify({'success': True, 'data': data, 'total': total, 'page': page, 'page_size': page_size})
 
+# 数据导出API：按 /api/data 的筛选条件流式输出 NDJSON 或 CSV
+@app.route('/api/export')
+@login_required
+def export_data():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'success': False, 'message': f'不支持的导出格式: {fmt}'}), 400
+    stmt = select(*[getattr(Laptop, c) for c in EXPORT_COLUMNS]) \
+        .where(*laptop_conditions(laptop_filter_args())).order_by(Laptop.id)
+
+    def generate():
+        # yield_per 启用服务端游标，分批取数并逐批输出，内存占用与结果集大小无关
+        result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        if fmt == 'csv':
+            yield '\ufeff' + ','.join(EXPORT_COLUMNS) + '\n'
+        for part in result.partitions():
+            buf = io.StringIO()
+            if fmt == 'csv':
+                csv.writer(buf, lineterminator='\n').writerows(part)
+            else:
+                for row in part:
+                    buf.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+                    buf.write('\n')
+            yield buf.getvalue()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=laptops.{fmt}'})
+
 # 总览统计API
 @app.route('/api/overview_stats')
 @login_required
-@ttl_cache(300)
+@ttl_cache(CACHE_TTL)
 def overview_stats():
     try:
-        total_products = db.session.query(db.func.count(Laptop.id)).scalar() or 0
-        avg_price = db.session.query(db.func.avg(Laptop.price)).scalar() or 0
-        total_sales = db.session.query(db.func.sum(Laptop.sales)).scalar() or 0
-        total_brands = db.session.query(db.func.count(db.func.distinct(Laptop.brand))).scalar() or 0
-        return jsonify({'success': True, 'data': {
-            'total_products': int(total_products),
-            'avg_price': float(avg_price),
-            'total_sales': int(total_sales),
-            'total_brands': int(total_brands)
-        }})
+        return jsonify({
+            'success': True,
+            'data': overview_stats_data(get_snapshot())
+        })
     except Exception as e:
-        return jsonify({'success': False, 'message': str(e)})
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        })
 
 # 品牌分析API
 @app.route('/api/brand_analysis')
 @login_required
-@ttl_cache(300)
+@ttl_cache(CACHE_TTL)
 def brand_analysis():
     try:
-        # 使用SQLAlchemy进行分组查询
-        brand_stats = db.session.query(
-            Laptop.brand,
-            db.func.count(Laptop.id).label('count'),
-            db.func.avg(Laptop.price).label('avg_price'),
-            db.func.sum(Laptop.sales).label('total_sales')
-        ).group_by(Laptop.brand).all()
-        
-        result = [{
-            'brand': item.brand,
-            'count': item.count,
-            'avg_price': round(item.avg_price, 2),
-            'total_sales': item.total_sales
-        } for item in brand_stats]
-        
         return jsonify({
             'success': True,
-            'data': result
+            'data': brand_analysis_data(get_snapshot())
         })
     except Exception as e:
         return jsonify({
@@ -212,48 +310,12 @@ def brand_analysis():
 # 内存分析API
 @app.route('/api/ram_analysis')
 @login_required
-@ttl_cache(300)
+@ttl_cache(CACHE_TTL, params=('edges',))
 def ram_analysis():
     try:
-        ram_stats = db.session.query(
-            Laptop.ram_gb,
-            db.func.count(Laptop.id).label('count'),
-            db.func.avg(Laptop.price).label('avg_price'),
-            db.func.sum(Laptop.sales).label('total_sales')
-        ).filter(Laptop.ram_gb.isnot(None)).group_by(Laptop.ram_gb).all()
-        standardized_data = {}
-        for item in ram_stats:
-            size = int(item.ram_gb)
-            if size <= 4:
-                ram_key = "4GB"
-            elif size <= 8:
-                ram_key = "8GB"
-            elif size <= 16:
-                ram_key = "16GB"
-            elif size <= 32:
-                ram_key = "32GB"
-            elif size <= 64:
-                ram_key = "64GB"
-            else:
-                ram_key = "128GB+"
-            if ram_key in standardized_data:
-                standardized_data[ram_key]['count'] += item.count
-                standardized_data[ram_key]['total_price'] += item.avg_price * item.count
-                standardized_data[ram_key]['total_sales'] += item.total_sales
-            else:
-                standardized_data[ram_key] = {'count': item.count, 'total_price': item.avg_price * item.count, 'total_sales': item.total_sales}
-        result = [{
-            'ram': k,
-            'count': v['count'],
-            'avg_price': round(v['total_price'] / v['count'], 2) if v['count'] > 0 else 0,
-            'total_sales': v['total_sales']
-        } for k, v in standardized_data.items()]
-        ram_order = {"4GB": 1, "8GB": 2, "16GB": 3, "32GB": 4, "64GB": 5, "128GB+": 6}
-        result.sort(key=lambda x: ram_order.get(x['ram'], 999))
-        
         return jsonify({
             'success': True,
-            'data': result
+            'data': ram_analysis_data(get_snapshot(), edges=parse_edges(request.args.get('edges')))
         })
     except Exception as e:
         return jsonify({
@@ -264,27 +326,12 @@ def ram_analysis():
 # CPU分析API
 @app.route('/api/cpu_analysis')
 @login_required
-@ttl_cache(300)
+@ttl_cache(CACHE_TTL)
 def cpu_analysis():
     try:
-        # 使用SQLAlchemy进行分组查询
-        cpu_stats = db.session.query(
-            Laptop.cpu,
-            db.func.count(Laptop.id).label('count'),
-            db.func.avg(Laptop.price).label('avg_price'),
-            db.func.sum(Laptop.sales).label('total_sales')
-        ).group_by(Laptop.cpu).all()
-        
-        result = [{
-            'cpu': item.cpu,
-            'count': item.count,
-            'avg_price': round(item.avg_price, 2),
-            'total_sales': item.total_sales
-        } for item in cpu_stats]
-        
         return jsonify({
             'success': True,
-            'data': result
+            'data': cpu_analysis_data(get_snapshot())
         })
     except Exception as e:
         return jsonify({
@@ -295,54 +342,12 @@ def cpu_analysis():
 # 价格区间分析API
 @app.route('/api/price_range_analysis')
 @login_required
-@ttl_cache(300)
+@ttl_cache(CACHE_TTL, params=('edges',))
 def price_range_analysis():
     try:
-        # 定义价格区间
-        price_ranges = [
-            {'min': 0, 'max': 2000, 'label': '0-2000元'},
-            {'min': 2000, 'max': 4000, 'label': '2000-4000元'},
-            {'min': 4000, 'max': 6000, 'label': '4000-6000元'},
-            {'min': 6000, 'max': 8000, 'label': '6000-8000元'},
-            {'min': 8000, 'max': 10000, 'label': '8000-10000元'},
-            {'min': 10000, 'max': 99999999, 'label': '10000元以上'}
-        ]
-        
-        result = []
-        for price_range in price_ranges:
-            # 查询每个价格区间的数据
-            count = Laptop.query.filter(
-                Laptop.price >= price_range['min'],
-                Laptop.price < price_range['max']
-            ).count()
-            
-            if count > 0:
-                # 计算平均价格
-                avg_price = db.session.query(
-                    db.func.avg(Laptop.price)
-                ).filter(
-                    Laptop.price >= price_range['min'],
-                    Laptop.price < price_range['max']
-                ).scalar()
-                
-                # 计算总销量
-                total_sales = db.session.query(
-                    db.func.sum(Laptop.sales)
-                ).filter(
-                    Laptop.price >= price_range['min'],
-                    Laptop.price < price_range['max']
-                ).scalar()
-                
-                result.append({
-                    'range': price_range['label'],
-                    'count': count,
-                    'avg_price': round(avg_price, 2) if avg_price else 0,
-                    'total_sales': total_sales if total_sales else 0
-                })
-        
         return jsonify({
             'success': True,
-            'data': result
+            'data': price_range_analysis_data(get_snapshot(), edges=parse_edges(request.args.get('edges')))
         })
     except Exception as e:
         return jsonify({
@@ -353,30 +358,12 @@ def price_range_analysis():
 # 销量分析API
 @app.route('/api/sales_analysis')
 @login_required
-@ttl_cache(300)
+@ttl_cache(CACHE_TTL)
 def sales_analysis():
     try:
-        # 获取销量最高的前10个产品
-        top_sales = Laptop.query.order_by(Laptop.sales.desc()).limit(10).all()
-        top_sales_data = [laptop.to_dict() for laptop in top_sales]
-        
-        # 获取各品牌的总销量
-        brand_sales = db.session.query(
-            Laptop.brand,
-            db.func.sum(Laptop.sales).label('total_sales')
-        ).group_by(Laptop.brand).order_by(db.func.sum(Laptop.sales).desc()).all()
-        
-        brand_sales_data = [{
-            'brand': item.brand,
-            'total_sales': item.total_sales
-        } for item in brand_sales]
-        
         return jsonify({
             'success': True,
-            'data': {
-                'top_products': top_sales_data,
-                'brand_sales': brand_sales_data
-            }
+            'data': sales_analysis_data(get_snapshot())
         })
     except Exception as e:
         return jsonify({
@@ -387,40 +374,41 @@ def sales_analysis():
 # 价格与销量关系分析API
 @app.route('/api/price_sales_correlation')
 @login_required
-@ttl_cache(300)
+@ttl_cache(CACHE_TTL, params=('edges',))
 def price_sales_correlation():
     try:
-        # 获取所有数据
-        laptops = Laptop.query.all()
-        laptop_dicts = [laptop.to_dict() for laptop in laptops]
-        df = pd.DataFrame(laptop_dicts)
-        
-        # 计算价格与销量的相关系数
-        correlation = df['price'].corr(df['sales'])
-        
-        # 按价格区间分组计算平均销量
-        price_bins = [0, 2000, 4000, 6000, 8000, 10000, 99999999]
-        price_labels = ['0-2000', '2000-4000', '4000-6000', '6000-8000', '8000-10000', '10000+']        
-        df['price_range'] = pd.cut(df['price'], bins=price_bins, labels=price_labels)
-        
-        price_sales_data = df.groupby('price_range').agg({
-            'sales': 'mean',
-            'price': 'mean',
-            'id': 'count'
-        }).reset_index()
-        
-        price_sales_data = price_sales_data.rename(columns={
-            'sales': 'avg_sales',
-            'price': 'avg_price',
-            'id': 'count'
+        return jsonify({
+            'success': True,
+            'data': price_sales_correlation_data(get_snapshot(), edges=parse_edges(request.args.get('edges')))
         })
-        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        })
+
+# 数据版本API：客户端可据此判断本地缓存的数据是否过期
+@app.route('/api/data_version')
+@login_required
+def data_version():
+    return jsonify({'success': True, 'data': {'version': current_data_version()}})
+
+# 缓存统计API
+@app.route('/api/cache_stats')
+@login_required
+def cache_stats():
+    return jsonify({'success': True, 'data': response_cache.stats()})
+
+# 仪表盘API：在同一份快照上一次返回多个概览组件
+@app.route('/api/dashboard')
+@login_required
+@ttl_cache(CACHE_TTL, params=('widgets',))
+def dashboard():
+    widgets = [w.strip() for w in request.args.get('widgets', '').split(',') if w.strip()]
+    try:
         return jsonify({
             'success': True,
-            'data': {
-                'correlation': round(correlation, 2),
-                'price_sales_data': price_sales_data.to_dict(orient='records')
-            }
+            'data': build_dashboard(get_snapshot(), widgets)
         })
     except Exception as e:
         return jsonify({
@@ -431,20 +419,31 @@ def price_sales_correlation():
 # 数据导入命令
 @app.cli.command('import-csv')
 @click.option('--csv_path', default=None, help='Path to the CSV file')
-def import_csv(csv_path=None):
+@click.option('--skip-precompute', is_flag=True, help='Skip precomputing the advanced analysis results')
+@click.option('--delete-missing', is_flag=True, help='Soft-delete products that are no longer in the CSV')
+@click.option('--full', is_flag=True, help='Rewrite every row even if its content hash is unchanged')
+def import_csv(csv_path=None, skip_precompute=False, delete_missing=False, full=False):
     """
-    从CSV文件导入数据到MySQL数据库
+    从CSV文件导入数据到MySQL数据库（只写入新增和内容变化的行）
     :param csv_path: 可选的自定义CSV文件路径
+    :param skip_precompute: 是否跳过导入后的高级分析预计算
+    :param delete_missing: 是否软删除CSV中已不存在的商品
+    :param full: 是否忽略内容哈希重写全部行
     """
     from migrate_data import migrate_csv_to_mysql
-    migrate_csv_to_mysql(csv_path)
+    result = migrate_csv_to_mysql(csv_path, delete_missing=delete_missing, full=full)
+    changed = result['written'] or result['deleted']
+    if changed:
+        invalidate_snapshot()
+    if changed and not skip_precompute:
+        run_precompute()
     print(f'数据导入完成! 使用的CSV文件: {csv_path or "默认路径"}')
 
 # 初始化数据库命令
 @app.cli.command('init-db')
 def init_db():
     """初始化数据库，创建所有表"""
-    db.create_all()
+    ensure_schema()
     print('数据库表已创建!')
     
     # 检查是否有用户，如果没有则创建一个默认管理员
@@ -460,39 +459,247 @@ def init_db():
 @app.route('/api/competitive_analysis')
 @login_required
 def get_competitive_analysis():
-    brand = request.args.get('brand')
-    return jsonify(competitive_analysis(brand))
+    brand = request.args.get('brand') or None
+    return jsonify(cached_competitive_analysis(brand))
+
+# 全文检索API：type=laptop 检索商品名称和店铺，type=comment 检索评论；mode=all 时要求命中全部查询词元
+@app.route('/api/search')
+@login_required
+@ttl_cache(CACHE_TTL, params=('q', 'type', 'mode', 'limit', 'offset'))
+def search_api():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('type', 'laptop')
+    limit = min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if not query:
+        return jsonify({'success': False, 'message': '请输入检索内容'}), 400
+    if kind not in SEARCH_KINDS:
+        return jsonify({'success': False, 'message': f'不支持的检索类型: {kind}'}), 400
+    hits, total = search(query, kind, limit=limit, offset=offset, require_all=request.args.get('mode') == 'all')
+    ids = [doc_id for doc_id, _ in hits]
+    if kind == 'laptop':
+        snap = get_snapshot()
+        positions = snap.positions(ids)
+        records = {r['id']: r for r in snap.records(mask=positions[positions >= 0])}
+    else:
+        rows = db.session.execute(comment_select(COMMENT_FIELDS).where(Comment.id.in_(ids))) if ids else []
+        records = {r['id']: r for r in rows_to_dicts(rows, COMMENT_FIELDS)}
+    data = [dict(records[doc_id], score=score) for doc_id, score in hits if doc_id in records]
+    return jsonify({'success': True, 'data': data, 'total': total, 'limit': limit, 'offset': offset})
+
+# 分面统计API：接受 /api/data 的筛选参数，返回品牌、CPU、内存容量和价格区间每个取值的商品数与销量
+@app.route('/api/facets')
+@login_required
+@ttl_cache(CACHE_TTL, params=('brand', 'cpu', 'ram_gb_min', 'ram_gb_max', 'price_min', 'price_max'))
+def get_facets():
+    filters = laptop_filter_args()
+    data = facet_counts(get_snapshot(), filters)
+    data['filter'] = filters
+    return jsonify({'success': True, 'data': data})
+
+# 透视分析API：dims 为分组维度（逗号分隔），measures 为度量，例如 count,avg:price,sum:sales，支持 /api/data 的筛选参数
+@app.route('/api/pivot')
+@login_required
+@ttl_cache(CACHE_TTL, params=('dims', 'measures', 'brand', 'cpu', 'ram_gb_min', 'ram_gb_max', 'price_min', 'price_max'))
+def get_pivot():
+    try:
+        dims = parse_dimensions(request.args.get('dims'))
+        measures = parse_measures(request.args.get('measures'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    data = pivot(get_snapshot(), dims, measures, laptop_filter_args())
+    return jsonify({'success': True, 'data': data})
+
+# 价格分布API：由 (品牌, CPU, 内存) 分组的分位数草图合并得到百分位和直方图
+# brand/cpu/ram_gb 可以是逗号分隔的多个取值，q 为百分位列表，edges 为直方图边界（默认等宽 bins 个桶）
+@app.route('/api/price_distribution')
+@login_required
+@ttl_cache(CACHE_TTL, params=('brand', 'cpu', 'ram_gb', 'group_by', 'q', 'edges', 'bins'))
+def get_price_distribution():
+    def split(name, cast=str):
+        return [cast(x.strip()) for x in request.args.get(name, '').split(',') if x.strip()] or None
+    try:
+        data = price_distribution(brand=split('brand'), cpu=split('cpu'), ram_gb=split('ram_gb', int),
+                                  group_by=request.args.get('group_by') or None,
+                                  percentiles=split('q', float) or DEFAULT_PERCENTILES,
+                                  edges=parse_edges(request.args.get('edges')),
+                                  bins=request.args.get('bins', DEFAULT_BINS, type=int))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+    return jsonify({'success': True, 'data': data})
+
+# 价格与销量历史API：按 day/week/month 分桶，可按 brand/cpu/ram 分组，支持 /api/data 的筛选参数
+@app.route('/api/price_history')
+@login_required
+@ttl_cache(CACHE_TTL, params=('bucket', 'group_by', 'start', 'end', 'ram', 'brand', 'cpu', 'ram_gb_min',
+                              'ram_gb_max', 'price_min', 'price_max'))
+def get_price_history():
+    snap = get_snapshot()
+    mask = snap.filter_mask(ram=request.args.get('ram') or None, **laptop_filter_args())
+    try:
+        data = history_series(snap, bucket=request.args.get('bucket', 'day'),
+                              group_by=request.args.get('group_by') or None, mask=mask,
+                              start=request.args.get('start') or None, end=request.args.get('end') or None)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'data': data})
+
+# 全品牌竞品矩阵API
+@app.route('/api/competitive_matrix')
+@login_required
+@ttl_cache(CACHE_TTL)
+def get_competitive_matrix():
+    return jsonify(competitive_matrix_analysis())
 
 # 价格趋势预测API
+# 结果中的日期以当天为起点，缓存键包含当天日期，跨天后重新计算
 @app.route('/api/price_trend_prediction')
 @login_required
 def get_price_trend_prediction():
-    brand = request.args.get('brand')
-    ram = request.args.get('ram')
+    brand = request.args.get('brand') or None
+    ram = request.args.get('ram') or None
     days = request.args.get('days', 30, type=int)
-    return jsonify(price_trend_prediction(brand, ram, days))
+    return jsonify(cached_price_trend_prediction(brand, ram, days, datetime.date.today().isoformat()))
 
 # 情感分析API
 @app.route('/api/sentiment_analysis')
 @login_required
 def get_sentiment_analysis():
-    brand = request.args.get('brand')
-    return jsonify(sentiment_analysis(brand))
+    brand = request.args.get('brand') or None
+    return jsonify(cached_sentiment_analysis(brand))
 
 # 聚类分析API
 @app.route('/api/laptop_clustering')
 @login_required
 def get_laptop_clustering():
-    return jsonify(laptop_clustering())
+    mode = request.args.get('mode', 'auto')
+    return jsonify(cached_laptop_clustering(mode, cluster_sample_size()))
+
+def cluster_sample_size():
+    """读取 sample_size 参数并限制在 CLUSTER_SAMPLE_SIZE 以内（轮廓系数的计算量为样本量的平方）"""
+    sample_size = request.args.get('sample_size', type=int)
+    if sample_size is None or sample_size <= 0:
+        return None
+    return min(sample_size, app.config.get('CLUSTER_SAMPLE_SIZE', 10000))
+
+# 聚类分配API：使用与 /api/laptop_clustering 相同 mode/sample_size 参数的聚类模型为指定笔记本分配聚类
+@app.route('/api/cluster_assign')
+@login_required
+def get_cluster_assign():
+    try:
+        ids = [int(x) for x in request.args.get('laptop_id', '').split(',') if x.strip()]
+    except ValueError:
+        return jsonify({'success': False, 'message': 'laptop_id 参数格式错误'}), 400
+    return jsonify(assign_clusters(ids, mode=request.args.get('mode', 'auto'), sample_size=cluster_sample_size()))
+
+# 相似商品API：按价格、内存、CPU档次、销量和评分查找最近邻，laptop_id 支持逗号分隔的多个ID
+@app.route('/api/similar')
+@login_required
+@ttl_cache(CACHE_TTL, params=('laptop_id', 'k'))
+def get_similar():
+    try:
+        ids = [int(x) for x in request.args.get('laptop_id', '').split(',') if x.strip()]
+    except ValueError:
+        return jsonify({'success': False, 'message': 'laptop_id 参数格式错误'}), 400
+    if not ids:
+        return jsonify({'success': False, 'message': '请提供 laptop_id 参数'}), 400
+    if len(ids) > MAX_PAGE_SIZE:
+        return jsonify({'success': False, 'message': f'单次最多查询 {MAX_PAGE_SIZE} 个商品'}), 400
+    return jsonify(similar_laptops(ids, k=request.args.get('k', 5, type=int)))
 
 # 新增：返回所有有数据的品牌+内存组合
 @app.route('/api/brand_ram_options')
 @login_required
+@ttl_cache(CACHE_TTL)
 def brand_ram_options():
-    combos = db.session.query(Laptop.brand, Laptop.ram).group_by(Laptop.brand, Laptop.ram).all()
+    combos = db.session.query(Laptop.brand, Laptop.ram).filter(Laptop.deleted_at.is_(None)) \
+        .group_by(Laptop.brand, Laptop.ram).all()
     result = [{'brand': b, 'ram': r} for b, r in combos]
     return jsonify({'success': True, 'data': result})
 
+# 提交后台分析任务API，返回任务ID，相同参数的任务在执行期间不会重复提交
+@app.route('/api/jobs/<job_type>', methods=['POST'])
+@login_required
+def submit_job(job_type):
+    args = request.get_json(silent=True) or request.values
+    if not isinstance(args, dict):
+        return jsonify({'success': False, 'message': '任务参数必须为JSON对象'}), 400
+    try:
+        kwargs = jobs.parse_params(job_type, args)
+    except KeyError:
+        return jsonify({'success': False, 'message': f'未知的任务类型: {job_type}',
+                        'job_types': jobs.job_types()}), 404
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '任务参数格式错误'}), 400
+    try:
+        job_id, created = jobs.submit(job_type, kwargs)
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'message': str(e)}), 429
+    return jsonify({'success': True, 'job_id': job_id, 'created': created,
+                    'status_url': url_for('get_job', job_id=job_id)}), 202
+
+# 查询后台任务状态API：queued / running / finished / failed，完成后返回结果
+@app.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    record = jobs.status(job_id)
+    if record is None:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'}), 404
+    return jsonify({'success': True, 'data': record})
+
+@app.cli.command('precompute-analysis')
+def precompute_analysis():
+    """预先计算各品牌的竞品分析、情感分析和聚类分析结果，写入共享缓存"""
+    run_precompute()
+
+def run_precompute():
+    started = time.time()
+    brands = [b for b in get_snapshot().categories['brand'] if b is not None]
+    cached_laptop_clustering('auto', None)
+    for brand in [None] + brands:
+        cached_competitive_analysis(brand)
+        cached_sentiment_analysis(brand)
+    print(f'预计算完成: {len(brands)} 个品牌, 耗时 {time.time() - started:.1f} 秒')
+
+@app.cli.command('record-history')
+def cli_record_history():
+    """将当前价格与销量追加到价格历史表（只记录有变化的商品）"""
+    added, updated = record_history()
+    bump_data_version()
+    print(f'价格历史: 新增 {added} 条, 更新当日记录 {updated} 条')
+
+@app.cli.command('update-price-sketches')
+def cli_update_price_sketches():
+    """重新计算各分组的价格分位数草图（只写入发生变化的分组）"""
+    result = update_price_sketches()
+    bump_data_version()
+    print(f"价格草图: 更新 {result['updated']} 个分组, 删除 {result['removed']} 个分组")
+
+@app.cli.command('rescore-comments')
+@click.option('--chunk-size', default=2000, help='Comments scored per parallel task')
+@click.option('--jobs', default=-1, help='Number of worker processes (-1 uses all CPUs)')
+def cli_rescore_comments(chunk_size, jobs):
+    """重新计算全部评论的情感标签与得分"""
+    started = time.time()
+    ensure_sentiment_columns()
+    total = rescore_comments(chunk_size=chunk_size, n_jobs=jobs,
+                             progress=lambda n: print(f'已处理 {n} 条评论'))
+    bump_data_version()
+    print(f'情感打分完成: {total} 条评论, 耗时 {time.time() - started:.1f} 秒')
+
+@app.cli.command('sync-search-index')
+@click.option('--rebuild', is_flag=True, help='Drop the index and rebuild it from scratch')
+def cli_sync_search_index(rebuild):
+    """增量更新全文检索索引（只处理文本变化的商品和评论）"""
+    started = time.time()
+    result = sync_search_index(rebuild=rebuild)
+    bump_data_version()
+    for kind, stats in result.items():
+        print(f"{kind}: 重建 {stats['indexed']} 个文档, 删除 {stats['removed']} 个文档")
+    print(f'索引更新完成, 耗时 {time.time() - started:.1f} 秒')
+
 @app.cli.command('create-indexes')
 def create_indexes():
     stmts = [
@@ -515,6 +722,7 @@ def create_indexes():
 def cli_backfill_ram_gb():
     from migrate_data import backfill_ram_gb
     backfill_ram_gb()
+    invalidate_snapshot()
 
 # 新增：获取评论数据API
 @app.route('/api/comments')
@@ -523,24 +731,33 @@ def get_comments():
     try:
         # 获取查询参数
         laptop_id = request.args.get('laptop_id', type=int)
-        limit = request.args.get('limit', 10, type=int)
+        limit = min(request.args.get('limit', 10, type=int), MAX_PAGE_SIZE)
         offset = request.args.get('offset', 0, type=int)
+        cursor = request.args.get('cursor')
+        total_mode = request.args.get('total', 'exact')
+        fields = parse_fields(request.args.get('fields'), COMMENT_FIELDS)
         
-        # 构建查询
-        query = db.session.query(Comment)
+        # 构建查询（只选取需要的列）
+        query = comment_select(fields, extra=('id', 'created_at') if cursor is not None else ())
         
         # 如果指定了笔记本ID，则只获取该笔记本的评论
         if laptop_id:
-            query = query.filter(Comment.laptop_id == laptop_id)
+            query = query.where(Comment.laptop_id == laptop_id)
         
         # 获取总数
-        total = query.count()
+        total = count_total(query, total_mode, ('comments', laptop_id), table_name='comments', filtered=bool(laptop_id))
         
-        # 分页获取评论
-        comments = query.order_by(Comment.created_at.desc()).offset(offset).limit(limit).all()
+        # 分页获取评论：传入 cursor 参数时按 (created_at, id) 倒序游标分页，否则使用 offset
+        next_cursor = None
+        if cursor is not None:
+            comments, next_cursor = keyset_page(query, Comment.created_at, Comment.id,
+                                                decode_cursor(cursor, '-created_at', Comment.created_at),
+                                                limit, descending=True, sort='-created_at')
+        else:
+            comments = db.session.execute(query.order_by(Comment.created_at.desc()).offset(offset).limit(limit))
         
         # 转换为字典列表
-        comment_list = [comment.to_dict() for comment in comments]
+        comment_list = rows_to_dicts(comments, fields)
         
         # 如果指定了笔记本ID，同时返回笔记本信息
         laptop_info = None
@@ -554,9 +771,13 @@ def get_comments():
             'data': {
                 'total': total,
                 'comments': comment_list,
-                'laptop': laptop_info
+                'laptop': laptop_info,
+                'next_cursor': next_cursor
             }
         })
+    except ValueError as e:
+        # 游标、字段或总数参数格式错误，与 /api/data 一致返回400
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -567,5 +788,5 @@ def get_comments():
 if __name__ == '__main__':
     with app.app_context():
         # 确保数据库表存在
-        db.create_all()
+        ensure_schema()
     app.run(debug=True)
@@ -0,0 +1,152 @@
+# 分桶聚合模块 - 对任意分桶边界一次性计算 count/avg/sum/min/max
+import numpy as np
+from sqlalchemy import select, func, case, literal_column
+from models import db
+
+
+def parse_edges(text):
+    """
+    解析查询参数中的分桶边界，例如 "0,2000,4000,inf"
+    :param text: 逗号分隔的边界字符串
+    :return: 严格递增的边界列表（除 ±inf 外必须为有限值）；为空时返回None
+    """
+    if not text:
+        return None
+    edges = [float(x) for x in text.split(',') if x.strip()]
+    if any(np.isnan(x) for x in edges):
+        raise ValueError('分桶边界不能为 nan')
+    if len(edges) < 2 or any(a >= b for a, b in zip(edges, edges[1:])):
+        raise ValueError('分桶边界必须至少包含两个严格递增的数值')
+    return edges
+
+
+def bucket_index(values, edges, right=False):
+    """
+    计算每个值所属的分桶编号
+    :param values: 数值数组
+    :param edges: 分桶边界（可包含±inf）
+    :param right: True 表示区间为 (lo, hi]，否则为 [lo, hi)
+    :return: 分桶编号数组，不落在任何桶内（含NaN）的值为-1
+    """
+    values = np.asarray(values, dtype=np.float64)
+    edges = np.asarray(edges, dtype=np.float64)
+    idx = np.searchsorted(edges, values, side='left' if right else 'right') - 1
+    valid = (idx >= 0) & (idx < len(edges) - 1) & ~np.isnan(values)
+    return np.where(valid, idx, -1)
+
+
+def _empty_stats(lower, upper, measures):
+    return {
+        'lower': lower,
+        'upper': upper,
+        'count': 0,
+        'sum': {m: 0 for m in measures},
+        'avg': {m: None for m in measures},
+        'min': {m: None for m in measures},
+        'max': {m: None for m in measures}
+    }
+
+
+def bucket_stats(values, edges, measures=None, right=False, mask=None):
+    """
+    在内存数组上一次向量化扫描完成分桶聚合
+    :param values: 用于分桶的数值数组
+    :param edges: 分桶边界
+    :param measures: 需要统计的列，名称到数组的映射
+    :param right: 区间是否右闭
+    :param mask: 可选的行掩码
+    :return: 每个分桶一个字典（按边界顺序，包含空桶）
+    """
+    measures = measures or {}
+    if mask is not None:
+        values = np.asarray(values)[mask]
+        measures = {m: np.asarray(v)[mask] for m, v in measures.items()}
+    n = len(edges) - 1
+    idx = bucket_index(values, edges, right=right)
+    hit = idx >= 0
+    idx = idx[hit]
+    count = np.bincount(idx, minlength=n)
+    result = [_empty_stats(edges[i], edges[i + 1], measures) for i in range(n)]
+    for i in range(n):
+        result[i]['count'] = int(count[i])
+    for name, column in measures.items():
+        column = np.asarray(column, dtype=np.float64)[hit]
+        ok = ~np.isnan(column)
+        b, v = idx[ok], column[ok]
+        m_count = np.bincount(b, minlength=n)
+        m_sum = np.bincount(b, weights=v, minlength=n)
+        m_min = np.full(n, np.inf)
+        m_max = np.full(n, -np.inf)
+        np.minimum.at(m_min, b, v)
+        np.maximum.at(m_max, b, v)
+        for i in np.flatnonzero(m_count):
+            result[i]['sum'][name] = float(m_sum[i])
+            result[i]['avg'][name] = float(m_sum[i] / m_count[i])
+            result[i]['min'][name] = float(m_min[i])
+            result[i]['max'][name] = float(m_max[i])
+    return result
+
+
+def bucket_case(column, edges, right=False):
+    """
+    构造将列映射为分桶编号的 CASE 表达式（±inf 边界不会出现在SQL中）
+    :return: (CASE表达式, 下界过滤条件或None)
+    """
+    n = len(edges) - 1
+    whens = []
+    else_ = None
+    for i in range(n):
+        upper = edges[i + 1]
+        if np.isinf(upper):
+            else_ = i
+            break
+        whens.append((column <= upper if right else column < upper, i))
+    lower = edges[0]
+    lower_cond = None
+    if not np.isinf(lower):
+        lower_cond = column > lower if right else column >= lower
+    return case(*whens, else_=else_), lower_cond
+
+
+def sql_bucket_stats(column, edges, measures=None, right=False, filters=()):
+    """
+    用一条带 CASE 分桶表达式的 GROUP BY 语句完成分桶聚合
+    :param column: 用于分桶的列
+    :param edges: 分桶边界
+    :param measures: 需要统计的列，名称到列对象的映射
+    :param right: 区间是否右闭
+    :param filters: 额外的过滤条件
+    :return: 与 bucket_stats 相同结构的结果
+    """
+    measures = measures or {}
+    bucket, lower_cond = bucket_case(column, edges, right=right)
+    columns = [bucket.label('bucket'), func.count().label('count')]
+    for name, col in measures.items():
+        columns += [func.count(col), func.sum(col), func.min(col), func.max(col)]
+    conditions = [column.isnot(None)] + list(filters)
+    if lower_cond is not None:
+        conditions.append(lower_cond)
+    stmt = select(*columns).where(*conditions).group_by(literal_column('bucket'))
+    result = [_empty_stats(edges[i], edges[i + 1], measures) for i in range(len(edges) - 1)]
+    for row in db.session.execute(stmt):
+        if row[0] is None:
+            continue
+        item = result[int(row[0])]
+        item['count'] = int(row[1])
+        for j, name in enumerate(measures):
+            m_count, m_sum, m_min, m_max = row[2 + 4 * j: 6 + 4 * j]
+            if m_count:
+                item['sum'][name] = float(m_sum)
+                item['avg'][name] = float(m_sum) / m_count
+                item['min'][name] = float(m_min)
+                item['max'][name] = float(m_max)
+    return result
+
+
+def range_label(lower, upper, unit=''):
+    """生成 "2000-4000元" / "10000元以上" 形式的区间标签"""
+    if np.isinf(upper):
+        return f'{lower:g}{unit}以上'
+    if np.isinf(lower):
+        return f'{upper:g}{unit}以下'
+    return f'{lower:g}-{upper:g}{unit}'
@@ -0,0 +1,371 @@
+# 批量导入模块 - 一次查询预加载 original_id -> id 映射，将CSV行分为新增和更新两类后批量写入
+# 存在 original_id 唯一索引时使用 INSERT ... ON DUPLICATE KEY UPDATE（SQLite/PostgreSQL 为 ON CONFLICT）批量写入
+# CSV按固定行数分块读取，每块清洗校验后立即写入，内存占用与文件大小无关
+# 每行保存源数据字段的内容哈希，再次导入时只写入新增和内容变化的行，可选软删除CSV中已不存在的商品
+import codecs
+import datetime
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, update, bindparam, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Laptop, Comment
+
+# 每批写入的行数
+UPSERT_BATCH_SIZE = 1000
+
+# 每次读取的CSV行数
+CSV_CHUNK_SIZE = 5000
+
+# 依次尝试的CSV编码
+CSV_ENCODINGS = ('utf-8', 'gbk', 'gb2312', 'utf-16', 'utf-8-sig')
+
+# 检测编码时读取的文件开头字节数
+ENCODING_PROBE_BYTES = 4 << 20
+
+# original_id 唯一索引名称（与 models.Laptop 一致）
+ORIGINAL_ID_INDEX = 'uq_jd_original_id'
+
+# CSV列名 -> jd表列名
+CSV_COLUMNS = {
+    'id': 'original_id', 'name': 'name', 'price': 'price', 'shop': 'shop',
+    '品牌': 'brand', '内存': 'ram', 'CPU': 'cpu', '销量': 'sales'
+}
+
+# 参与内容哈希的字段（清洗后的值）
+HASH_FIELDS = ('name', 'price', 'shop', 'brand', 'ram', 'cpu', 'sales')
+
+# 差异摘要中每类变化最多列出的 original_id 个数
+DIFF_SAMPLE_SIZE = 20
+
+
+def laptop_records(df, extra=(), hash_extra=()):
+    """
+    将CSV数据转换为jd表的行字典：去除文本首尾空白并按列长度截断；
+    缺少ID、价格或销量无法解析（或为负数）的行被丢弃，同一 original_id 出现多次时保留最后一行
+    每行附带源数据字段的内容哈希 content_hash，并清除软删除标记
+    :param extra: 额外写入的列（列名与jd表相同，如 rating）
+    :param hash_extra: 额外参与内容哈希但不写入jd表的CSV列（如 comment）
+    :return: (行字典列表, 丢弃的行数)
+    """
+    frame = pd.DataFrame({column: df[name] for name, column in CSV_COLUMNS.items()})
+    for column in extra:
+        frame[column] = df[column]
+    for column in ('original_id', 'name', 'shop', 'brand', 'ram', 'cpu'):
+        values = frame[column].astype(str).str.strip()
+        length = Laptop.__table__.c[column].type.length
+        frame[column] = values.str.slice(0, length).where(frame[column].notna() & (values != ''), None)
+    frame['price'] = pd.to_numeric(frame['price'], errors='coerce')
+    frame['sales'] = pd.to_numeric(frame['sales'], errors='coerce')
+    valid = frame['original_id'].notna() & (frame['price'] >= 0) & (frame['sales'] >= 0)
+    frame = frame[valid]
+    keep = ~frame['original_id'].duplicated(keep='last').to_numpy()
+    frame = frame[keep]
+    frame['sales'] = frame['sales'].astype(np.int64)
+    hashed = frame[list(HASH_FIELDS)].astype(object).where(frame[list(HASH_FIELDS)].notna(), None)
+    for column in hash_extra:
+        hashed[column] = df[column][valid][keep].astype(object).where(df[column][valid][keep].notna(), None)
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame['content_hash'] = [f'{h:016x}' for h in pd.util.hash_pandas_object(hashed, index=False)]
+    frame['deleted_at'] = None
+    return frame.to_dict('records'), int((~valid).sum())
+
+
+def load_key_map():
+    """一次查询读取 original_id -> id 映射（original_id 重复时取id最小的行）"""
+    key_map = {}
+    for original_id, laptop_id in db.session.execute(
+            select(Laptop.original_id, Laptop.id).where(Laptop.original_id.isnot(None)).order_by(Laptop.id.desc())):
+        key_map[original_id] = laptop_id
+    return key_map
+
+
+def load_key_state():
+    """
+    一次查询读取 original_id 对应的行id、内容哈希和软删除状态（original_id 重复时取id最小的行）
+    :return: ({original_id: id}, {original_id: (内容哈希, 是否已软删除)})
+    """
+    key_map, state = {}, {}
+    for original_id, laptop_id, content_hash, deleted_at in db.session.execute(
+            select(Laptop.original_id, Laptop.id, Laptop.content_hash, Laptop.deleted_at)
+            .where(Laptop.original_id.isnot(None)).order_by(Laptop.id.desc())):
+        key_map[original_id] = laptop_id
+        state[original_id] = (content_hash, deleted_at is not None)
+    return key_map, state
+
+
+def ensure_delta_columns():
+    """旧库的jd表没有内容哈希和软删除列时补充（create_all 不会修改已存在的表）"""
+    columns = {c['name'] for c in inspect(db.engine).get_columns('jd')}
+    if 'content_hash' not in columns:
+        db.session.execute(text('ALTER TABLE jd ADD COLUMN content_hash VARCHAR(16)'))
+    if 'deleted_at' not in columns:
+        db.session.execute(text('ALTER TABLE jd ADD COLUMN deleted_at DATETIME'))
+        db.session.execute(text('CREATE INDEX ix_jd_deleted_at ON jd (deleted_at)'))
+    db.session.commit()
+
+
+def ensure_original_id_index():
+    """
+    旧库的jd表没有 original_id 唯一索引时尝试创建（create_all 不会修改已存在的表）
+    :return: 唯一索引是否可用；表中已有重复的 original_id 时无法创建，返回False
+    """
+    inspector = inspect(db.engine)
+    unique_sets = [index['column_names'] for index in inspector.get_indexes('jd') if index.get('unique')]
+    unique_sets += [constraint['column_names'] for constraint in inspector.get_unique_constraints('jd')]
+    if ['original_id'] in unique_sets:
+        return True
+    try:
+        db.session.execute(text(f'CREATE UNIQUE INDEX {ORIGINAL_ID_INDEX} ON jd (original_id)'))
+        db.session.commit()
+        return True
+    except SQLAlchemyError:
+        db.session.rollback()
+        return False
+
+
+def _upsert_statement(columns):
+    """按数据库方言生成批量 upsert 语句，不支持的方言返回None"""
+    table = Laptop.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in columns})
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        return stmt.on_conflict_do_update(index_elements=['original_id'],
+                                          set_={c: stmt.excluded[c] for c in columns})
+    return None
+
+
+def _batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _load_ids(original_ids, batch_size=UPSERT_BATCH_SIZE):
+    """读取指定 original_id 的行id"""
+    ids = {}
+    for batch in _batches(list(original_ids), batch_size):
+        ids.update(db.session.execute(select(Laptop.original_id, Laptop.id)
+                                      .where(Laptop.original_id.in_(batch))).all())
+    return ids
+
+
+def bulk_upsert_laptops(records, key_map=None, batch_size=UPSERT_BATCH_SIZE, progress=None, unique_index=None):
+    """
+    批量新增或更新jd表
+    :param records: laptop_records() 生成的行字典
+    :param key_map: 已加载的 original_id -> id 映射（分块导入时复用），为空时重新加载
+    :param unique_index: 已检查过的 original_id 唯一索引是否可用（分块导入时复用），为空时重新检查
+    :param progress: 可选的进度回调，参数为已写入的行数
+    :return: (统计 {'inserted', 'updated', 'seconds', 'rows_per_second'}, 写入后的 original_id -> id 映射)
+    """
+    started = time.perf_counter()
+    if key_map is None:
+        key_map = load_key_map()
+    inserts = [r for r in records if r['original_id'] not in key_map]
+    updates = [r for r in records if r['original_id'] in key_map]
+    columns = [c for c in (records[0] if records else {}) if c != 'original_id']
+    if records and unique_index is None:
+        unique_index = ensure_original_id_index()
+    upsert = _upsert_statement(columns) if records and unique_index else None
+    written = 0
+    if upsert is not None:
+        # 新增和更新在同一条语句中完成，由唯一索引判断冲突
+        for batch in _batches(inserts + updates, batch_size):
+            db.session.execute(upsert, batch)
+            db.session.commit()
+            written += len(batch)
+            if progress:
+                progress(written)
+    else:
+        table = Laptop.__table__
+        stmt = (update(table).where(table.c.id == bindparam('_id'))
+                .values({c: bindparam(f'_{c}') for c in columns}))
+        for batch in _batches(inserts, batch_size):
+            db.session.execute(insert(table), batch)
+            db.session.commit()
+            written += len(batch)
+            if progress:
+                progress(written)
+        for batch in _batches(updates, batch_size):
+            db.session.execute(stmt, [dict({f'_{c}': r[c] for c in columns}, _id=key_map[r['original_id']])
+                                      for r in batch])
+            db.session.commit()
+            written += len(batch)
+            if progress:
+                progress(written)
+    if inserts:
+        key_map.update(_load_ids(r['original_id'] for r in inserts))
+    seconds = time.perf_counter() - started
+    return {
+        'inserted': len(inserts),
+        'updated': len(updates),
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(len(records) / seconds, 1) if seconds > 0 else None
+    }, key_map
+
+
+def bulk_upsert_comments(comments, batch_size=UPSERT_BATCH_SIZE):
+    """
+    为每个笔记本新增评论或更新其第一条评论，内容变化的评论会清空情感标签以便重新打分
+    :param comments: [(laptop_id, 评论内容)]
+    :return: (新增数, 更新数)
+    """
+    comments = dict(comments)
+    first = {}
+    for batch in _batches(list(comments), batch_size):
+        for comment_id, laptop_id, content in db.session.execute(
+                select(Comment.id, Comment.laptop_id, Comment.content)
+                .where(Comment.laptop_id.in_(batch)).order_by(Comment.id.desc())):
+            first[laptop_id] = (comment_id, content)
+    inserts, updates = [], []
+    for laptop_id, content in comments.items():
+        existing = first.get(laptop_id)
+        if existing is None:
+            inserts.append({'laptop_id': laptop_id, 'content': content})
+        elif existing[1] != content:
+            updates.append({'_id': existing[0], '_content': content})
+    table = Comment.__table__
+    stmt = (update(table).where(table.c.id == bindparam('_id'))
+            .values(content=bindparam('_content'), sentiment_label=None))
+    for batch in _batches(inserts, batch_size):
+        db.session.execute(insert(table), batch)
+    for batch in _batches(updates, batch_size):
+        db.session.execute(stmt, batch)
+    db.session.commit()
+    return len(inserts), len(updates)
+
+
+def detect_encoding(path, encodings=CSV_ENCODINGS):
+    """
+    按顺序尝试编码，只解码文件开头的 ENCODING_PROBE_BYTES 字节（末尾被截断的多字节字符不算错误），
+    返回第一个能解码的编码；之后的内容解码失败时由 ingest_csv 换用下一个编码
+    """
+    with open(path, 'rb') as f:
+        head = f.read(ENCODING_PROBE_BYTES)
+        complete = not f.read(1)
+    for encoding in encodings:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(head, final=complete)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f'无法识别CSV文件编码，已尝试: {", ".join(encodings)}')
+
+
+def soft_delete_missing(key_map, state, seen, batch_size=UPSERT_BATCH_SIZE):
+    """
+    将本次CSV中没有出现、且尚未删除的商品标记为软删除
+    :param seen: 本次CSV中出现过的 original_id 集合
+    :return: 被软删除的 original_id 列表
+    """
+    vanished = [oid for oid, (_, deleted) in state.items() if not deleted and oid not in seen]
+    now = datetime.datetime.utcnow()
+    for batch in _batches(vanished, batch_size):
+        db.session.execute(update(Laptop).where(Laptop.id.in_([key_map[oid] for oid in batch]))
+                           .values(deleted_at=now))
+        db.session.commit()
+    for oid in vanished:
+        state[oid] = (state[oid][0], True)
+    return vanished
+
+
+def _ingest_chunks(path, encoding, chunk_size, prepare, extra, hash_extra, with_comments, full,
+                   unique_index, key_map, state, undo, totals, samples, seen, progress):
+    """按指定编码分块读取CSV并写入，统计结果累加到 totals / samples / seen，state 的改动前取值记录在 undo 中"""
+    # ID按文本读取，避免某个分块中出现空ID时整列变为浮点数（"1001" 变成 "1001.0"）
+    for chunk in pd.read_csv(path, encoding=encoding, chunksize=chunk_size, dtype={'id': str}):
+        totals['read'] += len(chunk)
+        ids = chunk['id'].str.strip()
+        # 校验未通过的行也视为仍然存在，不会被软删除
+        seen.update(ids.dropna())
+        if prepare is not None:
+            chunk = prepare(chunk)
+        records, rejected = laptop_records(chunk, extra, hash_extra=[c for c in hash_extra if c in chunk])
+        totals['rejected'] += rejected
+        # 同一 original_id 出现在不同分块时每次导入都会写入（以最后一次为准）
+        changed = [r for r in records if full or state.get(r['original_id']) != (r['content_hash'], False)]
+        totals['unchanged'] += len(records) - len(changed)
+        for r in changed:
+            previous = state.get(r['original_id'])
+            kind = 'inserted' if previous is None else 'updated'
+            totals[kind] += 1
+            if previous is not None and previous[1]:
+                totals['restored'] += 1
+            if len(samples[kind]) < DIFF_SAMPLE_SIZE:
+                samples[kind].append(r['original_id'])
+            undo.setdefault(r['original_id'], previous)
+            state[r['original_id']] = (r['content_hash'], False)
+        bulk_upsert_laptops(changed, key_map=key_map, unique_index=unique_index)
+        totals['written'] += len(changed)
+        if with_comments and 'comment' in chunk and changed:
+            written = {r['original_id'] for r in changed}
+            pairs = [(key_map[oid], c) for oid, c in zip(ids, chunk['comment'])
+                     if isinstance(c, str) and c.strip() and oid in written]
+            added, updated = bulk_upsert_comments(pairs)
+            totals['comments_added'] += added
+            totals['comments_updated'] += updated
+        if progress:
+            progress(totals['read'], totals['written'], totals['rejected'])
+
+
+def ingest_csv(path, chunk_size=CSV_CHUNK_SIZE, encodings=CSV_ENCODINGS, prepare=None, extra=(),
+               with_comments=False, delete_missing=False, full=False, progress=None):
+    """
+    分块读取CSV并增量写入jd表：每块清洗校验后与已存的内容哈希比较，只写入新增和内容变化的行
+    常驻内存的只有 original_id -> (id, 内容哈希) 映射
+    :param prepare: 可选的分块预处理函数（如生成评分列），参数和返回值均为DataFrame
+    :param extra: 额外写入的列（不参与内容哈希）
+    :param with_comments: 是否同步 comment 列中的评论（评论内容参与内容哈希）
+    :param delete_missing: 是否软删除CSV中已不存在的商品
+    :param full: 为真时忽略内容哈希，重写全部行
+    :param progress: 可选的进度回调，参数为 (已读取行数, 已写入行数, 已丢弃行数)
+    :return: 差异摘要 {'encoding', 'read', 'written', 'inserted', 'updated', 'unchanged', 'restored', 'deleted',
+             'rejected', 'comments_added', 'comments_updated', 'samples', 'seconds', 'rows_per_second'}
+    """
+    started = time.perf_counter()
+    ensure_delta_columns()
+    # 唯一索引每次导入只检查（必要时创建）一次，各分块复用结果
+    unique_index = ensure_original_id_index()
+    key_map, state = load_key_state()
+    hash_extra = ('comment',) if with_comments else ()
+    remaining = list(encodings)
+    while True:
+        encoding = detect_encoding(path, remaining)
+        remaining = remaining[remaining.index(encoding) + 1:]
+        totals = {'encoding': encoding, 'read': 0, 'written': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0,
+                  'restored': 0, 'deleted': 0, 'rejected': 0, 'comments_added': 0, 'comments_updated': 0}
+        samples = {'inserted': [], 'updated': [], 'deleted': []}
+        seen = set()
+        # 本轮改动前的状态，换用其他编码重读时据此恢复（已写入的行由 upsert 覆盖）
+        undo = {}
+        try:
+            _ingest_chunks(path, encoding, chunk_size, prepare, extra, hash_extra, with_comments, full,
+                           unique_index, key_map, state, undo, totals, samples, seen, progress)
+            break
+        except UnicodeDecodeError:
+            # 开头部分能解码但后面的内容不能，说明编码判断有误，换用下一个编码从头重读
+            if not remaining:
+                raise ValueError(f'无法识别CSV文件编码，已尝试: {", ".join(encodings)}')
+            for oid, previous in undo.items():
+                if previous is None:
+                    del state[oid]
+                else:
+                    state[oid] = previous
+    # 没有读到任何有效行时（例如空文件）不做软删除，避免误删全部商品
+    if delete_missing and totals['read'] > totals['rejected']:
+        vanished = soft_delete_missing(key_map, state, seen)
+        totals['deleted'] = len(vanished)
+        samples['deleted'] = vanished[:DIFF_SAMPLE_SIZE]
+    seconds = time.perf_counter() - started
+    totals['samples'] = samples
+    totals['seconds'] = round(seconds, 3)
+    totals['rows_per_second'] = round(totals['read'] / seconds, 1) if seconds > 0 else None
+    return totals
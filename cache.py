@@ -0,0 +1,372 @@
+# 缓存模块 - 有容量上限的 LRU + TTL 缓存，支持单飞重算与过期后短暂返回旧值
+# 存储后端可插拔：memory 为进程内缓存；sqlite 为同一应用实例的所有工作进程共享的文件缓存
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, Response, make_response
+
+_MISSING = object()
+
+
+def normalize_args(params):
+    """
+    规范化查询参数作为缓存键：只保留声明过的参数，去除首尾空白并按参数名排序
+    未声明的参数不会进入缓存键，避免任意参数导致缓存无限增长
+    """
+    items = []
+    for name in sorted(params):
+        values = [v.strip() for v in request.args.getlist(name) if v.strip()]
+        if values:
+            items.append((name, tuple(values)))
+    return tuple(items)
+
+
+def successful_response(entry):
+    """
+    判断视图响应是否可以缓存：状态码为2xx，且JSON响应体不是 {'success': False, ...}
+    接口在异常时返回 200 + success=False，这类结果（如数据库暂时不可用）不能缓存到下次导入
+    :param entry: (响应体, 状态码, 类型)
+    """
+    body, status, mimetype = entry
+    if not 200 <= status < 300:
+        return False
+    if mimetype == 'application/json' and body[:1] == b'{':
+        try:
+            return json.loads(body).get('success') is not False
+        except ValueError:
+            return False
+    return True
+
+
+class MemoryBackend:
+    """进程内存储，按最近使用顺序淘汰"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (value, 过期时间, 旧值可用截止时间)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """写入条目，返回 (淘汰数, 过期清理数)"""
+        evicted = 0
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                evicted += 1
+        return evicted, 0
+
+    def acquire_lease(self, key, seconds):
+        # 进程内已由 TTLCache 保证单飞
+        return True
+
+    def release_lease(self, key):
+        pass
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    基于本地SQLite文件的共享存储，同一应用实例的多个工作进程复用同一份计算结果
+    跨进程的单飞通过租约表实现：只有拿到租约的进程会重算
+    条目不做反序列化：响应以 响应体/状态码/类型 三列保存，其他值（分析结果、任务状态）保存为JSON
+    """
+
+    # 命中时最多每隔多少秒刷新一次访问时间，避免每次读取都产生写操作
+    TOUCH_INTERVAL = 5
+
+    # 非响应值使用的类型标记（status 列为空）
+    JSON_MIMETYPE = 'application/json'
+
+    def __init__(self, path, maxsize=1024):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        conn = self._conn()
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(cache_entries)')}
+        if columns and 'body' not in columns:
+            # 旧版本的表保存的是 pickle 数据，直接丢弃
+            conn.execute('DROP TABLE cache_entries')
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_entries ('
+                     'key TEXT PRIMARY KEY, body BLOB, status INTEGER, mimetype TEXT, '
+                     'expires_at REAL, stale_until REAL, accessed_at REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at)')
+        conn.execute('CREATE TABLE IF NOT EXISTS cache_leases (key TEXT PRIMARY KEY, until REAL)')
+
+    def _conn(self):
+        # 每个线程、每个进程各自持有连接（fork 后不能复用父进程的连接）
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _key(key):
+        return repr(key)
+
+    @classmethod
+    def _encode(cls, value):
+        """将值转换为 (响应体, 状态码, 类型)：视图缓存的响应三元组原样保存，其他值编码为JSON"""
+        if isinstance(value, tuple) and len(value) == 3 and isinstance(value[0], bytes):
+            return value
+        return json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'), None, cls.JSON_MIMETYPE
+
+    @staticmethod
+    def _decode(body, status, mimetype):
+        if status is None:
+            return json.loads(body)
+        return bytes(body), status, mimetype
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute('SELECT body, status, mimetype, expires_at, stale_until, accessed_at '
+                           'FROM cache_entries WHERE key = ?', (self._key(key),)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[5] > self.TOUCH_INTERVAL:
+            conn.execute('UPDATE cache_entries SET accessed_at = ? WHERE key = ?', (now, self._key(key)))
+        return self._decode(*row[:3]), row[3], row[4]
+
+    def set(self, key, entry):
+        value, expires_at, stale_until = entry
+        body, status, mimetype = self._encode(value)
+        now = time.time()
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO cache_entries '
+                     '(key, body, status, mimetype, expires_at, stale_until, accessed_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (self._key(key), body, status, mimetype, expires_at, stale_until, now))
+        expired = conn.execute('DELETE FROM cache_entries WHERE stale_until <= ?', (now,)).rowcount
+        evicted = conn.execute('DELETE FROM cache_entries WHERE key IN ('
+                               'SELECT key FROM cache_entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                               (self.maxsize,)).rowcount
+        return evicted, expired
+
+    def acquire_lease(self, key, seconds):
+        now = time.time()
+        cur = self._conn().execute(
+            'INSERT INTO cache_leases (key, until) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET until = excluded.until WHERE cache_leases.until < ?',
+            (self._key(key), now + seconds, now))
+        return cur.rowcount == 1
+
+    def release_lease(self, key):
+        self._conn().execute('DELETE FROM cache_leases WHERE key = ?', (self._key(key),))
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute('DELETE FROM cache_entries')
+        conn.execute('DELETE FROM cache_leases')
+
+    def size(self):
+        return self._conn().execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+
+
+class TTLCache:
+    """线程安全的 LRU + TTL 缓存（计数器为本进程的统计）"""
+
+    def __init__(self, backend=None, stale_seconds=0, wait_timeout=30, version=None):
+        """
+        :param backend: 存储后端，默认使用进程内存储
+        :param stale_seconds: 条目过期后仍可作为旧值返回的时长（秒）
+        :param wait_timeout: 等待其他线程/进程计算同一个键的最长时间（秒）
+        :param version: 返回当前数据版本号的函数，版本号会加入缓存键，数据变化后旧条目自然失效
+        """
+        self.backend = backend or MemoryBackend()
+        self.stale_seconds = stale_seconds
+        self.wait_timeout = wait_timeout
+        self.version = version
+        self._inflight = {}  # key -> 正在计算该键的线程所持有的 Event
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key):
+        """返回 (新鲜值或_MISSING, 可用的旧条目或None)"""
+        entry = self.backend.get(key)
+        if entry is None:
+            return _MISSING, None
+        now = time.time()
+        if now < entry[1]:
+            return entry[0], None
+        if now >= entry[2]:
+            return _MISSING, None
+        return _MISSING, entry
+
+    def _wait_for_peer(self, key):
+        """其他进程持有租约时轮询等待其写入结果"""
+        deadline = time.time() + self.wait_timeout
+        while time.time() < deadline:
+            time.sleep(0.05)
+            value, _ = self._lookup(key)
+            if value is not _MISSING:
+                return value
+        return _MISSING
+
+    def get_or_compute(self, key, compute, ttl, cache_if=None):
+        """
+        读取缓存，未命中时调用 compute 计算
+        cache_if 返回假值时结果不写入缓存（如失败的分析结果）
+        同一个键同时只有一个线程（及一个进程）在计算：有旧值时其他请求直接返回旧值，否则等待计算完成
+        """
+        while True:
+            value, stale = self._lookup(key)
+            if value is not _MISSING:
+                with self._lock:
+                    self.hits += 1
+                return value
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    if stale is None:
+                        self.misses += 1
+                    else:
+                        self.refreshes += 1
+                    break
+                if stale is not None:
+                    self.stale_hits += 1
+                    return stale[0]
+            # 本进程内其他线程正在计算该键，等待后重新检查（若计算失败，会由某个等待者接手）
+            event.wait(self.wait_timeout)
+        leased = False
+        try:
+            leased = self.backend.acquire_lease(key, self.wait_timeout)
+            if not leased:
+                # 其他进程正在计算：有旧值直接返回，否则等待其结果，超时后自行计算
+                if stale is not None:
+                    with self._lock:
+                        self.stale_hits += 1
+                    return stale[0]
+                value = self._wait_for_peer(key)
+                if value is not _MISSING:
+                    return value
+            value = compute()
+            if cache_if is not None and not cache_if(value):
+                return value
+            now = time.time()
+            evicted, expired = self.backend.set(key, (value, now + ttl, now + ttl + self.stale_seconds))
+            with self._lock:
+                self.evictions += evicted
+                self.expirations += expired
+            return value
+        finally:
+            if leased:
+                self.backend.release_lease(key)
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """返回命中、未命中、淘汰等计数"""
+        with self._lock:
+            return {
+                'backend': type(self.backend).__name__,
+                'size': self.backend.size(),
+                'maxsize': self.backend.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'refreshes': self.refreshes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'inflight': len(self._inflight)
+            }
+
+    def cached(self, seconds, params=(), cache_if=successful_response):
+        """
+        视图函数缓存装饰器，缓存的是响应体、状态码和类型，可在进程间共享
+        响应头 X-Data-Version 返回计算该结果时的数据版本号
+        :param seconds: 有效期（秒）
+        :param params: 参与缓存键的查询参数名
+        :param cache_if: 判断 (响应体, 状态码, 类型) 是否需要缓存的函数，默认只缓存成功的响应
+        """
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                version = self.version() if self.version else None
+                key = (fn.__name__, version) + normalize_args(params)
+
+                def compute():
+                    rv = make_response(fn(*args, **kwargs))
+                    return rv.get_data(), rv.status_code, rv.mimetype
+
+                body, status, mimetype = self.get_or_compute(key, compute, seconds, cache_if=cache_if)
+                response = Response(body, status=status, mimetype=mimetype)
+                if version is not None:
+                    response.headers['X-Data-Version'] = str(version)
+                return response
+            return wrapper
+        return deco
+
+
+    def memoize(self, seconds, cache_if=None):
+        """
+        普通函数的结果缓存装饰器，缓存键由函数名、数据版本号和调用参数组成
+        :param seconds: 有效期（秒）
+        :param cache_if: 判断结果是否需要缓存的函数
+        """
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                version = self.version() if self.version else None
+                key = (fn.__name__, version) + args + tuple(sorted(kwargs.items()))
+                return self.get_or_compute(key, lambda: fn(*args, **kwargs), seconds, cache_if=cache_if)
+            return wrapper
+        return deco
+
+
+def create_cache(config, version=None, instance_path=None):
+    """
+    按配置创建响应缓存
+    :param version: 返回当前数据版本号的函数
+    :param instance_path: 应用实例目录（app.instance_path），sqlite 文件默认放在其中
+    CACHE_BACKEND: memory 或 sqlite（未配置时为 memory，config.Config 默认为 sqlite）；
+    CACHE_SQLITE_PATH: sqlite 文件路径
+    """
+    maxsize = config.get('CACHE_MAX_ENTRIES', 1024)
+    backend_name = config.get('CACHE_BACKEND', 'memory')
+    if backend_name == 'sqlite':
+        path = config.get('CACHE_SQLITE_PATH')
+        if not path:
+            if not instance_path:
+                raise ValueError('sqlite 缓存需要配置 CACHE_SQLITE_PATH 或提供应用实例目录')
+            # 实例目录只对应用所属用户可写，每个应用实例使用各自的缓存文件
+            os.makedirs(instance_path, mode=0o700, exist_ok=True)
+            path = os.path.join(instance_path, 'response_cache.sqlite3')
+        backend = SQLiteBackend(path, maxsize=maxsize)
+    elif backend_name == 'memory':
+        backend = MemoryBackend(maxsize=maxsize)
+    else:
+        raise ValueError(f'不支持的缓存后端: {backend_name}')
+    return TTLCache(backend, stale_seconds=config.get('CACHE_STALE_SECONDS', 60), version=version)
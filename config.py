@@ -14,6 +14,30 @@ class Config:
     # 应用配置
     CSV_FILE_PATH = os.getenv('CSV_FILE_PATH', 'static/data/笔记本电脑_final.csv')
     
+    # 列式快照配置
+    AGGREGATE_FROM_SNAPSHOT = True  # 分桶统计是否基于快照计算（否则使用单条SQL）
+    
+    # 接口缓存配置
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 86400))  # 缓存有效期（秒），数据变化时通过数据版本号立即失效
+    DATA_VERSION_CHECK_INTERVAL = 1  # 进程内缓存数据版本号的时长（秒）
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))  # 最大缓存条目数
+    CACHE_STALE_SECONDS = int(os.getenv('CACHE_STALE_SECONDS', 60))  # 过期后仍可返回旧值的时长（秒）
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'sqlite')  # memory: 进程内缓存；sqlite: 同一应用实例多进程共享的文件缓存
+    CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH')  # 为空时使用应用实例目录（instance/）
+    
+    # 聚类分析配置
+    CLUSTER_FULL_MAX_ROWS = 20000  # auto 模式下超过该行数时使用可扩展聚类
+    CLUSTER_SAMPLE_SIZE = 10000  # 估计轮廓系数的分层样本量（请求参数 sample_size 的上限）
+    CLUSTER_N_JOBS = -1  # 并行扫描k值使用的进程数，-1 表示使用全部CPU
+    CLUSTER_MODEL_DIR = os.getenv('CLUSTER_MODEL_DIR')  # 聚类模型持久化目录，为空时使用应用实例目录（instance/cluster_models）
+    
+    # 后台任务配置
+    JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', 0))  # 任务进程池大小，0 表示使用CPU核数
+    JOB_RESULT_TTL = 3600  # 任务状态与结果的保留时长（秒）
+    # 每类任务最多同时排队/执行的数量。该上限按工作进程计算：以 N 个进程部署（如 gunicorn -w N）时，
+    # 每类任务全局最多有 N 倍于此的任务，需要全局上限时按进程数折算
+    JOB_MAX_PENDING = {'laptop_clustering': 2, 'price_trend_prediction': 8, 'competitive_matrix': 2}
+    
     # 登录配置
     REMEMBER_COOKIE_DURATION = timedelta(days=7)  # 记住我的持续时间
     LOGIN_DISABLED = False  # 是否禁用登录功能
@@ -0,0 +1,135 @@
+# 仪表盘模块 - 概览页各组件的计算函数，均基于同一份列式快照
+import numpy as np
+from flask import current_app
+from models import Laptop
+from bucketing import bucket_stats, sql_bucket_stats, range_label
+
+# 默认分桶边界
+PRICE_EDGES = [0, 2000, 4000, 6000, 8000, 10000, float('inf')]
+RAM_EDGES = [float('-inf'), 4, 8, 16, 32, 64, float('inf')]
+
+
+def aggregate_buckets(snap, column, edges, right=False):
+    """
+    按分桶边界统计 count / avg(price) / sum(sales)
+    AGGREGATE_FROM_SNAPSHOT 为真时在列式快照上一次向量化扫描，否则执行一条 CASE 分桶的 SQL
+    """
+    if current_app.config.get('AGGREGATE_FROM_SNAPSHOT', True):
+        return bucket_stats(getattr(snap, column), edges, {'price': snap.price, 'sales': snap.sales}, right=right)
+    return sql_bucket_stats(getattr(Laptop, column), edges, {'price': Laptop.price, 'sales': Laptop.sales}, right=right,
+                            filters=(Laptop.deleted_at.is_(None),))
+
+
+def overview_stats_data(snap):
+    """总览统计：商品数、平均价格、总销量、品牌数"""
+    has_price = np.any(~np.isnan(snap.price))
+    return {
+        'total_products': int(snap.size),
+        'avg_price': float(np.nanmean(snap.price)) if has_price else 0.0,
+        'total_sales': int(np.nansum(snap.sales)),
+        'total_brands': sum(1 for b in snap.categories['brand'] if b is not None)
+    }
+
+
+def _rounded_group_stats(snap, column):
+    result = snap.group_stats(column)
+    for item in result:
+        item['avg_price'] = round(item['avg_price'], 2)
+    return result
+
+
+def brand_analysis_data(snap):
+    """各品牌的商品数、平均价格与总销量"""
+    return _rounded_group_stats(snap, 'brand')
+
+
+def cpu_analysis_data(snap):
+    """各CPU的商品数、平均价格与总销量"""
+    return _rounded_group_stats(snap, 'cpu')
+
+
+def ram_analysis_data(snap, edges=None):
+    """
+    内存分布
+    默认分桶：(-inf,4] (4,8] (8,16] (16,32] (32,64] (64,+inf)，最后一个桶沿用 "128GB+" 标签；
+    自定义分桶时无上界的桶标记为 ">下界GB"
+    """
+    buckets = aggregate_buckets(snap, 'ram_gb', edges or RAM_EDGES, right=True)
+    open_label = '128GB+' if edges is None else None
+    return [{
+        'ram': f"{b['upper']:g}GB" if np.isfinite(b['upper']) else open_label or f">{b['lower']:g}GB",
+        'count': b['count'],
+        'avg_price': round(b['avg']['price'], 2) if b['avg']['price'] is not None else 0,
+        'total_sales': int(b['sum']['sales'])
+    } for b in buckets if b['count'] > 0]
+
+
+def price_range_analysis_data(snap, edges=None):
+    """价格区间分布，区间为左闭右开"""
+    buckets = aggregate_buckets(snap, 'price', edges or PRICE_EDGES)
+    return [{
+        'range': range_label(b['lower'], b['upper'], '元'),
+        'count': b['count'],
+        'avg_price': round(b['avg']['price'], 2) if b['avg']['price'] else 0,
+        'total_sales': int(b['sum']['sales'])
+    } for b in buckets if b['count'] > 0]
+
+
+def sales_analysis_data(snap, top_n=10):
+    """销量最高的商品与各品牌总销量"""
+    sales = np.where(np.isnan(snap.sales), -np.inf, snap.sales)
+    top_n = min(top_n, snap.size)
+    top = np.argpartition(-sales, top_n - 1)[:top_n] if top_n else np.array([], dtype=np.int64)
+    top = top[np.lexsort((snap.id[top], -sales[top]))]
+    brand_sales = sorted(snap.group_stats('brand'), key=lambda x: x['total_sales'], reverse=True)
+    return {
+        'top_products': snap.records(mask=top),
+        'brand_sales': [{'brand': item['brand'], 'total_sales': item['total_sales']} for item in brand_sales]
+    }
+
+
+def price_sales_correlation_data(snap, edges=None):
+    """价格与销量的相关系数，以及各价格区间（左开右闭）的平均销量"""
+    ok = ~np.isnan(snap.price) & ~np.isnan(snap.sales)
+    correlation = float(np.corrcoef(snap.price[ok], snap.sales[ok])[0, 1]) if ok.sum() > 1 else float('nan')
+    buckets = bucket_stats(snap.price, edges or PRICE_EDGES, {'price': snap.price, 'sales': snap.sales}, right=True)
+    return {
+        'correlation': round(correlation, 2),
+        'price_sales_data': [{
+            'price_range': f"{b['lower']:g}+" if np.isinf(b['upper']) else f"{b['lower']:g}-{b['upper']:g}",
+            'avg_sales': b['avg']['sales'],
+            'avg_price': b['avg']['price'],
+            'count': b['count']
+        } for b in buckets]
+    }
+
+
+# 仪表盘可用的组件
+WIDGETS = {
+    'overview_stats': overview_stats_data,
+    'brand_analysis': brand_analysis_data,
+    'price_range_analysis': price_range_analysis_data,
+    'price_sales_correlation': price_sales_correlation_data,
+    'ram_analysis': ram_analysis_data,
+    'cpu_analysis': cpu_analysis_data,
+    'sales_analysis': sales_analysis_data
+}
+
+
+def build_dashboard(snap, names=None):
+    """
+    在同一份快照上计算多个组件，单个组件失败不影响其他组件
+    :param names: 组件名列表，为空时计算全部组件
+    :return: 组件名到 {'success', 'data'/'message'} 的映射
+    """
+    names = names or list(WIDGETS)
+    unknown = [n for n in names if n not in WIDGETS]
+    if unknown:
+        raise ValueError(f"未知的组件: {', '.join(unknown)}")
+    result = {}
+    for name in names:
+        try:
+            result[name] = {'success': True, 'data': WIDGETS[name](snap)}
+        except Exception as e:
+            result[name] = {'success': False, 'message': str(e)}
+    return result
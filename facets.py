@@ -0,0 +1,126 @@
+# 分面统计模块 - 为品牌、CPU、内存容量和价格区间的每个取值建立位图索引（每个数据版本构建一次）
+# 筛选条件对应的位图按位与后，与各取值的位图求交并统计位数，一次请求得到所有分面的计数
+import numpy as np
+import pandas as pd
+from bucketing import bucket_index, range_label
+from dashboard import PRICE_EDGES
+
+# 分面名称：计算某个分面的计数时忽略该分面自己的筛选条件，以便展示可切换的其他取值
+FACETS = ('brand', 'cpu', 'ram_gb', 'price_band')
+
+# 每个字节中置位的个数
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+
+def _bitmaps(codes, n_values):
+    """
+    为每个编码建立位图
+    :param codes: 每行的取值编码，-1 表示不属于任何取值
+    :return: uint8 矩阵，形状为 (取值数, ceil(行数 / 8))
+    """
+    rows = np.flatnonzero(codes >= 0)
+    bitmaps = np.zeros((n_values, (len(codes) + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(bitmaps, (codes[rows], rows >> 3), (0x80 >> (rows & 7)).astype(np.uint8))
+    return bitmaps
+
+
+def build_facet_index(snap):
+    """
+    构建各分面的取值列表、行编码与位图
+    :return: {分面: {'values', 'codes', 'bitmaps'}}，另含全部行的位图 'all'
+    """
+    ram_codes, ram_values = pd.factorize(pd.Series(snap.ram_gb), sort=True)
+    band_codes = bucket_index(snap.price, PRICE_EDGES)
+    columns = {
+        'brand': (snap.codes['brand'], list(snap.categories['brand'])),
+        'cpu': (snap.codes['cpu'], list(snap.categories['cpu'])),
+        'ram_gb': (ram_codes, [int(v) for v in ram_values]),
+        'price_band': (band_codes, [(lo, hi) for lo, hi in zip(PRICE_EDGES, PRICE_EDGES[1:])])
+    }
+    index = {'all': np.packbits(np.ones(snap.size, dtype=bool))}
+    for facet, (codes, values) in columns.items():
+        codes = np.asarray(codes, dtype=np.int64)
+        index[facet] = {'values': values, 'codes': codes, 'bitmaps': _bitmaps(codes, len(values))}
+    return index
+
+
+def facet_index(snap):
+    """返回快照对应的位图索引（每个数据版本只构建一次）"""
+    return snap.derived('facet_index', build_facet_index)
+
+
+def _filter_bitmaps(snap, index, filters):
+    """将筛选参数转换为按分面划分的位图，没有筛选条件的分面不出现在结果中"""
+    result = {}
+    for facet in ('brand', 'cpu'):
+        value = filters.get(facet)
+        if value:
+            values = index[facet]['values']
+            bitmaps = index[facet]['bitmaps']
+            result[facet] = bitmaps[values.index(value)] if value in values else np.zeros_like(index['all'])
+    # 内存容量范围：取范围内各取值位图的并集
+    low, high = filters.get('ram_gb_min'), filters.get('ram_gb_max')
+    if low is not None or high is not None:
+        values = np.array(index['ram_gb']['values'], dtype=np.float64)
+        keep = np.ones(len(values), dtype=bool)
+        if low is not None:
+            keep &= values >= low
+        if high is not None:
+            keep &= values <= high
+        result['ram_gb'] = np.bitwise_or.reduce(index['ram_gb']['bitmaps'][keep], axis=0) \
+            if keep.any() else np.zeros_like(index['all'])
+    # 价格为连续值，范围条件直接在价格列上计算后打包为位图
+    low, high = filters.get('price_min'), filters.get('price_max')
+    if low is not None or high is not None:
+        mask = np.ones(snap.size, dtype=bool)
+        with np.errstate(invalid='ignore'):
+            if low is not None:
+                mask &= snap.price >= low
+            if high is not None:
+                mask &= snap.price <= high
+        result['price_band'] = np.packbits(mask)
+    return result
+
+
+def _combine(index, bitmaps, exclude=()):
+    """对除 exclude 以外的筛选位图按位与"""
+    combined = index['all']
+    for name, bitmap in bitmaps.items():
+        if name not in exclude:
+            combined = combined & bitmap
+    return combined
+
+
+def _value_label(facet, value):
+    if facet == 'price_band':
+        return range_label(value[0], value[1], '元')
+    return value
+
+
+def facet_counts(snap, filters):
+    """
+    按与 /api/data 相同的筛选条件统计每个分面取值的商品数和销量
+    :param filters: brand/cpu/ram_gb_min/ram_gb_max/price_min/price_max
+    :return: {'total', 'total_sales', 'facets': {分面: [{'value', 'count', 'total_sales'}]}}
+    """
+    index = facet_index(snap)
+    bitmaps = _filter_bitmaps(snap, index, filters)
+    sales = np.nan_to_num(snap.sales)
+    matched = np.unpackbits(_combine(index, bitmaps), count=snap.size).astype(bool)
+    facets = {}
+    for facet in FACETS:
+        entry = index[facet]
+        combined = _combine(index, bitmaps, exclude=(facet,))
+        counts = _POPCOUNT[entry['bitmaps'] & combined].sum(axis=1)
+        mask = np.unpackbits(combined, count=snap.size).astype(bool) & (entry['codes'] >= 0)
+        sales_sum = np.bincount(entry['codes'][mask], weights=sales[mask], minlength=len(entry['values']))
+        items = [{'value': _value_label(facet, value), 'count': int(counts[i]), 'total_sales': int(sales_sum[i])}
+                 for i, value in enumerate(entry['values'])]
+        if facet in ('brand', 'cpu'):
+            items.sort(key=lambda item: item['count'], reverse=True)
+        facets[facet] = items
+    return {
+        'total': int(matched.sum()),
+        'total_sales': int(sales[matched].sum()),
+        'facets': facets
+    }
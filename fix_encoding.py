@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 import re
 import os
+from keyword_matcher import KeywordMatcher
 
 # 读取原始CSV文件
 try:
@@ -57,26 +59,16 @@ try:
         'alienware': '外星人', 'samsung': '三星', 'thinkpad': '联想'
     }
     
-    def extract_brand(name, shop):
-        name = str(name).lower()
-        shop = str(shop).lower()
-        
-        # 检查名称中的品牌
-        for brand in common_brands:
-            if brand.lower() in name:
-                # 如果匹配到的是映射表中的英文品牌，返回对应的中文名称
-                if brand.lower() in brand_mapping:
-                    return brand_mapping[brand.lower()]
-                return brand
-        
-        # 检查店铺名称中的品牌
-        for brand in common_brands:
-            if brand.lower() in shop:
-                if brand.lower() in brand_mapping:
-                    return brand_mapping[brand.lower()]
-                return brand
-        
-        return '其他'
+    # 按 common_brands 的顺序确定优先级，英文品牌映射为中文名称
+    brand_matcher = KeywordMatcher([(brand_mapping.get(b.lower(), b), [b]) for b in common_brands])
+    
+    def extract_brand(names, shops):
+        """先在名称中查找品牌，名称中没有时再查找店铺名称"""
+        name_priority = brand_matcher.priorities(names)
+        shop_priority = brand_matcher.priorities(shops)
+        not_found = len(brand_matcher.labels)
+        priority = np.where(name_priority < not_found, name_priority, shop_priority)
+        return brand_matcher.labels_for(priority, '其他', index=names.index)
     
     # 提取内存信息
     def extract_ram(name):
@@ -135,7 +127,7 @@ try:
             return '其他'
     
     # 添加提取的列
-    df['品牌'] = df.apply(lambda row: extract_brand(row['name'], row['shop']), axis=1)
+    df['品牌'] = extract_brand(df['name'], df['shop'])
     df['内存'] = df['name'].apply(extract_ram)
     df['CPU'] = df['name'].apply(extract_cpu)
     
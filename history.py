@@ -0,0 +1,193 @@
+# 价格与销量历史模块 - 每次导入后按original_id追加当日价格和销量，只保存发生变化的行
+# 查询时按日/周/月分桶：每个商品在桶末的取值为该时刻之前最后一次记录的值
+import datetime
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, and_, insert, update, bindparam
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Laptop, PriceHistory
+
+# 支持的时间分桶及对应的pandas周期频率
+BUCKETS = {'day': 'D', 'week': 'W', 'month': 'M'}
+
+# 支持分组汇总的列
+GROUP_COLUMNS = ('brand', 'cpu', 'ram')
+
+# 批量写入的行数
+HISTORY_BATCH_SIZE = 1000
+
+
+def _same(a, b):
+    return a == b or (a is None and b is None)
+
+
+def record_history(day=None):
+    """
+    将jd表当前的价格和销量与每个商品最近一次的历史记录比较，只追加有变化的行
+    同一天重复导入时更新当天的记录
+    :param day: 记录日期，默认为今天
+    :return: (新增行数, 更新行数)
+    """
+    day = day or datetime.date.today()
+    current = {}
+    for original_id, price, sales in db.session.execute(
+            select(Laptop.original_id, Laptop.price, Laptop.sales)
+            .where(Laptop.original_id.isnot(None), Laptop.deleted_at.is_(None))):
+        current[original_id] = (price, sales)
+    latest_day = (select(PriceHistory.original_id, func.max(PriceHistory.recorded_on).label('recorded_on'))
+                  .group_by(PriceHistory.original_id).subquery())
+    latest = {}
+    for original_id, recorded_on, price, sales in db.session.execute(
+            select(PriceHistory.original_id, PriceHistory.recorded_on, PriceHistory.price, PriceHistory.sales)
+            .join(latest_day, and_(PriceHistory.original_id == latest_day.c.original_id,
+                                   PriceHistory.recorded_on == latest_day.c.recorded_on))):
+        latest[original_id] = (recorded_on, price, sales)
+
+    inserts, updates = [], []
+    for original_id, (price, sales) in current.items():
+        previous = latest.get(original_id)
+        if previous is not None and _same(previous[1], price) and _same(previous[2], sales):
+            continue
+        if previous is not None and previous[0] == day:
+            updates.append({'_original_id': original_id, '_price': price, '_sales': sales})
+        else:
+            inserts.append({'original_id': original_id, 'recorded_on': day, 'price': price, 'sales': sales})
+
+    for start in range(0, len(inserts), HISTORY_BATCH_SIZE):
+        db.session.execute(insert(PriceHistory), inserts[start:start + HISTORY_BATCH_SIZE])
+    # 同一天重复导入时批量更新当天的记录（executemany，每批一次往返）
+    stmt = (update(PriceHistory.__table__)
+            .where(PriceHistory.original_id == bindparam('_original_id'), PriceHistory.recorded_on == day)
+            .values(price=bindparam('_price'), sales=bindparam('_sales')))
+    for start in range(0, len(updates), HISTORY_BATCH_SIZE):
+        db.session.execute(stmt, updates[start:start + HISTORY_BATCH_SIZE])
+    db.session.commit()
+    return len(inserts), len(updates)
+
+
+def load_history(snap):
+    """
+    读取全部历史记录并关联到快照中的商品行（已不在jd表中的商品被忽略）
+    价格历史表尚未创建时按没有历史记录处理（使用独立连接读取，不影响调用方的会话）
+    :return: 按 (快照行号, 日期) 排序的列数组：row / day(datetime64[D]) / price / sales
+    """
+    try:
+        with db.engine.connect() as conn:
+            rows = conn.execute(select(PriceHistory.original_id, PriceHistory.recorded_on,
+                                       PriceHistory.price, PriceHistory.sales)).all()
+    except SQLAlchemyError:
+        rows = []
+    if rows:
+        original_id, day, price, sales = zip(*rows)
+    else:
+        original_id, day, price, sales = (), (), (), ()
+    index = pd.Index(snap.original_id)
+    if index.is_unique:
+        position = index.get_indexer(pd.Index(original_id, dtype=object))
+    else:
+        # original_id 重复时无法直接用索引定位，取id最大的行
+        lookup = {oid: i for i, oid in enumerate(snap.original_id)}
+        position = np.array([lookup.get(oid, -1) for oid in original_id], dtype=np.int64)
+    keep = position >= 0
+    day = np.array(day, dtype='datetime64[D]')[keep]
+    price = np.array(price, dtype=np.float64)[keep]
+    sales = np.array(sales, dtype=np.float64)[keep]
+    position = position[keep]
+    order = np.lexsort((day, position))
+    return {'row': position[order], 'day': day[order], 'price': price[order], 'sales': sales[order]}
+
+
+def history_table(snap):
+    """返回快照对应的历史记录数组（每个数据版本只读取一次）"""
+    return snap.derived('price_history', load_history)
+
+
+def _deltas(values, first):
+    """每条记录相对同一商品上一条记录的增量（空值视为0），以及有值标记的增量"""
+    ok = (~np.isnan(values)).astype(np.float64)
+    level = np.nan_to_num(values)
+    delta = np.diff(level, prepend=0.0)
+    ok_delta = np.diff(ok, prepend=0.0)
+    delta[first] = level[first]
+    ok_delta[first] = ok[first]
+    return delta, ok_delta
+
+
+def rollup(snap, groups, n_groups, bucket='day', mask=None, start=None, end=None):
+    """
+    按时间桶和分组汇总历史记录：只存储变化的行，因此每个桶的取值为增量的累计和
+    :param groups: 快照每一行所属的分组编码
+    :param n_groups: 分组数
+    :param mask: 可选的快照行掩码
+    :param start: 起始日期，之前的记录作为第一个桶的初始值
+    :param end: 截止日期
+    :return: (周期索引, 有价格的商品数, 价格和, 有销量的商品数, 销量和)，矩阵形状为 (分组数, 桶数)
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'不支持的时间分桶: {bucket}')
+    freq = BUCKETS[bucket]
+    history = history_table(snap)
+    day, row = history['day'], history['row']
+    if len(day) == 0 and (start is None or end is None):
+        empty = np.zeros((n_groups, 0))
+        return pd.PeriodIndex([], freq=freq), empty, empty, empty, empty
+    first = np.ones(len(row), dtype=bool)
+    first[1:] = row[1:] != row[:-1]
+    price_delta, price_ok_delta = _deltas(history['price'], first)
+    sales_delta, sales_ok_delta = _deltas(history['sales'], first)
+
+    start = pd.Period(start or day.min(), freq=freq)
+    end = pd.Period(end or day.max(), freq=freq)
+    periods = pd.period_range(start, end, freq=freq)
+    bucket_index = pd.DatetimeIndex(day).to_period(freq).asi8 - start.ordinal
+    keep = bucket_index < len(periods)
+    if mask is not None:
+        keep &= mask[row]
+    bucket_index = np.clip(bucket_index[keep], 0, None)
+    cell = groups[row[keep]].astype(np.int64) * len(periods) + bucket_index
+    size = n_groups * len(periods)
+
+    def accumulate(delta):
+        total = np.bincount(cell, weights=delta[keep], minlength=size).reshape(n_groups, len(periods))
+        return np.cumsum(total, axis=1)
+
+    return (periods, accumulate(price_ok_delta), accumulate(price_delta),
+            accumulate(sales_ok_delta), accumulate(sales_delta))
+
+
+def _period_label(period, bucket):
+    if bucket == 'month':
+        return period.strftime('%Y-%m')
+    return period.start_time.strftime('%Y-%m-%d')
+
+
+def history_series(snap, bucket='day', group_by=None, mask=None, start=None, end=None):
+    """
+    价格与销量的历史序列
+    :param group_by: 分组列（brand/cpu/ram），为空时汇总全部商品
+    :return: {'bucket', 'periods': [...], 'series': [{'group', 'count', 'avg_price', 'total_sales'}]}
+    """
+    if group_by is not None and group_by not in GROUP_COLUMNS:
+        raise ValueError(f'不支持的分组字段: {group_by}')
+    if group_by:
+        groups, names = snap.codes[group_by], snap.categories[group_by]
+    else:
+        groups, names = np.zeros(snap.size, dtype=np.int64), [None]
+    periods, price_count, price_sum, _, sales_sum = rollup(snap, groups, len(names), bucket, mask, start, end)
+    avg_price = np.divide(price_sum, price_count, out=np.full(price_sum.shape, np.nan), where=price_count > 0)
+    series = []
+    for code, name in enumerate(names):
+        if not price_count[code].any():
+            continue
+        series.append({
+            'group': name,
+            'count': price_count[code].astype(int).tolist(),
+            'avg_price': [round(float(v), 2) if not np.isnan(v) else None for v in avg_price[code]],
+            'total_sales': np.rint(sales_sum[code]).astype(int).tolist()
+        })
+    return {
+        'bucket': bucket,
+        'group_by': group_by,
+        'periods': [_period_label(p, bucket) for p in periods],
+        'series': series
+    }
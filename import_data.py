@@ -4,7 +4,14 @@ import pandas as pd
 import re
 import random
 from flask import Flask
-from models import db, Laptop, Comment
+from models import db
+from versioning import bump_data_version
+from history import record_history
+from quantiles import update_price_sketches
+from search import sync_search_index
+from sentiment import score_pending_comments, ensure_sentiment_columns
+from keyword_matcher import KeywordMatcher
+from bulk_import import ingest_csv
 from config import Config
 
 # 创建应用实例
@@ -14,20 +21,22 @@ app.config.from_object(Config)
 # 初始化数据库
 db.init_app(app)
 
+# 评分关键词（正面 / 负面）
+RATING_MATCHER = KeywordMatcher({
+    'positive': ['好', '优秀', '满意', '推荐', '喜欢', '不错', '高性能', '性价比高', '值得', '快', '强劲'],
+    'negative': ['差', '不好', '失望', '退货', '慢', '卡顿', '问题', '缺点', '贵', '不值']
+}, ignore_case=False)
+
 # 根据评论内容生成评分的函数
 def generate_rating_from_comment(comment):
     """根据评论内容生成评分（1-5分）"""
     if not comment or pd.isna(comment) or not comment.strip():
         return random.uniform(3.0, 4.0)  # 如果没有评论，给一个随机的中等评分
     
-    # 正面评价关键词
-    positive_keywords = ['好', '优秀', '满意', '推荐', '喜欢', '不错', '高性能', '性价比高', '值得', '快', '强劲']
-    # 负面评价关键词
-    negative_keywords = ['差', '不好', '失望', '退货', '慢', '卡顿', '问题', '缺点', '贵', '不值']
-    
-    # 计算正面和负面关键词出现的次数
-    positive_count = sum(1 for keyword in positive_keywords if keyword in comment)
-    negative_count = sum(1 for keyword in negative_keywords if keyword in comment)
+    # 一次扫描统计正面和负面关键词出现的个数
+    counts = RATING_MATCHER.count(comment)
+    positive_count = counts.get('positive', 0)
+    negative_count = counts.get('negative', 0)
     
     # 基础评分为3分
     base_rating = 3.0
@@ -44,11 +53,16 @@ def generate_rating_from_comment(comment):
     
     return rating
 
-def import_csv_to_mysql():
-    """将CSV数据导入到MySQL数据库"""
+def import_csv_to_mysql(delete_missing=False, full=False):
+    """
+    将CSV数据导入到MySQL数据库：只写入新增和内容（含评论）变化的行
+    :param delete_missing: 是否软删除CSV中已不存在的商品
+    :param full: 为真时忽略内容哈希，重写全部行
+    """
     with app.app_context():
-        # 创建数据库表
+        # 创建数据库表，旧库的comments表补充情感列（评论导入和打分会写入）
         db.create_all()
+        ensure_sentiment_columns()
         
         # 删除跳过导入的逻辑，确保每次都执行数据同步
         # existing_count = Laptop.query.count()
@@ -56,80 +70,46 @@ def import_csv_to_mysql():
         #     print(f'数据库中已有 {existing_count} 条数据，跳过导入')
         #     return
         
-        # 读取CSV文件，自动尝试多种编码
+        # 分块读取CSV文件（自动识别编码），每块生成评分后只批量写入新增和内容变化的行
         csv_path = os.path.join(app.static_folder, 'data', '笔记本电脑_final.csv')
-        encodings = ['utf-8', 'gbk', 'gb2312', 'utf-16', 'utf-8-sig']
-        for enc in encodings:
-            try:
-                df = pd.read_csv(csv_path, encoding=enc)
-                print(f'成功用 {enc} 编码读取CSV文件，共 {len(df)} 条数据')
-                break
-            except Exception as e:
-                print(f'用 {enc} 编码读取失败: {e}')
-        else:
-            print('所有编码都无法读取CSV文件，请检查文件格式')
-            return
         
-        # 导入数据到数据库（有则更新，无则新增）
-        for index, row in df.iterrows():
-            laptop = Laptop.query.filter_by(original_id=str(row['id'])).first()
-            
-            # 生成评分
-            comment_text = row['comment'] if 'comment' in row and pd.notna(row['comment']) else ""
-            rating = generate_rating_from_comment(comment_text)
-            
-            if laptop:
-                # 已存在，更新数据
-                laptop.name = row['name']
-                laptop.price = float(row['price'])
-                laptop.shop = row['shop']
-                laptop.brand = row['品牌']
-                laptop.ram = row['内存']
-                laptop.cpu = row['CPU']
-                laptop.sales = int(row['销量'])
-                laptop.rating = rating  # 更新评分
-                
-                # 检查是否有评论数据，如果有且不为空，则添加或更新评论
-                if 'comment' in row and pd.notna(row['comment']) and row['comment'].strip():
-                    # 检查是否已存在评论
-                    existing_comment = Comment.query.filter_by(laptop_id=laptop.id).first()
-                    if existing_comment:
-                        # 更新现有评论
-                        existing_comment.content = row['comment']
-                    else:
-                        # 添加新评论
-                        comment = Comment(content=row['comment'], laptop_id=laptop.id)
-                        db.session.add(comment)
-            else:
-                # 不存在，插入新数据
-                laptop = Laptop(
-                    original_id=str(row['id']),
-                    name=row['name'],
-                    price=float(row['price']),
-                    shop=row['shop'],
-                    brand=row['品牌'],
-                    ram=row['内存'],
-                    cpu=row['CPU'],
-                    sales=int(row['销量']),
-                    rating=rating  # 设置评分
-                )
-                db.session.add(laptop)
-                
-                # 需要先提交以获取laptop.id
-                db.session.flush()
-                
-                # 添加评论（如果有）
-                if 'comment' in row and pd.notna(row['comment']) and row['comment'].strip():
-                    comment = Comment(content=row['comment'], laptop_id=laptop.id)
-                    db.session.add(comment)
-                    
-            # 每100条数据提交一次，避免内存占用过大
-            if index % 100 == 0:
-                db.session.commit()
-                print(f'已处理 {index} 条数据')
-        # 提交剩余数据
-        db.session.commit()
-        print(f'数据迁移完成，共处理 {len(df)} 条数据')
+        def add_rating(chunk):
+            comments = chunk['comment'] if 'comment' in chunk else [None] * len(chunk)
+            chunk['rating'] = [generate_rating_from_comment(c if pd.notna(c) else "") for c in comments]
+            return chunk
+        
+        try:
+            result = ingest_csv(csv_path, prepare=add_rating, extra=('rating',), with_comments=True,
+                                delete_missing=delete_missing, full=full,
+                                progress=lambda read, written, rejected:
+                                print(f'已读取 {read} 条, 写入 {written} 条, 丢弃 {rejected} 条'))
+        except (OSError, ValueError) as e:
+            print(f'读取CSV文件失败: {e}')
+            return
+        print(f"使用 {result['encoding']} 编码读取CSV文件, 共 {result['read']} 条数据")
+        print(f"笔记本: 新增 {result['inserted']} 条, 更新 {result['updated']} 条, 丢弃无效行 {result['rejected']} 条, "
+              f"耗时 {result['seconds']} 秒 ({result['rows_per_second']} 行/秒)")
+        print(f"评论: 新增 {result['comments_added']} 条, 更新 {result['comments_updated']} 条")
+        print(f"未变化 {result['unchanged']} 条, 恢复 {result['restored']} 条, 软删除 {result['deleted']} 条")
+        if not (result['written'] or result['deleted']):
+            print('数据没有变化，跳过索引、历史与缓存更新')
+            return
+        # 数据行已提交，立即递增版本号使缓存失效，后续步骤失败也不会留下过期的缓存
+        bump_data_version()
+        try:
+            # 增量更新全文检索索引
+            sync_search_index()
+            # 追加价格与销量历史（只记录有变化的商品）
+            record_history()
+            # 更新各分组的价格分位数草图
+            update_price_sketches()
+            # 为新增和修改过的评论批量计算情感
+            score_pending_comments()
+        finally:
+            # 索引、历史、草图和情感得分同样影响接口结果，完成（或失败）后再次递增
+            db.session.rollback()
+            version = bump_data_version()
+        print(f"数据迁移完成，共处理 {result['read']} 条数据，数据版本: {version}")
 
 if __name__ == '__main__':
     print('开始导入数据...')
@@ -84,6 +84,10 @@ def import_csv_to_mysql():
             insert_data(cursor, values)
             conn.commit()
         
+        # 递增数据版本号，使应用中的缓存和快照立即失效
+        bump_data_version(cursor)
+        conn.commit()
+        
         print(f'数据导入完成，共导入 {len(df)} 条数据')
         conn.close()
         
@@ -92,6 +96,18 @@ def import_csv_to_mysql():
         if 'conn' in locals() and conn:
             conn.close()
 
+def bump_data_version(cursor):
+    """
+    递增jd数据集的版本号（与 versioning.bump_data_version 相同），数据版本表尚未创建时跳过
+    """
+    try:
+        cursor.execute("""
+        INSERT INTO data_version (name, version, updated_at) VALUES ('jd', 1, NOW())
+        ON DUPLICATE KEY UPDATE version = version + 1, updated_at = NOW()
+        """)
+    except pymysql.MySQLError as e:
+        print(f'更新数据版本号失败（应用的缓存与快照不会失效，请先运行 flask init-db 创建数据版本表）: {e}')
+
 def insert_data(cursor, values):
     """
     批量插入数据到jd表
@@ -0,0 +1,218 @@
+# 后台任务模块 - 在进程池中执行耗时的分析任务（CPU密集，不受GIL限制），通过任务ID轮询结果
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+# 任务类型注册表：名称 -> (函数, 允许的参数及类型, 最大排队数)
+_registry = {}
+
+# 子进程中使用的应用实例（fork 时从父进程继承）
+_app = None
+
+# 本进程内最多保留的已完成任务数（更早的任务只能从共享存储中查询）
+MAX_FINISHED_JOBS = 256
+
+
+class JobQueueFull(Exception):
+    """某类任务的排队数已达上限"""
+
+
+def _init_worker():
+    """子进程初始化：丢弃从父进程继承的数据库连接"""
+    app = _get_app()
+    with app.app_context():
+        from models import db
+        db.engine.dispose(close=False)
+
+
+def _get_app():
+    global _app
+    if _app is None:
+        # 非 fork 启动方式下子进程不会继承应用实例，需要重新导入
+        from app import app
+        _app = app
+    return _app
+
+
+def _execute(name, kwargs):
+    """在子进程中执行任务"""
+    func = _registry[name][0]
+    with _get_app().app_context():
+        return func(**kwargs)
+
+
+class JobManager:
+    """进程池任务管理：相同参数的任务在执行期间只提交一次，每类任务的排队数有上限"""
+
+    def __init__(self):
+        self.app = None
+        self.store = None
+        self.ttl = 3600
+        self.version = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._futures = {}  # 任务ID -> (Future, 任务记录)
+        self._finished = OrderedDict()  # 已完成的任务ID -> 完成时间（按完成顺序）
+        self._by_key = {}  # 任务键 -> 执行中的任务ID
+        self._pending = {}  # 任务类型 -> 本进程中未完成的任务数
+
+    def init_app(self, app, store=None, version=None):
+        """
+        :param store: 保存任务状态的缓存后端（使用共享后端时，任一工作进程都能查询到任务）
+        :param version: 返回当前数据版本号的函数，版本号会加入去重键
+        """
+        global _app
+        _app = app
+        self.app = app
+        self.store = store
+        self.version = version
+        self.ttl = app.config.get('JOB_RESULT_TTL', 3600)
+
+    def register(self, name, func, params=None, max_pending=4):
+        """
+        注册任务类型
+        :param params: 允许的参数名到类型的映射
+        :param max_pending: 本进程中该类任务最多同时排队/执行的数量（按进程计，多进程部署时全局上限为进程数倍）
+        """
+        _registry[name] = (func, params or {}, max_pending)
+
+    def job_types(self):
+        return sorted(_registry)
+
+    def parse_params(self, name, args):
+        """按注册的参数类型从请求参数中取值，忽略未声明的参数"""
+        if name not in _registry:
+            raise KeyError(name)
+        kwargs = {}
+        for param, cast in _registry[name][1].items():
+            value = args.get(param)
+            if value not in (None, ''):
+                kwargs[param] = cast(value)
+        return kwargs
+
+    def _pool(self):
+        if self._executor is None:
+            max_workers = self.app.config.get('JOB_MAX_WORKERS') or os.cpu_count()
+            self._executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker)
+        return self._executor
+
+    def _reset_pool(self, executor):
+        """子进程异常退出后进程池不可再用，丢弃后由下一次提交重新创建（需持有 self._lock）"""
+        if executor is not None and self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False)
+
+    def _submit_to_pool(self, name, kwargs):
+        """
+        提交到进程池，进程池已损坏时重建一次后重试（需持有 self._lock）
+        :return: (Future, 执行该任务的进程池)
+        """
+        executor = self._pool()
+        try:
+            return executor.submit(_execute, name, kwargs), executor
+        except BrokenProcessPool:
+            self._reset_pool(executor)
+            executor = self._pool()
+            return executor.submit(_execute, name, kwargs), executor
+
+    def _prune_finished(self, now):
+        """
+        从本进程中移除超过保留时长或超出 MAX_FINISHED_JOBS 的已完成任务（需持有 self._lock）
+        任务记录已写入共享存储，移除后仍可按保留时长查询
+        """
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if now - finished_at < self.ttl and len(self._finished) <= MAX_FINISHED_JOBS:
+                break
+            self._finished.popitem(last=False)
+            self._futures.pop(job_id, None)
+
+    def _save(self, job_id, record):
+        if self.store is not None:
+            now = time.time()
+            self.store.set(('job', job_id), (record, now + self.ttl, now + self.ttl))
+
+    def _load(self, key):
+        if self.store is None:
+            return None
+        entry = self.store.get(key)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def submit(self, name, kwargs):
+        """
+        提交任务
+        :return: (任务ID, 是否新建)；相同任务仍在执行时返回已有任务ID
+        """
+        max_pending = _registry[name][2]
+        version = self.version() if self.version else None
+        key = (name, version) + tuple(sorted(kwargs.items()))
+        with self._lock:
+            job_id = self._by_key.get(key)
+            if job_id is not None:
+                return job_id, False
+            # 其他工作进程提交的相同任务
+            job_id = self._load(('job_key',) + key)
+            if job_id is not None:
+                record = self._load(('job', job_id))
+                if record and record['status'] in ('queued', 'running'):
+                    return job_id, False
+            if self._pending.get(name, 0) >= max_pending:
+                raise JobQueueFull(f'{name} 任务排队已满，请稍后再试')
+            job_id = uuid.uuid4().hex
+            record = {'id': job_id, 'type': name, 'params': kwargs, 'status': 'queued',
+                      'data_version': version, 'submitted_at': time.time()}
+            self._save(job_id, record)
+            if self.store is not None:
+                now = time.time()
+                self.store.set(('job_key',) + key, (job_id, now + self.ttl, now + self.ttl))
+            future, executor = self._submit_to_pool(name, kwargs)
+            self._futures[job_id] = (future, record)
+            self._by_key[key] = job_id
+            self._pending[name] = self._pending.get(name, 0) + 1
+        future.add_done_callback(partial(self._on_done, job_id, key, name, executor))
+        return job_id, True
+
+    def _on_done(self, job_id, key, name, executor, future):
+        with self._lock:
+            _, record = self._futures[job_id]
+            now = time.time()
+            record = dict(record, finished_at=now)
+            try:
+                record['result'] = future.result()
+                record['status'] = 'finished'
+            except BrokenProcessPool as e:
+                record['status'] = 'failed'
+                record['error'] = str(e) or '任务进程异常退出'
+                # 回调在进程池的管理线程中执行，这里只丢弃引用，下一次提交时重新创建
+                if self._executor is executor:
+                    self._executor = None
+            except Exception as e:
+                record['status'] = 'failed'
+                record['error'] = str(e)
+            self._futures[job_id] = (future, record)
+            self._finished[job_id] = now
+            self._by_key.pop(key, None)
+            self._pending[name] -= 1
+            self._prune_finished(now)
+        self._save(job_id, record)
+
+    def status(self, job_id):
+        """查询任务状态，未知任务返回None"""
+        with self._lock:
+            local = self._futures.get(job_id)
+        if local is not None:
+            future, record = local
+            if record['status'] == 'queued' and future.running():
+                return dict(record, status='running')
+            return record
+        return self._load(('job', job_id))
+
+
+jobs = JobManager()
@@ -0,0 +1,97 @@
+# 多模式关键词匹配模块 - 规则编译为按优先级排列的关键词元组，逐条用 C 实现的子串查找（"keyword in text"）扫描
+# 规则按顺序定义优先级：多个规则同时命中时取排在最前面的规则，命中即停止扫描
+# 关键词规模在几十个以内时，子串查找比纯Python实现的 Aho-Corasick 自动机快数倍；批量接口对相同文本只扫描一次
+import numpy as np
+import pandas as pd
+
+
+class KeywordMatcher:
+    """编译后的多模式关键词匹配器"""
+
+    def __init__(self, rules, ignore_case=True):
+        """
+        :param rules: 有序的 {标签: 关键词列表} 映射，或 (标签, 关键词列表) 序列（同一标签可以出现多次，优先级不同）
+        :param ignore_case: 是否忽略大小写
+        """
+        self.ignore_case = ignore_case
+        self.labels = []  # 优先级 -> 标签
+        self.keywords = []  # 关键词编号 -> (关键词, 优先级)
+        self._rules = []  # 优先级 -> 关键词元组
+        items = rules.items() if isinstance(rules, dict) else rules
+        for priority, (label, keywords) in enumerate(items):
+            self.labels.append(label)
+            compiled = []
+            for keyword in [keywords] if isinstance(keywords, str) else keywords:
+                keyword = self._normalize(keyword)
+                if keyword:
+                    compiled.append(keyword)
+                    self.keywords.append((keyword, priority))
+            self._rules.append(tuple(compiled))
+
+    def _normalize(self, text):
+        return text.lower() if self.ignore_case else text
+
+    def iter_matches(self, text):
+        """产出所有命中（含重叠），按结束位置排序：(起始位置, 结束位置, 关键词, 标签)"""
+        text = self._normalize(text)
+        matches = []
+        for keyword, priority in self.keywords:
+            start = text.find(keyword)
+            while start >= 0:
+                matches.append((start, start + len(keyword), keyword, self.labels[priority]))
+                start = text.find(keyword, start + 1)
+        matches.sort(key=lambda m: (m[1], m[0]))
+        return iter(matches)
+
+    def keywords_in(self, text):
+        """文本中出现过的关键词集合"""
+        text = self._normalize(text)
+        return {keyword for keyword, _ in self.keywords if keyword in text}
+
+    def count(self, text):
+        """每个标签在文本中出现过的不同关键词个数"""
+        text = self._normalize(text)
+        result = {}
+        for label, keywords in zip(self.labels, self._rules):
+            hits = 0
+            for keyword in keywords:
+                if keyword in text:
+                    hits += 1
+            if hits:
+                result[label] = result.get(label, 0) + hits
+        return result
+
+    def priority(self, text):
+        """文本命中的最高优先级，未命中返回 len(labels)"""
+        text = self._normalize(text)
+        for priority, keywords in enumerate(self._rules):
+            for keyword in keywords:
+                if keyword in text:
+                    return priority
+        return len(self._rules)
+
+    def match(self, text, default=None):
+        """返回优先级最高的命中标签"""
+        priority = self.priority(text)
+        return self.labels[priority] if priority < len(self.labels) else default
+
+    def priorities(self, series):
+        """
+        批量计算一列文本命中的最高优先级（相同文本只扫描一次）
+        :param series: pandas Series（非字符串值按 str() 处理）
+        :return: int 数组，未命中为 len(labels)
+        """
+        codes, uniques = pd.factorize(pd.Series(series), use_na_sentinel=False)
+        unique_priorities = np.fromiter((self.priority(str(text)) for text in uniques), dtype=np.int64,
+                                        count=len(uniques))
+        return unique_priorities[codes]
+
+    def labels_for(self, priorities, default=None, index=None):
+        """将优先级数组转换为标签Series"""
+        lookup = np.array(self.labels + [default], dtype=object)
+        return pd.Series(lookup[priorities], index=index)
+
+    def label_series(self, series, default=None):
+        """批量返回一列文本的命中标签，未命中的为 default"""
+        series = pd.Series(series)
+        return self.labels_for(self.priorities(series), default, index=series.index)
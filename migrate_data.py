@@ -1,8 +1,12 @@
 # 数据迁移脚本 - 将CSV数据导入到MySQL数据库
 import os
-import pandas as pd
 from flask import Flask
 from models import db, Laptop
+from versioning import bump_data_version
+from history import record_history
+from quantiles import update_price_sketches
+from search import sync_search_index
+from bulk_import import ingest_csv
 from config import Config
 import re
 
@@ -13,10 +17,13 @@ app.config.from_object(Config)
 # 初始化数据库
 db.init_app(app)
 
-def migrate_csv_to_mysql(csv_path=None):
+def migrate_csv_to_mysql(csv_path=None, delete_missing=False, full=False):
     """
-    将CSV数据迁移到MySQL数据库
+    将CSV数据迁移到MySQL数据库：只写入新增和内容变化的行
     :param csv_path: 可选的自定义CSV文件路径
+    :param delete_missing: 是否软删除CSV中已不存在的商品
+    :param full: 为真时忽略内容哈希，重写全部行
+    :return: 差异摘要，见 bulk_import.ingest_csv
     """
     with app.app_context():
         # 创建数据库表
@@ -27,58 +34,36 @@ def migrate_csv_to_mysql(csv_path=None):
             csv_path = Config.CSV_FILE_PATH if os.path.isabs(Config.CSV_FILE_PATH) else os.path.join(app.root_path, Config.CSV_FILE_PATH)
         
         try:
-            # 读取CSV文件
+            # 分块读取CSV文件，每块清洗校验后与已存的内容哈希比较，只批量写入新增和变化的行
             print(f'正在读取CSV文件: {csv_path}')
-            df = pd.read_csv(csv_path, encoding='utf-8')
-            print(f'成功读取CSV文件，共 {len(df)} 条数据')
+            result = ingest_csv(csv_path, encodings=('utf-8',), delete_missing=delete_missing, full=full,
+                                progress=lambda read, written, rejected:
+                                print(f'已读取 {read} 条, 写入 {written} 条, 丢弃 {rejected} 条'))
+            added_count, updated_count = result['inserted'], result['updated']
+            if result['rejected']:
+                print(f"丢弃缺少ID或价格、销量无法解析的数据 {result['rejected']} 条")
+            print(f"写入完成, 耗时 {result['seconds']} 秒 ({result['rows_per_second']} 行/秒)")
+            print(f"未变化 {result['unchanged']} 条, 恢复 {result['restored']} 条, 软删除 {result['deleted']} 条")
+            if not (added_count or updated_count or result['deleted']):
+                print('数据没有变化，跳过索引、历史与缓存更新')
+                return result
             
-            # 统计更新和新增的数量
-            updated_count = 0
-            added_count = 0
-            
-            # 处理每行数据
-            for index, row in df.iterrows():
-                try:
-                    # 检查是否已存在相同original_id的记录
-                    existing = Laptop.query.filter_by(original_id=str(row['id'])).first()
-                    
-                    if existing:
-                        # 更新现有记录
-                        existing.name = row['name']
-                        existing.price = float(row['price'])
-                        existing.shop = row['shop']
-                        existing.brand = row['品牌']
-                        existing.ram = row['内存']
-                        existing.cpu = row['CPU']
-                        existing.sales = int(row['销量'])
-                        updated_count += 1
-                    else:
-                        # 添加新记录
-                        laptop = Laptop(
-                            original_id=str(row['id']),
-                            name=row['name'],
-                            price=float(row['price']),
-                            shop=row['shop'],
-                            brand=row['品牌'],
-                            ram=row['内存'],
-                            cpu=row['CPU'],
-                            sales=int(row['销量'])
-                        )
-                        db.session.add(laptop)
-                        added_count += 1
-                    
-                    # 每500条数据提交一次
-                    if index % 500 == 0:
-                        db.session.commit()
-                        print(f'已处理 {index+1} 条数据 (新增: {added_count}, 更新: {updated_count})')
-                
-                except Exception as e:
-                    print(f'处理第 {index+1} 行数据时出错: {e}')
-                    continue
-            
-            # 提交剩余数据
-            db.session.commit()
-            print(f'数据处理完成! 共处理 {len(df)} 条数据 (新增: {added_count}, 更新: {updated_count})')
+            # 数据行已提交，立即递增版本号使缓存失效，后续步骤失败也不会留下过期的缓存
+            bump_data_version()
+            try:
+                # 增量更新全文检索索引
+                sync_search_index()
+                # 追加价格与销量历史（只记录有变化的商品）
+                history_added, history_updated = record_history()
+                # 更新各分组的价格分位数草图
+                update_price_sketches()
+            finally:
+                # 索引、历史和草图同样影响接口结果，完成（或失败）后再次递增
+                db.session.rollback()
+                version = bump_data_version()
+            print(f"数据处理完成! 共处理 {result['read']} 条数据 (新增: {added_count}, 更新: {updated_count}), 数据版本: {version}")
+            print(f'价格历史: 新增 {history_added} 条, 更新当日记录 {history_updated} 条')
+            return result
             
         except Exception as e:
             db.session.rollback()
@@ -116,4 +101,5 @@ def backfill_ram_gb(batch_size=500):
             idx += 1
             if idx % batch_size == 0:
                 db.session.commit()
-        db.session.commit()
\ No newline at end of file
+        db.session.commit()
+        bump_data_version()
\ No newline at end of file
@@ -38,9 +38,12 @@ class Laptop(db.Model):
     sales = db.Column(db.Integer)  # 销量
     rating = db.Column(db.Float, default=0.0)  # 新增：评分字段
     ram_gb = db.Column(db.Integer, index=True)
+    content_hash = db.Column(db.String(16))  # 源数据字段的内容哈希，增量导入时跳过未变化的行
+    deleted_at = db.Column(db.DateTime, index=True)  # 软删除时间：最近一次导入的CSV中已不存在该商品
     __table_args__ = (
         db.Index('ix_jd_brand_ram', 'brand', 'ram'),
         db.Index('ix_jd_brand_cpu', 'brand', 'cpu'),
+        db.Index('uq_jd_original_id', 'original_id', unique=True),
     )
     
     # 建立与评论的一对多关系
@@ -70,6 +73,8 @@ class Comment(db.Model):
     content = db.Column(db.Text)  # 评论内容
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # 评论时间
     laptop_id = db.Column(db.Integer, db.ForeignKey('jd.id'))  # 外键关联到笔记本
+    sentiment_label = db.Column(db.String(10), index=True)  # 情感标签：positive / neutral / negative，为空表示尚未打分
+    sentiment_score = db.Column(db.Float)  # 情感得分，范围 [-1, 1]
     
     def __repr__(self):
         return f'<Comment {self.id} for Laptop {self.laptop_id}>'
@@ -80,4 +85,71 @@ class Comment(db.Model):
             'content': self.content,
             'created_at': self.created_at,
             'laptop_id': self.laptop_id
-        }
\ No newline at end of file
+        }
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    
+    name = db.Column(db.String(50), primary_key=True)  # 数据集名称
+    version = db.Column(db.Integer, nullable=False, default=0)  # 版本号，每次导入数据后递增
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DataVersion {self.name}={self.version}>'
+
+class PriceHistory(db.Model):
+    __tablename__ = 'price_history'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    original_id = db.Column(db.String(20), nullable=False)  # 对应jd表的original_id
+    recorded_on = db.Column(db.Date, nullable=False)  # 记录日期
+    price = db.Column(db.Float)  # 当日价格
+    sales = db.Column(db.Integer)  # 当日销量
+    __table_args__ = (
+        db.UniqueConstraint('original_id', 'recorded_on', name='uq_price_history_original_id_day'),
+        db.Index('ix_price_history_recorded_on', 'recorded_on'),
+    )
+    
+    def __repr__(self):
+        return f'<PriceHistory {self.original_id}@{self.recorded_on}>'
+
+class PriceSketch(db.Model):
+    __tablename__ = 'price_sketches'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    brand = db.Column(db.String(50))  # 品牌
+    cpu = db.Column(db.String(50))  # CPU
+    ram_gb = db.Column(db.Integer)  # 内存容量
+    count = db.Column(db.Integer, nullable=False)  # 价格个数
+    min_price = db.Column(db.Float)  # 最低价
+    max_price = db.Column(db.Float)  # 最高价
+    centroids = db.Column(db.LargeBinary, nullable=False)  # t-digest质心（均值与权重，float64）
+    signature = db.Column(db.BigInteger, nullable=False)  # 质心校验值，未变化的分组不重写
+    
+    def __repr__(self):
+        return f'<PriceSketch {self.brand}/{self.cpu}/{self.ram_gb}>'
+
+class SearchDocument(db.Model):
+    __tablename__ = 'search_documents'
+    
+    kind = db.Column(db.String(10), primary_key=True)  # 文档类型：laptop / comment
+    doc_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 对应jd.id或comments.id
+    length = db.Column(db.Float, nullable=False, default=0)  # 加权后的词元数，用于BM25长度归一化
+    signature = db.Column(db.BigInteger, nullable=False)  # 文本校验值，文本不变时增量更新会跳过该文档
+    
+    def __repr__(self):
+        return f'<SearchDocument {self.kind}:{self.doc_id}>'
+
+class SearchPosting(db.Model):
+    __tablename__ = 'search_postings'
+    
+    kind = db.Column(db.String(10), primary_key=True)  # 文档类型
+    term = db.Column(db.String(32), primary_key=True)  # 词元（中文为二元组，英文和数字为整词）
+    doc_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 文档id
+    tf = db.Column(db.Float, nullable=False)  # 加权词频
+    __table_args__ = (
+        db.Index('ix_search_postings_kind_doc_id', 'kind', 'doc_id'),
+    )
+    
+    def __repr__(self):
+        return f'<SearchPosting {self.kind}:{self.term}:{self.doc_id}>'
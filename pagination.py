@@ -0,0 +1,159 @@
+# 分页模块 - 基于 (排序键, id) 的游标分页以及可选的总数统计
+import base64
+import json
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import and_, or_, text, select, func, case
+from models import db
+
+# 总数统计方式：精确 / 估算 / 缓存 / 不统计
+TOTAL_MODES = ('exact', 'estimate', 'cached', 'none')
+
+# 缓存的总数有效期（秒）与最大条目数
+COUNT_CACHE_TTL = 60
+COUNT_CACHE_SIZE = 1024
+
+
+def encode_cursor(sort, values):
+    """将排序键与最后一行的 (排序值, id) 编码为不透明的游标字符串"""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    payload = json.dumps({'s': sort, 'k': values}, separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort, sort_column):
+    """
+    解析游标
+    :param token: 游标字符串，为空表示第一页
+    :param sort: 当前请求的排序键，必须与游标中的一致
+    :param sort_column: 排序列，用于还原取值类型
+    :return: (排序值, id)，第一页返回None
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        last_value, last_id = payload['k']
+    except Exception:
+        raise ValueError('无效的游标')
+    if payload.get('s') != sort:
+        raise ValueError('游标与排序方式不匹配')
+    if sort_column.type.python_type is datetime and last_value is not None:
+        last_value = datetime.fromisoformat(last_value)
+    return last_value, int(last_id)
+
+
+def parse_sort(sort, allowed, default):
+    """
+    解析排序参数，"-price" 表示按价格降序
+    :return: (排序键, 是否降序)
+    """
+    sort = sort or default
+    descending = sort.startswith('-')
+    name = sort.lstrip('-')
+    if name not in allowed:
+        raise ValueError(f'不支持的排序字段: {name}')
+    return name, descending
+
+
+def sort_order(sort_column, id_column, descending=False):
+    """
+    (排序键, id) 的排序表达式，排序列为空值的行排在最后（偏移分页与游标分页一致）
+    :return: ORDER BY 表达式列表
+    """
+    if sort_column is id_column:
+        return [id_column.desc() if descending else id_column.asc()]
+    nulls_last = case((sort_column.is_(None), 1), else_=0)
+    if descending:
+        return [nulls_last, sort_column.desc(), id_column.desc()]
+    return [nulls_last, sort_column.asc(), id_column.asc()]
+
+
+def keyset_page(query, sort_column, id_column, cursor, limit, descending=False, sort=None):
+    """
+    按 (sort_column, id) 做游标分页，页面延迟与翻页深度无关
+    排序列为空值的行排在最后，按id翻页
+    :param query: 已应用筛选条件的 Core select（需包含排序列和id列）
+    :param cursor: decode_cursor 的返回值
+    :param limit: 每页条数
+    :param sort: 写入游标的排序键（含方向）
+    :return: (本页行列表, 下一页游标或None)
+    """
+    single_key = sort_column is id_column
+    if cursor is not None:
+        last_value, last_id = cursor
+        after_id = id_column < last_id if descending else id_column > last_id
+        if single_key:
+            query = query.where(after_id)
+        elif last_value is None:
+            # 已翻到空值部分：只剩排序列为空且id在游标之后的行
+            query = query.where(sort_column.is_(None), after_id)
+        else:
+            after_value = sort_column < last_value if descending else sort_column > last_value
+            query = query.where(or_(after_value, and_(sort_column == last_value, after_id), sort_column.is_(None)))
+    rows = db.session.execute(query.order_by(*sort_order(sort_column, id_column, descending))
+                              .limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, [last._mapping[sort_column.key], last._mapping[id_column.key]])
+    return rows, next_cursor
+
+
+_count_cache = {}
+_count_lock = threading.Lock()
+
+
+def row_count(query):
+    """统计 Core select 的结果行数"""
+    return db.session.execute(select(func.count()).select_from(query.order_by(None).subquery())).scalar()
+
+
+def cached_count(query, cache_key):
+    """带有效期的总数缓存，避免每一页都重复执行 COUNT"""
+    now = time.time()
+    entry = _count_cache.get(cache_key)
+    if entry and entry[1] > now:
+        return entry[0]
+    total = row_count(query)
+    with _count_lock:
+        if len(_count_cache) >= COUNT_CACHE_SIZE:
+            # 淘汰最早过期的条目
+            oldest = min(_count_cache, key=lambda k: _count_cache[k][1])
+            _count_cache.pop(oldest, None)
+        _count_cache[cache_key] = (total, now + COUNT_CACHE_TTL)
+    return total
+
+
+def estimated_row_count(table_name):
+    """从数据库统计信息读取表的估算行数（仅MySQL支持，其他数据库返回None）"""
+    if db.engine.dialect.name != 'mysql':
+        return None
+    return db.session.execute(text(
+        'SELECT TABLE_ROWS FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = :t'
+    ), {'t': table_name}).scalar()
+
+
+def count_total(query, mode, cache_key, table_name=None, filtered=True):
+    """
+    按指定方式统计总数
+    :param mode: exact 精确统计；estimate 无筛选时读表统计信息，否则退化为缓存总数；cached 缓存总数；none 不统计
+    :param cache_key: 缓存总数使用的键（应包含所有筛选条件）
+    :param table_name: 估算行数时使用的表名
+    :param filtered: 查询是否带筛选条件
+    :return: 总数，mode 为 none 时返回None
+    """
+    if mode not in TOTAL_MODES:
+        raise ValueError(f'不支持的总数统计方式: {mode}')
+    if mode == 'none':
+        return None
+    if mode == 'exact':
+        return row_count(query)
+    if mode == 'estimate' and not filtered and table_name:
+        estimate = estimated_row_count(table_name)
+        if estimate is not None:
+            return int(estimate)
+    return cached_count(query, cache_key)
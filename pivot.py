@@ -0,0 +1,172 @@
+# 透视分析模块 - 在字典编码列上按任意维度组合分组，一次 bincount 计算多个度量
+# 常用维度的最细粒度分组结果预先汇总为数据立方体（每个数据版本构建一次），其子集维度直接由立方体上卷得到
+import numpy as np
+import pandas as pd
+from bucketing import bucket_index, range_label
+from dashboard import PRICE_EDGES
+from snapshot import grouped_reduce
+
+# 支持的分组维度与度量
+PIVOT_DIMENSIONS = ('brand', 'cpu', 'ram', 'shop', 'ram_gb', 'price_band')
+MEASURE_COLUMNS = ('price', 'sales', 'rating', 'ram_gb')
+AGGREGATES = ('sum', 'avg', 'min', 'max')
+
+# 单次查询最多的分组维度数
+MAX_PIVOT_DIMENSIONS = 3
+
+# 预计算立方体包含的维度：只涉及这些维度（且没有价格范围筛选）的查询由立方体上卷
+CUBE_DIMENSIONS = ('brand', 'cpu', 'ram', 'ram_gb', 'price_band')
+
+
+def parse_dimensions(text):
+    """解析 dims 参数，例如 "brand,ram_gb"；为空时返回空列表（只计算总计）"""
+    dims = [d.strip() for d in (text or '').split(',') if d.strip()]
+    for dim in dims:
+        if dim not in PIVOT_DIMENSIONS:
+            raise ValueError(f'不支持的分组维度: {dim}')
+    if len(set(dims)) != len(dims):
+        raise ValueError('分组维度不能重复')
+    if len(dims) > MAX_PIVOT_DIMENSIONS:
+        raise ValueError(f'最多支持 {MAX_PIVOT_DIMENSIONS} 个分组维度')
+    return dims
+
+
+def parse_measures(text):
+    """
+    解析 measures 参数，例如 "count,avg:price,sum:sales"
+    :return: [(聚合函数, 列名)]，count 的列名为None
+    """
+    measures = []
+    for item in (text or 'count').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if item == 'count':
+            measures.append(('count', None))
+            continue
+        agg, _, column = item.partition(':')
+        if agg not in AGGREGATES or column not in MEASURE_COLUMNS:
+            raise ValueError(f'不支持的度量: {item}')
+        measures.append((agg, column))
+    if not measures:
+        raise ValueError('请至少指定一个度量')
+    return measures
+
+
+def build_dimension_codes(snap):
+    """
+    将每个维度编码为非负整数，空值为最后一个取值None
+    :return: {维度: (编码数组, 取值标签列表)}
+    """
+    result = {}
+    for dim in ('brand', 'cpu', 'ram', 'shop'):
+        result[dim] = (snap.codes[dim].astype(np.int64), list(snap.categories[dim]))
+    ram_codes, ram_values = pd.factorize(pd.Series(snap.ram_gb), sort=True)
+    labels = [int(v) for v in ram_values]
+    result['ram_gb'] = (np.where(ram_codes < 0, len(labels), ram_codes).astype(np.int64), labels + [None])
+    band = bucket_index(snap.price, PRICE_EDGES)
+    labels = [range_label(lo, hi, '元') for lo, hi in zip(PRICE_EDGES, PRICE_EDGES[1:])]
+    result['price_band'] = (np.where(band < 0, len(labels), band).astype(np.int64), labels + [None])
+    return result
+
+
+def dimension_codes(snap):
+    return snap.derived('pivot_dimensions', build_dimension_codes)
+
+
+def _row_stats(values):
+    """原始行的度量：非空个数、和、最小值、最大值（空值不参与）"""
+    ok = ~np.isnan(values)
+    return {'n': ok.astype(np.float64), 'sum': np.where(ok, values, 0.0),
+            'min': np.where(ok, values, np.inf), 'max': np.where(ok, values, -np.inf)}
+
+
+def build_cube(snap):
+    """按 CUBE_DIMENSIONS 的最细粒度预先汇总全部度量列"""
+    dims = dimension_codes(snap)
+    codes = [dims[d][0] for d in CUBE_DIMENSIONS]
+    sizes = [len(dims[d][1]) for d in CUBE_DIMENSIONS]
+    stats = {name: _row_stats(getattr(snap, name)) for name in MEASURE_COLUMNS}
+    cell_codes, count, reduced = grouped_reduce(codes, sizes, np.ones(snap.size), stats, extremes=MEASURE_COLUMNS)
+    return {'codes': dict(zip(CUBE_DIMENSIONS, cell_codes)), 'count': count, 'stats': reduced}
+
+
+def pivot_cube(snap):
+    return snap.derived('pivot_cube', build_cube)
+
+
+def _cube_mask(snap, cube, filters):
+    """将可以在立方体维度上表达的筛选条件转换为单元掩码"""
+    dims = dimension_codes(snap)
+    mask = np.ones(len(cube['count']), dtype=bool)
+    for dim in ('brand', 'cpu'):
+        if filters.get(dim):
+            code = snap.code_of(dim, filters[dim])
+            mask &= cube['codes'][dim] == (-1 if code is None else code)
+    low, high = filters.get('ram_gb_min'), filters.get('ram_gb_max')
+    if low is not None or high is not None:
+        ram_values = np.array([np.nan if v is None else v for v in dims['ram_gb'][1]], dtype=np.float64)
+        cell_ram = ram_values[cube['codes']['ram_gb']]
+        with np.errstate(invalid='ignore'):
+            if low is not None:
+                mask &= cell_ram >= low
+            if high is not None:
+                mask &= cell_ram <= high
+    return mask
+
+
+def pivot(snap, dims, measures, filters=None):
+    """
+    按任意维度组合计算度量
+    :param dims: 分组维度列表
+    :param measures: parse_measures 的结果
+    :param filters: 与 /api/data 相同的筛选条件
+    :return: {'dims', 'measures', 'rows': [...], 'source': 'cube' 或 'scan'}
+    """
+    filters = filters or {}
+    dimension = dimension_codes(snap)
+    columns = sorted({column for _, column in measures if column})
+    extremes = {column for agg, column in measures if agg in ('min', 'max')}
+    sizes = [len(dimension[d][1]) for d in dims]
+    use_cube = set(dims) <= set(CUBE_DIMENSIONS) and \
+        filters.get('price_min') is None and filters.get('price_max') is None
+    if use_cube:
+        # 由立方体单元上卷：单元的计数作为权重，单元的度量再次求和/取最值
+        cube = pivot_cube(snap)
+        mask = _cube_mask(snap, cube, filters)
+        codes = [cube['codes'][d][mask] for d in dims]
+        weights = cube['count'][mask]
+        stats = {c: {k: v[mask] for k, v in cube['stats'][c].items()} for c in columns}
+    else:
+        mask = snap.filter_mask(**filters)
+        codes = [dimension[d][0][mask] for d in dims]
+        weights = np.ones(int(mask.sum()))
+        stats = {c: _row_stats(getattr(snap, c)[mask]) for c in columns}
+    if not len(weights):
+        cell_codes, count, reduced = [np.array([], dtype=np.int64) for _ in dims], np.array([]), {}
+    else:
+        cell_codes, count, reduced = grouped_reduce(codes, sizes, weights, stats, extremes)
+    rows = []
+    for i in np.flatnonzero(count > 0):
+        row = {d: dimension[d][1][cell_codes[j][i]] for j, d in enumerate(dims)}
+        for agg, column in measures:
+            if agg == 'count':
+                row['count'] = int(count[i])
+                continue
+            values = reduced[column]
+            name = f'{agg}_{column}'
+            if values['n'][i] == 0:
+                row[name] = None if agg != 'sum' else 0
+            elif agg == 'sum':
+                row[name] = round(float(values['sum'][i]), 2)
+            elif agg == 'avg':
+                row[name] = round(float(values['sum'][i] / values['n'][i]), 2)
+            else:
+                row[name] = round(float(values[agg][i]), 2)
+        rows.append(row)
+    return {
+        'dims': dims,
+        'measures': ['count' if agg == 'count' else f'{agg}_{column}' for agg, column in measures],
+        'rows': rows,
+        'source': 'cube' if use_cube else 'scan'
+    }
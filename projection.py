@@ -0,0 +1,54 @@
+# 列投影模块 - 按 fields= 参数只查询需要的列，并直接把结果元组序列化，不经过ORM实体
+from sqlalchemy import select
+from models import Laptop, Comment
+
+# 各表允许投影的字段，默认字段与 to_dict() 的输出一致
+LAPTOP_FIELDS = ('id', 'original_id', 'name', 'price', 'shop', 'brand', 'ram', 'cpu', 'sales', 'rating', 'ram_gb')
+LAPTOP_DEFAULT_FIELDS = ('id', 'original_id', 'name', 'price', 'shop', 'brand', 'ram', 'cpu', 'sales', 'rating')
+COMMENT_FIELDS = ('id', 'content', 'created_at', 'laptop_id')
+
+
+def parse_fields(text, allowed, default=None):
+    """
+    解析逗号分隔的 fields 参数
+    :param text: 参数值，为空时返回默认字段
+    :param allowed: 允许的字段
+    :param default: 默认字段，为None时使用全部允许字段
+    :return: 字段元组（保持请求中的顺序并去重）
+    """
+    if not text:
+        return tuple(default or allowed)
+    fields = []
+    for name in text.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in allowed:
+            raise ValueError(f'不支持的字段: {name}')
+        if name not in fields:
+            fields.append(name)
+    if not fields:
+        raise ValueError('fields 参数不能为空')
+    return tuple(fields)
+
+
+def projected_select(model, fields, extra=()):
+    """
+    构造只包含所需列的 Core select
+    :param extra: 额外需要查询但不输出的列名（如游标分页所需的排序列和id）
+    """
+    names = list(fields) + [name for name in extra if name not in fields]
+    return select(*[getattr(model, name) for name in names])
+
+
+def rows_to_dicts(rows, fields):
+    """将结果行直接转换为字典列表"""
+    return [{name: row._mapping[name] for name in fields} for row in rows]
+
+
+def laptop_select(fields, extra=()):
+    return projected_select(Laptop, fields, extra)
+
+
+def comment_select(fields, extra=()):
+    return projected_select(Comment, fields, extra)
@@ -0,0 +1,240 @@
+# 价格分位数模块 - 按 (品牌, CPU, 内存) 分组维护可合并的 t-digest 分位数草图
+# 草图在导入数据后更新并持久化在 price_sketches 表中；任意分组组合的分位数和直方图通过合并草图得到，不需要读取原始行
+import threading
+import zlib
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, update, delete
+from models import db, Laptop, PriceSketch
+from versioning import current_data_version
+
+# 压缩参数：每个草图最多约 SKETCH_COMPRESSION / 2 个质心，越大越精确
+SKETCH_COMPRESSION = 100
+
+# 默认返回的百分位与直方图桶数
+DEFAULT_PERCENTILES = (10, 50, 90)
+DEFAULT_BINS = 10
+MAX_BINS = 100
+
+# 分组维度
+SKETCH_DIMENSIONS = ('brand', 'cpu', 'ram_gb')
+
+
+class TDigest:
+    """合并式 t-digest：按均值排序的质心（均值, 权重）加上精确的最小值和最大值"""
+
+    def __init__(self, means, weights, min_value, max_value, compression=SKETCH_COMPRESSION):
+        self.means = np.asarray(means, dtype=np.float64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.min = min_value
+        self.max = max_value
+        self.compression = compression
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    @classmethod
+    def from_values(cls, values, compression=SKETCH_COMPRESSION):
+        values = np.sort(np.asarray(values, dtype=np.float64))
+        if len(values) == 0:
+            return cls([], [], None, None, compression)
+        means, weights = _compress(values, np.ones(len(values)), compression)
+        return cls(means, weights, float(values[0]), float(values[-1]), compression)
+
+    @classmethod
+    def merge(cls, digests, compression=SKETCH_COMPRESSION):
+        """合并多个草图，结果的误差界与单个草图相同"""
+        digests = [d for d in digests if len(d.weights)]
+        if not digests:
+            return cls([], [], None, None, compression)
+        means = np.concatenate([d.means for d in digests])
+        weights = np.concatenate([d.weights for d in digests])
+        order = np.argsort(means, kind='stable')
+        means, weights = _compress(means[order], weights[order], compression)
+        return cls(means, weights, min(d.min for d in digests), max(d.max for d in digests), compression)
+
+    def _curve(self):
+        """质心中点的累计权重与对应取值，两端补上最小值和最大值"""
+        centers = np.cumsum(self.weights) - self.weights / 2
+        ranks = np.concatenate([[0.0], centers, [self.count]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return ranks, values
+
+    def quantile(self, q):
+        """
+        :param q: 分位点（0-1），可以是数组
+        :return: 估计的分位数
+        """
+        ranks, values = self._curve()
+        return np.interp(np.asarray(q, dtype=np.float64) * self.count, ranks, values)
+
+    def rank(self, x):
+        """估计不大于x的取值个数"""
+        ranks, values = self._curve()
+        return np.interp(np.asarray(x, dtype=np.float64), values, ranks)
+
+    def to_bytes(self):
+        return np.concatenate([self.means, self.weights]).astype('<f8').tobytes()
+
+    @classmethod
+    def from_bytes(cls, data, min_value, max_value, compression=SKETCH_COMPRESSION):
+        values = np.frombuffer(data, dtype='<f8')
+        half = len(values) // 2
+        return cls(values[:half], values[half:], min_value, max_value, compression)
+
+
+def _compress(means, weights, compression):
+    """
+    将按均值排序的质心按 k1 尺度函数分组合并：每组覆盖的 k 值范围为1，
+    两端的分组更小，因此尾部分位数更精确
+    """
+    total = weights.sum()
+    centers = (np.cumsum(weights) - weights / 2) / total
+    k = compression / (2 * np.pi) * np.arcsin(np.clip(2 * centers - 1, -1, 1))
+    groups = np.floor(k + compression / 4).astype(np.int64)
+    groups -= groups[0]
+    merged_weights = np.bincount(groups, weights=weights)
+    merged_sums = np.bincount(groups, weights=weights * means)
+    keep = merged_weights > 0
+    return merged_sums[keep] / merged_weights[keep], merged_weights[keep]
+
+
+def _cell_key(brand, cpu, ram_gb):
+    """分组键，空值统一为None（pandas分组时空值为NaN）"""
+    return (None if pd.isna(brand) else brand, None if pd.isna(cpu) else cpu,
+            None if pd.isna(ram_gb) else int(ram_gb))
+
+
+def _signature(digest):
+    return zlib.crc32(digest.to_bytes() + repr((digest.min, digest.max)).encode('utf-8'))
+
+
+def build_price_sketches():
+    """
+    按 (品牌, CPU, 内存) 分组计算jd表当前价格的草图
+    :return: {分组: TDigest}
+    """
+    rows = db.session.execute(select(Laptop.brand, Laptop.cpu, Laptop.ram_gb, Laptop.price)
+                              .where(Laptop.price > 0, Laptop.deleted_at.is_(None))).all()
+    df = pd.DataFrame(rows, columns=['brand', 'cpu', 'ram_gb', 'price'])
+    return {_cell_key(*key): TDigest.from_values(group.to_numpy())
+            for key, group in df.groupby(['brand', 'cpu', 'ram_gb'], dropna=False, sort=False)['price']}
+
+
+def update_price_sketches():
+    """
+    更新草图表：价格会在导入时被原地修改，草图无法删除旧值，因此按分组重新计算，只写入发生变化的分组
+    :return: {'updated': 写入的分组数, 'removed': 删除的分组数}
+    """
+    existing = {_cell_key(brand, cpu, ram_gb): (sketch_id, signature)
+                for sketch_id, brand, cpu, ram_gb, signature in db.session.execute(
+                    select(PriceSketch.id, PriceSketch.brand, PriceSketch.cpu, PriceSketch.ram_gb,
+                           PriceSketch.signature))}
+    inserts, updates = [], []
+    for (brand, cpu, ram_gb), digest in build_price_sketches().items():
+        values = {'count': int(digest.count), 'min_price': digest.min, 'max_price': digest.max,
+                  'centroids': digest.to_bytes(), 'signature': _signature(digest)}
+        previous = existing.pop((brand, cpu, ram_gb), None)
+        if previous is None:
+            inserts.append(dict(values, brand=brand, cpu=cpu, ram_gb=ram_gb))
+        elif previous[1] != values['signature']:
+            updates.append((previous[0], values))
+    if inserts:
+        db.session.execute(insert(PriceSketch), inserts)
+    for sketch_id, values in updates:
+        db.session.execute(update(PriceSketch).where(PriceSketch.id == sketch_id).values(**values))
+    removed = [sketch_id for sketch_id, _ in existing.values()]
+    if removed:
+        db.session.execute(delete(PriceSketch).where(PriceSketch.id.in_(removed)))
+    db.session.commit()
+    return {'updated': len(inserts) + len(updates), 'removed': len(removed)}
+
+
+_sketch_cache = {}
+_sketch_lock = threading.Lock()
+
+
+def load_price_sketches():
+    """读取全部草图，按数据版本缓存：[(分组, TDigest)]"""
+    version = current_data_version()
+    sketches = _sketch_cache.get(version)
+    if sketches is None:
+        rows = db.session.execute(select(PriceSketch.brand, PriceSketch.cpu, PriceSketch.ram_gb,
+                                         PriceSketch.min_price, PriceSketch.max_price, PriceSketch.centroids))
+        sketches = [(_cell_key(brand, cpu, ram_gb), TDigest.from_bytes(centroids, min_price, max_price))
+                    for brand, cpu, ram_gb, min_price, max_price, centroids in rows]
+        with _sketch_lock:
+            _sketch_cache.clear()
+            _sketch_cache[version] = sketches
+    return sketches
+
+
+def _edge(value):
+    """直方图边界的JSON取值：±inf 表示不限，输出为None"""
+    return None if np.isinf(value) else value
+
+
+def _summary(digest, percentiles, edges):
+    if not len(digest.weights):
+        return {'count': 0, 'min': None, 'max': None, 'percentiles': {f'p{p:g}': None for p in percentiles},
+                'histogram': [{'lower': _edge(lo), 'upper': _edge(hi), 'count': 0} for lo, hi in zip(edges, edges[1:])]}
+    values = digest.quantile(np.asarray(percentiles, dtype=np.float64) / 100)
+    counts = np.diff(np.rint(digest.rank(edges))).astype(int)
+    return {
+        'count': int(round(digest.count)),
+        'min': round(digest.min, 2),
+        'max': round(digest.max, 2),
+        'percentiles': {f'p{p:g}': round(float(v), 2) for p, v in zip(percentiles, values)},
+        'histogram': [{'lower': _edge(lo), 'upper': _edge(hi), 'count': int(c)}
+                      for lo, hi, c in zip(edges, edges[1:], counts)]
+    }
+
+
+def price_distribution(brand=None, cpu=None, ram_gb=None, group_by=None,
+                       percentiles=DEFAULT_PERCENTILES, edges=None, bins=DEFAULT_BINS):
+    """
+    由草图合并得到价格分布
+    :param brand: 品牌列表，为空表示不限（同一维度内多个取值取并集，不同维度之间取交集）
+    :param cpu: CPU列表
+    :param ram_gb: 内存容量列表
+    :param group_by: 可选的分组维度（brand/cpu/ram_gb），分别给出每个分组的分布
+    :param percentiles: 百分位（0-100）
+    :param edges: 直方图边界（可包含 ±inf，输出时为None），为空时在整体的最小值和最大值之间等宽划分 bins 个桶，
+                  没有匹配的商品时不划分
+    :return: {'overall': 分布, 'groups': [分布], 'filter': 筛选条件}
+    """
+    if group_by is not None and group_by not in SKETCH_DIMENSIONS:
+        raise ValueError(f'不支持的分组字段: {group_by}')
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError('百分位的取值范围为 0-100')
+    if not 1 <= bins <= MAX_BINS:
+        raise ValueError(f'直方图桶数的取值范围为 1-{MAX_BINS}')
+    wanted = dict(zip(SKETCH_DIMENSIONS, (brand, cpu, ram_gb)))
+    selected = [(key, digest) for key, digest in load_price_sketches()
+                if all(not values or key[i] in values for i, values in enumerate(wanted.values()))]
+    overall = TDigest.merge([digest for _, digest in selected])
+    if edges is None and overall.min is None:
+        edges = []
+    elif edges is None:
+        low, high = overall.min, overall.max
+        if high <= low:
+            # 所有价格相同：以该价格为中心展开，保证每个商品落在某个桶内
+            low, high = low - 0.5, high + 0.5
+        edges = np.linspace(low, high, bins + 1).round(2).tolist()
+        edges[0], edges[-1] = low, high
+    groups = []
+    if group_by:
+        position = SKETCH_DIMENSIONS.index(group_by)
+        members = {}
+        for key, digest in selected:
+            members.setdefault(key[position], []).append(digest)
+        for name, digests in members.items():
+            groups.append(dict(_summary(TDigest.merge(digests), percentiles, edges), group=name))
+        groups.sort(key=lambda item: item['count'], reverse=True)
+    return {
+        'overall': _summary(overall, percentiles, edges),
+        'groups': groups,
+        'group_by': group_by,
+        'filter': {name: list(values) if values else None for name, values in wanted.items()}
+    }
@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 import re
 import os
+from keyword_matcher import KeywordMatcher
 
 # 读取改进后的CSV文件
 try:
@@ -44,23 +46,19 @@ try:
         'lg': ['lg']
     }
     
-    # 从shop列识别品牌
-    def identify_brand_from_shop(row):
-        if row['品牌'] != '其他':
-            return row['品牌']
-        
-        shop = str(row['shop']).lower()
-        name = str(row['name']).lower()
-        
-        for brand, keywords in shop_brand_keywords.items():
-            for keyword in keywords:
-                if keyword.lower() in shop or keyword.lower() in name:
-                    return brand
-        
-        return '其他'
+    shop_brand_matcher = KeywordMatcher(shop_brand_keywords)
+    
+    # 从shop列识别品牌：只处理品牌为"其他"的行，shop和name任一命中即可，多个品牌命中时取映射中排在前面的品牌
+    def identify_brand_from_shop(df):
+        unknown = (df['品牌'] == '其他').to_numpy()
+        priority = np.minimum(shop_brand_matcher.priorities(df.loc[unknown, 'shop']),
+                              shop_brand_matcher.priorities(df.loc[unknown, 'name']))
+        brands = df['品牌'].copy()
+        brands[unknown] = shop_brand_matcher.labels_for(priority, '其他').to_numpy()
+        return brands
     
     # 应用品牌识别
-    df['品牌'] = df.apply(identify_brand_from_shop, axis=1)
+    df['品牌'] = identify_brand_from_shop(df)
     
     # 2. 从name列进一步识别CPU
     print("\n开始从name列识别更多CPU型号...")
@@ -84,31 +82,22 @@ try:
         'M2': ['m2', 'm2芯片'],
         'M3': ['m3', 'm3芯片'],
         'Intel N系列': ['n100', 'n305', 'n95', 'n4500', 'n4505', 'n5100', 'n5105'],
-        'Intel J系列': ['j4125', 'j3455', 'j4105']
+        'Intel J系列': ['j4125', 'j3455', 'j4105'],
+        # 特殊情况处理：以上型号都未命中时的兜底规则
+        'Intel 其他': ['酷睿', 'core'],
+        'AMD 其他': ['amd']
     }
+    cpu_matcher = KeywordMatcher(cpu_keywords)
     
-    # 从name列识别CPU
-    def identify_cpu_from_name(row):
-        if row['CPU'] != '其他':
-            return row['CPU']
-        
-        name = str(row['name']).lower()
-        
-        for cpu_type, keywords in cpu_keywords.items():
-            for keyword in keywords:
-                if keyword.lower() in name:
-                    return cpu_type
-        
-        # 特殊情况处理
-        if '酷睿' in name or 'core' in name:
-            return 'Intel 其他'
-        if 'amd' in name:
-            return 'AMD 其他'
-        
-        return '其他'
+    # 从name列识别CPU：只处理CPU为"其他"的行
+    def identify_cpu_from_name(df):
+        unknown = (df['CPU'] == '其他').to_numpy()
+        cpus = df['CPU'].copy()
+        cpus[unknown] = cpu_matcher.label_series(df.loc[unknown, 'name'], '其他').to_numpy()
+        return cpus
     
     # 应用CPU识别
-    df['CPU'] = df.apply(identify_cpu_from_name, axis=1)
+    df['CPU'] = identify_cpu_from_name(df)
     
     # 3. 保存为最终版CSV文件
     output_path = os.path.join('static', 'data', '笔记本电脑_final.csv')
@@ -0,0 +1,186 @@
+# 全文检索模块 - 基于数据库表的倒排索引，中文按字二元组切分，结果按 BM25 排序
+# 索引持久化在 search_documents / search_postings 表中，各工作进程共享，导入数据后只重建文本变化的文档
+import re
+import threading
+import unicodedata
+import zlib
+from collections import Counter
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, delete, func
+from models import db, Laptop, Comment, SearchDocument, SearchPosting
+from versioning import current_data_version
+
+# 可检索的文档类型：类型 -> (id列, [(文本列, 字段权重)], 过滤条件)
+SEARCH_KINDS = {
+    'laptop': (Laptop.id, [(Laptop.name, 2.0), (Laptop.shop, 1.0)], [Laptop.deleted_at.is_(None)]),
+    'comment': (Comment.id, [(Comment.content, 1.0)], [])
+}
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 词元最大长度（与 SearchPosting.term 一致）与索引批大小
+MAX_TERM_LENGTH = 32
+INDEX_BATCH_SIZE = 2000
+
+_TOKEN_PATTERN = re.compile(r'[\u3400-\u9fff]+|[a-z0-9]+')
+
+
+def tokenize(text):
+    """
+    将文本切分为词元：连续的中文按相邻两字切分（单字保留为一个词元），英文和数字保留整词
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', str(text)).lower()
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if run[0].isascii():
+            tokens.append(run[:MAX_TERM_LENGTH])
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _signature(fields):
+    """原始文本的校验值，用于在切分词元之前判断文档是否变化"""
+    return zlib.crc32('\x1f'.join('' if t is None else str(t) for t, _ in fields).encode('utf-8'))
+
+
+def _document(fields):
+    """
+    :param fields: [(文本, 权重)]
+    :return: (加权词频 {词元: tf}, 文档长度)
+    """
+    tf = Counter()
+    for text, weight in fields:
+        for token in tokenize(text):
+            tf[token] += weight
+    return tf, float(sum(tf.values()))
+
+
+def _write_documents(kind, docs):
+    """替换一批文档的索引：docs 为 [(doc_id, tf, length, signature)]"""
+    ids = [doc[0] for doc in docs]
+    db.session.execute(delete(SearchPosting).where(SearchPosting.kind == kind, SearchPosting.doc_id.in_(ids)))
+    db.session.execute(delete(SearchDocument).where(SearchDocument.kind == kind, SearchDocument.doc_id.in_(ids)))
+    db.session.execute(insert(SearchDocument), [
+        {'kind': kind, 'doc_id': doc_id, 'length': length, 'signature': signature}
+        for doc_id, _, length, signature in docs])
+    postings = [{'kind': kind, 'term': term, 'doc_id': doc_id, 'tf': value}
+                for doc_id, tf, _, _ in docs for term, value in tf.items()]
+    if postings:
+        db.session.execute(insert(SearchPosting), postings)
+
+
+def sync_search_index(kinds=None, batch_size=INDEX_BATCH_SIZE, rebuild=False):
+    """
+    增量更新倒排索引：只重建文本发生变化（或新增）的文档，并删除已不存在的文档
+    :param kinds: 需要更新的文档类型，默认全部
+    :param rebuild: 为真时清空后全量重建
+    :return: {类型: {'indexed': 重建文档数, 'removed': 删除文档数}}
+    """
+    result = {}
+    for kind in kinds or SEARCH_KINDS:
+        id_column, fields, conditions = SEARCH_KINDS[kind]
+        if rebuild:
+            db.session.execute(delete(SearchPosting).where(SearchPosting.kind == kind))
+            db.session.execute(delete(SearchDocument).where(SearchDocument.kind == kind))
+            db.session.commit()
+        existing = dict(db.session.execute(
+            select(SearchDocument.doc_id, SearchDocument.signature).where(SearchDocument.kind == kind)).all())
+        indexed = 0
+        last_id = 0
+        pending = []
+        while True:
+            rows = db.session.execute(select(id_column, *[c for c, _ in fields])
+                                      .where(id_column > last_id, *conditions)
+                                      .order_by(id_column).limit(batch_size)).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            for row in rows:
+                texts = [(row[i + 1], w) for i, (_, w) in enumerate(fields)]
+                signature = _signature(texts)
+                # 文本未变化的文档不需要重新切分词元
+                if existing.pop(row[0], None) != signature:
+                    tf, length = _document(texts)
+                    pending.append((row[0], tf, length, signature))
+            if len(pending) >= batch_size:
+                _write_documents(kind, pending)
+                db.session.commit()
+                indexed += len(pending)
+                pending = []
+        if pending:
+            _write_documents(kind, pending)
+            indexed += len(pending)
+        # 剩余的是已从源表删除（或已软删除）的文档
+        removed = list(existing)
+        for start in range(0, len(removed), batch_size):
+            ids = removed[start:start + batch_size]
+            db.session.execute(delete(SearchPosting).where(SearchPosting.kind == kind, SearchPosting.doc_id.in_(ids)))
+            db.session.execute(delete(SearchDocument).where(SearchDocument.kind == kind, SearchDocument.doc_id.in_(ids)))
+        db.session.commit()
+        result[kind] = {'indexed': indexed, 'removed': len(removed)}
+    return result
+
+
+_stats_cache = {}
+_stats_lock = threading.Lock()
+
+
+def _collection_stats(kind):
+    """文档数与平均长度，按数据版本缓存"""
+    key = (kind, current_data_version())
+    stats = _stats_cache.get(key)
+    if stats is None:
+        count, avg_length = db.session.execute(
+            select(func.count(), func.avg(SearchDocument.length)).where(SearchDocument.kind == kind)).one()
+        stats = (int(count or 0), float(avg_length or 0))
+        with _stats_lock:
+            _stats_cache.clear()
+            _stats_cache[key] = stats
+    return stats
+
+
+def search(query, kind='laptop', limit=20, offset=0, require_all=False):
+    """
+    检索并按 BM25 得分排序
+    :param query: 查询文本
+    :param kind: 文档类型
+    :param require_all: 为真时只返回包含全部查询词元的文档
+    :return: ([(doc_id, 得分)], 命中文档总数)
+    """
+    if kind not in SEARCH_KINDS:
+        raise ValueError(f'不支持的检索类型: {kind}')
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return [], 0
+    total_docs, avg_length = _collection_stats(kind)
+    rows = db.session.execute(
+        select(SearchPosting.term, SearchPosting.doc_id, SearchPosting.tf, SearchDocument.length)
+        .join(SearchDocument, (SearchDocument.kind == SearchPosting.kind) & (SearchDocument.doc_id == SearchPosting.doc_id))
+        .where(SearchPosting.kind == kind, SearchPosting.term.in_(terms))).all()
+    if not rows:
+        return [], 0
+    term, doc_id, tf, length = (np.asarray(col) for col in zip(*rows))
+    term_codes, term_values = pd.factorize(term)
+    doc_codes, doc_values = pd.factorize(doc_id)
+    # 每个词元的文档频率与逆文档频率
+    df = np.bincount(term_codes, minlength=len(term_values))
+    idf = np.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+    tf = tf.astype(np.float64)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length.astype(np.float64) / (avg_length or 1))
+    weights = idf[term_codes] * tf * (BM25_K1 + 1) / (tf + norm)
+    scores = np.bincount(doc_codes, weights=weights, minlength=len(doc_values))
+    doc_values = np.asarray(doc_values, dtype=np.int64)
+    if require_all:
+        matched = np.bincount(doc_codes, minlength=len(doc_values))
+        keep = matched == len(terms)
+        scores, doc_values = scores[keep], doc_values[keep]
+    order = np.lexsort((doc_values, -scores))[offset:offset + limit]
+    return [(int(doc_values[i]), round(float(scores[i]), 4)) for i in order], len(doc_values)
@@ -0,0 +1,150 @@
+# 评论情感分析模块 - 基于情感词典的中文评论打分，结果按批写入comments表的情感列
+import math
+import re
+from joblib import Parallel, delayed, effective_n_jobs
+from sqlalchemy import select, update, bindparam, inspect, text
+from models import db, Comment
+
+# 情感词及权重（按长词优先匹配，"不错"不会被拆成否定词加"错"）
+POSITIVE_WORDS = {
+    '好': 1.0, '不错': 1.5, '优秀': 2.0, '满意': 2.0, '推荐': 2.0, '喜欢': 2.0, '好评': 2.0, '完美': 2.0,
+    '值得': 1.5, '性价比高': 2.0, '流畅': 1.5, '强劲': 1.5, '给力': 1.5, '快': 1.0, '清晰': 1.0,
+    '漂亮': 1.0, '稳定': 1.0, '安静': 1.0, '轻薄': 1.0, '高性能': 1.5, '划算': 1.5, '惊喜': 1.5
+}
+NEGATIVE_WORDS = {
+    '差': 1.5, '不好': 1.5, '失望': 2.0, '退货': 2.0, '慢': 1.0, '卡顿': 2.0, '问题': 1.0, '缺点': 1.0,
+    '贵': 1.0, '不值': 2.0, '垃圾': 2.5, '发热': 1.0, '烫': 1.0, '噪音': 1.0, '坏了': 2.0, '故障': 2.0,
+    '蓝屏': 2.0, '差评': 2.0, '后悔': 2.0, '一般': 0.5, '掉帧': 1.5, '异响': 1.5
+}
+
+# 否定词（翻转其后的情感词）与程度副词（放大其后的情感词）
+NEGATIONS = ('没有', '不是', '不', '没', '别', '无')
+DEGREE_WORDS = {'非常': 2.0, '特别': 1.8, '十分': 1.8, '太': 1.8, '很': 1.5, '超': 1.5, '比较': 1.2, '有点': 0.8}
+
+# 否定词、程度副词与情感词之间允许的最大间隔（字符数）
+MODIFIER_WINDOW = 4
+
+# 情感标签阈值：得分范围为 [-1, 1]
+POSITIVE_THRESHOLD = 0.25
+NEGATIVE_THRESHOLD = -0.25
+LABELS = ('positive', 'neutral', 'negative')
+
+# 评论中常见的正面与负面关注点，用于统计关键词出现次数
+ASPECT_KEYWORDS = {
+    'positive': ['性能好', '外观漂亮', '性价比高', '散热好', '屏幕清晰'],
+    'negative': ['价格贵', '续航差', '散热差', '噪音大', '配置低']
+}
+
+# 打分与写回的批大小
+SCORE_BATCH_SIZE = 2000
+
+_WORDS = dict(POSITIVE_WORDS)
+_WORDS.update({w: -v for w, v in NEGATIVE_WORDS.items()})
+_WORD_PATTERN = re.compile('|'.join(re.escape(w) for w in sorted(_WORDS, key=len, reverse=True)))
+_MODIFIER_PATTERN = re.compile('|'.join(re.escape(w) for w in
+                                        sorted(list(NEGATIONS) + list(DEGREE_WORDS), key=len, reverse=True)))
+_CLAUSE_BREAK = re.compile(r'[，,。.！!？?；;、\s]')
+
+
+def score_text(content):
+    """
+    计算单条评论的情感
+    :return: (标签, 得分)，得分范围 [-1, 1]
+    """
+    if not content or not isinstance(content, str):
+        return 'neutral', 0.0
+    total = 0.0
+    last_end = 0
+    for match in _WORD_PATTERN.finditer(content):
+        weight = _WORDS[match.group()]
+        # 只看同一分句内、紧邻情感词之前的修饰词
+        prefix = content[max(last_end, match.start() - MODIFIER_WINDOW):match.start()]
+        prefix = _CLAUSE_BREAK.split(prefix)[-1]
+        for modifier in _MODIFIER_PATTERN.findall(prefix):
+            if modifier in DEGREE_WORDS:
+                weight *= DEGREE_WORDS[modifier]
+            else:
+                weight = -weight
+        total += weight
+        last_end = match.end()
+    score = math.tanh(total / 2)
+    if score >= POSITIVE_THRESHOLD:
+        return 'positive', round(score, 4)
+    if score <= NEGATIVE_THRESHOLD:
+        return 'negative', round(score, 4)
+    return 'neutral', round(score, 4)
+
+
+def score_texts(contents):
+    """批量计算情感，返回 (标签, 得分) 列表"""
+    return [score_text(content) for content in contents]
+
+
+def ensure_sentiment_columns():
+    """旧库的comments表没有情感列时补充（create_all 不会修改已存在的表）"""
+    columns = {c['name'] for c in inspect(db.engine).get_columns('comments')}
+    if 'sentiment_label' not in columns:
+        db.session.execute(text('ALTER TABLE comments ADD COLUMN sentiment_label VARCHAR(10)'))
+    if 'sentiment_score' not in columns:
+        db.session.execute(text('ALTER TABLE comments ADD COLUMN sentiment_score FLOAT'))
+    db.session.commit()
+
+
+def _write_scores(ids, scores):
+    table = Comment.__table__
+    stmt = (update(table).where(table.c.id == bindparam('comment_id'))
+            .values(sentiment_label=bindparam('label'), sentiment_score=bindparam('score')))
+    db.session.execute(stmt, [{'comment_id': i, 'label': label, 'score': score}
+                              for i, (label, score) in zip(ids, scores)])
+
+
+def score_pending_comments(batch_size=SCORE_BATCH_SIZE):
+    """
+    为尚未打分的评论（新导入或内容被修改的评论）分批计算情感并写回
+    :return: 打分的评论数
+    """
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Comment.id, Comment.content)
+            .where(Comment.sentiment_label.is_(None), Comment.id > last_id)
+            .order_by(Comment.id).limit(batch_size)).all()
+        if not rows:
+            break
+        ids = [r.id for r in rows]
+        _write_scores(ids, score_texts([r.content for r in rows]))
+        db.session.commit()
+        total += len(rows)
+        last_id = ids[-1]
+    return total
+
+
+def rescore_comments(chunk_size=SCORE_BATCH_SIZE, n_jobs=-1, progress=None):
+    """
+    重新计算全部评论的情感：按id分段读取，多个分段在进程池中并行打分后批量写回
+    :param chunk_size: 每个并行任务处理的评论数
+    :param n_jobs: 并行进程数，-1 表示使用全部CPU
+    :param progress: 可选的进度回调，参数为已处理的评论数
+    :return: 处理的评论数
+    """
+    total = 0
+    last_id = 0
+    n_workers = effective_n_jobs(n_jobs)
+    with Parallel(n_jobs=n_jobs) as parallel:
+        while True:
+            rows = db.session.execute(
+                select(Comment.id, Comment.content).where(Comment.id > last_id)
+                .order_by(Comment.id).limit(chunk_size * n_workers)).all()
+            if not rows:
+                break
+            chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+            results = parallel(delayed(score_texts)([r.content for r in chunk]) for chunk in chunks)
+            for chunk, scores in zip(chunks, results):
+                _write_scores([r.id for r in chunk], scores)
+            db.session.commit()
+            total += len(rows)
+            last_id = rows[-1].id
+            if progress:
+                progress(total)
+    return total
@@ -0,0 +1,279 @@
+# 列式内存快照模块 - 将jd表一次性加载为NumPy列存，供分析接口直接读取
+import threading
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from models import db, Laptop
+from versioning import current_data_version
+
+# 快照包含的列：数值列存为float64（空值为NaN），字符串列做字典编码
+NUMERIC_COLUMNS = ['price', 'sales', 'rating', 'ram_gb']
+CATEGORY_COLUMNS = ['brand', 'cpu', 'ram', 'shop']
+TEXT_COLUMNS = ['original_id', 'name']
+
+# records() 默认输出的字段，与 Laptop.to_dict() 一致
+RECORD_FIELDS = ['id', 'original_id', 'name', 'price', 'shop', 'brand', 'ram', 'cpu', 'sales', 'rating']
+
+# 分批读取的行数
+LOAD_BATCH_SIZE = 50000
+
+# 分组归约时组合键的取值范围不超过该值时直接用 bincount 分组，否则先排序去重
+DENSE_KEY_LIMIT = 1 << 22
+
+
+def grouped_reduce(codes, sizes, weights, stats, extremes=()):
+    """
+    分组归约内核：将多个维度编码组合为一个整数键，对计数与各度量的非空个数、和用 bincount 求和，
+    最小值和最大值只对 extremes 中的列计算
+    :param codes: 每个维度的编码数组
+    :param sizes: 每个维度的取值个数
+    :param weights: 每行代表的记录数（原始行为1，立方体单元为其计数）
+    :param stats: {列名: {'n', 'sum', 'min', 'max'}} 每行的度量
+    :return: (每个维度的分组编码, 分组计数, {列名: 分组度量})
+    """
+    key = np.zeros(len(weights), dtype=np.int64)
+    for column, size in zip(codes, sizes):
+        key = key * size + column
+    total = int(np.prod(sizes, dtype=np.int64)) if sizes else 1
+    if total <= DENSE_KEY_LIMIT:
+        present = np.bincount(key, minlength=total) > 0
+        cells = np.flatnonzero(present)
+        inverse = (np.cumsum(present) - 1)[key]
+    else:
+        cells, inverse = np.unique(key, return_inverse=True)
+    n_cells = len(cells)
+    count = np.bincount(inverse, weights=weights, minlength=n_cells)
+    reduced = {}
+    for name, columns in stats.items():
+        reduced[name] = {
+            'n': np.bincount(inverse, weights=columns['n'], minlength=n_cells),
+            'sum': np.bincount(inverse, weights=columns['sum'], minlength=n_cells)
+        }
+        if name in extremes:
+            low = np.full(n_cells, np.inf)
+            high = np.full(n_cells, -np.inf)
+            np.minimum.at(low, inverse, columns['min'])
+            np.maximum.at(high, inverse, columns['max'])
+            reduced[name]['min'], reduced[name]['max'] = low, high
+    # 将组合键还原为各维度的编码
+    cell_codes = []
+    for size in reversed(sizes):
+        cell_codes.append(cells % size)
+        cells = cells // size
+    return cell_codes[::-1], count, reduced
+
+
+def encode_column(values):
+    """
+    对字符串列做字典编码
+    :param values: 原始取值序列
+    :return: (int32编码数组, 类别列表)，空值单独编码为最后一个类别None
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), sort=True)
+    categories = list(uniques)
+    codes = codes.astype(np.int32)
+    missing = codes < 0
+    if missing.any():
+        codes[missing] = len(categories)
+        categories.append(None)
+    return codes, categories
+
+
+class LaptopSnapshot:
+    """jd表的只读列式快照"""
+
+    def __init__(self, columns, version=None):
+        """
+        :param columns: 列名到取值列表的映射（需包含id及所有快照列）
+        :param version: 快照对应的数据版本标识
+        """
+        self.version = version
+        self.loaded_at = time.time()
+        self.id = np.asarray(columns['id'], dtype=np.int64)
+        self.size = len(self.id)
+        for name in NUMERIC_COLUMNS:
+            setattr(self, name, np.array(columns[name], dtype=np.float64))
+        for name in TEXT_COLUMNS:
+            setattr(self, name, np.array(columns[name], dtype=object))
+        self.codes = {}
+        self.categories = {}
+        for name in CATEGORY_COLUMNS:
+            self.codes[name], self.categories[name] = encode_column(columns[name])
+        # 快照只读，无筛选条件的分组结果及派生的索引可在各接口之间共享
+        self._group_cache = {}
+        self._derived = {}
+        self._derived_lock = threading.RLock()
+
+    def code_of(self, column, value):
+        """返回取值在字典中的编码，不存在时返回None"""
+        try:
+            return self.categories[column].index(value)
+        except ValueError:
+            return None
+
+    def decode(self, column, mask=None):
+        """将字典编码列还原为对象数组"""
+        codes = self.codes[column] if mask is None else self.codes[column][mask]
+        return np.array(self.categories[column], dtype=object)[codes]
+
+    def column(self, column, mask=None):
+        """按列名取出一列（字典编码列会被还原）"""
+        if column in self.codes:
+            return self.decode(column, mask)
+        values = getattr(self, column)
+        return values if mask is None else values[mask]
+
+    def derived(self, name, build):
+        """
+        返回基于本快照构建的派生结构（如竞品矩阵、索引），每个快照只构建一次
+        :param build: 以快照为参数的构建函数
+        """
+        with self._derived_lock:
+            if name not in self._derived:
+                self._derived[name] = build(self)
+            return self._derived[name]
+
+    def positions(self, ids):
+        """将laptop id转换为快照中的行号（快照按id升序存放），不存在的id返回-1"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.size == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.clip(np.searchsorted(self.id, ids), 0, self.size - 1)
+        return np.where(self.id[pos] == ids, pos, -1)
+
+    def filter_mask(self, brand=None, cpu=None, ram=None, ram_gb_min=None, ram_gb_max=None,
+                    price_min=None, price_max=None):
+        """
+        按与 /api/data 相同的条件生成行掩码
+        :return: 布尔数组
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for column, value in (('brand', brand), ('cpu', cpu), ('ram', ram)):
+            if value:
+                code = self.code_of(column, value)
+                if code is None:
+                    return np.zeros(self.size, dtype=bool)
+                mask &= self.codes[column] == code
+        with np.errstate(invalid='ignore'):
+            if ram_gb_min is not None:
+                mask &= self.ram_gb >= ram_gb_min
+            if ram_gb_max is not None:
+                mask &= self.ram_gb <= ram_gb_max
+            if price_min is not None:
+                mask &= self.price >= price_min
+            if price_max is not None:
+                mask &= self.price <= price_max
+        return mask
+
+    def group_stats(self, column, mask=None):
+        """
+        按字典编码列分组统计，等价于 GROUP BY column 的 count/avg(price)/sum(sales)
+        :param column: 分组列名
+        :param mask: 可选的行掩码
+        :return: 每组一个字典的列表（仅包含非空分组）
+        """
+        if mask is None:
+            if column not in self._group_cache:
+                self._group_cache[column] = self._group_stats(column, None)
+            return [dict(item) for item in self._group_cache[column]]
+        return self._group_stats(column, mask)
+
+    def _group_stats(self, column, mask):
+        codes = self.codes[column]
+        price = self.price
+        sales = self.sales
+        if mask is not None:
+            codes, price, sales = codes[mask], price[mask], sales[mask]
+        # 与透视分析共用同一个分组归约内核
+        price_ok = ~np.isnan(price)
+        sales_ok = ~np.isnan(sales)
+        stats = {'price': {'n': price_ok.astype(np.float64), 'sum': np.where(price_ok, price, 0.0)},
+                 'sales': {'n': sales_ok.astype(np.float64), 'sum': np.where(sales_ok, sales, 0.0)}}
+        (cell_codes,), count, reduced = grouped_reduce([codes.astype(np.int64)], [len(self.categories[column])],
+                                                       np.ones(len(codes)), stats)
+        price_count, price_sum = reduced['price']['n'], reduced['price']['sum']
+        sales_sum = reduced['sales']['sum']
+        result = []
+        for i, code in enumerate(cell_codes):
+            result.append({
+                column: self.categories[column][code],
+                'count': int(count[i]),
+                'avg_price': float(price_sum[i] / price_count[i]) if price_count[i] else 0.0,
+                'total_sales': int(sales_sum[i])
+            })
+        return result
+
+    def to_frame(self, columns, mask=None):
+        """按需构建pandas DataFrame（字典编码列以Categorical形式还原）"""
+        data = {}
+        for name in columns:
+            if name == 'id':
+                data[name] = self.id if mask is None else self.id[mask]
+            elif name in self.codes:
+                codes = self.codes[name] if mask is None else self.codes[name][mask]
+                categories = self.categories[name]
+                if categories and categories[-1] is None:
+                    codes = np.where(codes == len(categories) - 1, -1, codes)
+                    categories = categories[:-1]
+                data[name] = pd.Categorical.from_codes(codes, categories=categories)
+            else:
+                data[name] = self.column(name, mask)
+        return pd.DataFrame(data)
+
+    def records(self, mask=None, fields=None):
+        """
+        按 Laptop.to_dict() 的格式输出行字典
+        :param fields: 可选的字段列表，默认与 to_dict() 相同
+        """
+        columns = list(fields or RECORD_FIELDS)
+        values = []
+        for name in columns:
+            if name == 'id':
+                values.append((self.id if mask is None else self.id[mask]).tolist())
+            elif name in NUMERIC_COLUMNS:
+                # NaN还原为None，整数列还原为int
+                column = self.column(name, mask)
+                cast = float if name in ('price', 'rating') else int
+                values.append([None if np.isnan(v) else cast(v) for v in column])
+            else:
+                values.append(self.column(name, mask))
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def load_snapshot(version=None):
+    """从数据库分批读取jd表（不含已软删除的行）并构建快照（不经过ORM实体）"""
+    names = ['id'] + TEXT_COLUMNS + NUMERIC_COLUMNS + CATEGORY_COLUMNS
+    stmt = select(*[getattr(Laptop, name) for name in names]).where(Laptop.deleted_at.is_(None)).order_by(Laptop.id)
+    result = db.session.execute(stmt.execution_options(yield_per=LOAD_BATCH_SIZE))
+    columns = {name: [] for name in names}
+    for part in result.partitions():
+        for name, values in zip(names, zip(*part)):
+            columns[name].extend(values)
+    return LaptopSnapshot(columns, version=version)
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    """
+    获取进程内共享的jd列式快照
+    数据版本号变化时重新加载
+    """
+    global _snapshot
+    key = current_data_version()
+    if _snapshot is not None and _snapshot.version == key:
+        return _snapshot
+    with _lock:
+        if _snapshot is None or _snapshot.version != key:
+            _snapshot = load_snapshot(version=key)
+        return _snapshot
+
+
+def invalidate_snapshot():
+    """使当前快照失效，下次访问时重新加载"""
+    global _snapshot
+    with _lock:
+        _snapshot = None
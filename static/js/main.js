@@ -116,11 +116,8 @@ function startAnalysis() {
                 }
             });
             
-            // 获取统计数据
-            fetchStatistics();
-            
-            // 获取图表数据并创建图表
-            fetchChartData();
+            // 一次请求获取统计数据和图表数据
+            fetchDashboard();
             
             // 平滑滚动到数据概览区域
             setTimeout(() => {
@@ -132,36 +129,30 @@ function startAnalysis() {
     }, 200);
 }
 
-// 获取统计数据
-function fetchStatistics() {
-    // 使用总览统计接口，避免全量数据加载
+// 一次请求获取所有概览组件（统计数据 + 图表数据）
+function fetchDashboard() {
     $.ajax({
-        url: '/api/overview_stats',
+        url: '/api/dashboard',
         method: 'GET',
         success: function(resp) {
+            const widgets = (resp && resp.success) ? resp.data : {};
+            const ok = name => widgets[name] && widgets[name].success;
+            
             let stats = { total_products: 0, avg_price: 0, total_sales: 0, total_brands: 0 };
-            if (resp && resp.success && resp.data) {
-                stats = resp.data;
+            if (ok('overview_stats')) {
+                stats = widgets.overview_stats.data;
             }
-            $.ajax({
-                url: '/api/brand_analysis',
-                method: 'GET',
-                success: function(res) {
-                    let brand_stats = [];
-                    if (res && res.success) {
-                        brand_stats = res.data.map(item => ({
-                            brand: item.brand,
-                            product_count: item.count,
-                            avg_price: item.avg_price,
-                            total_sales: item.total_sales
-                        }));
-                    }
-                    displayBasicStatistics(stats, brand_stats);
-                },
-                error: function() {
-                    displayBasicStatistics(stats, []);
-                }
-            });
+            let brand_stats = [];
+            if (ok('brand_analysis')) {
+                brand_stats = widgets.brand_analysis.data.map(item => ({
+                    brand: item.brand,
+                    product_count: item.count,
+                    avg_price: item.avg_price,
+                    total_sales: item.total_sales
+                }));
+            }
+            displayBasicStatistics(stats, brand_stats);
+            renderCharts(widgets, ok);
         },
         error: function() {
             displayBasicStatistics({ total_products: 0, avg_price: 0, total_sales: 0, total_brands: 0 }, []);
@@ -219,80 +210,45 @@ function displayBasicStatistics(stats, brandStats) {
     }
 }
 
-// 获取图表数据并创建图表
-function fetchChartData() {
+// 根据仪表盘数据创建图表
+function renderCharts(widgets, ok) {
     // 价格分布
-    $.ajax({
-        url: '/api/price_range_analysis',
-        method: 'GET',
-        success: function(response) {
-            if (response.success) {
-                const labels = response.data.map(item => item.range);
-                const data = response.data.map(item => item.count);
-                createPriceDistributionChart(labels, data);
-            }
-        }
-    });
+    if (ok('price_range_analysis')) {
+        const rows = widgets.price_range_analysis.data;
+        createPriceDistributionChart(rows.map(item => item.range), rows.map(item => item.count));
+    }
     // 品牌分布
-    $.ajax({
-        url: '/api/brand_analysis',
-        method: 'GET',
-        success: function(response) {
-            if (response.success) {
-                const labels = response.data.map(item => item.brand);
-                // 保证销量为数字类型
-                const data = response.data.map(item => Number(item.total_sales));
-                createBrandMarketShareChart(labels, data);
-            }
-        }
-    });
+    if (ok('brand_analysis')) {
+        const rows = widgets.brand_analysis.data;
+        // 保证销量为数字类型
+        createBrandMarketShareChart(rows.map(item => item.brand), rows.map(item => Number(item.total_sales)));
+    }
     // 价格与销量关系
-    $.ajax({
-        url: '/api/price_sales_correlation',
-        method: 'GET',
-        success: function(response) {
-            if (response.success) {
-                // 转换为散点图格式
-                const data = response.data.price_sales_data.map(item => ({ x: item.avg_price, y: item.avg_sales }));
-                createPriceSalesRelationshipChart(data);
-            }
-        }
-    });
+    if (ok('price_sales_correlation')) {
+        // 转换为散点图格式
+        const data = widgets.price_sales_correlation.data.price_sales_data.map(item => ({ x: item.avg_price, y: item.avg_sales }));
+        createPriceSalesRelationshipChart(data);
+    }
     // 内存分布
-    $.ajax({
-        url: '/api/ram_analysis',
-        method: 'GET',
-        success: function(response) {
-            if (response.success) {
-                // 对内存数据进行处理和排序
-                const ramData = response.data.map(item => ({
-                    ram: item.ram,
-                    count: item.count,
-                    // 提取内存大小的数字部分用于排序
-                    size: parseInt(item.ram.match(/\d+/)[0] || 0)
-                }));
-                
-                // 按内存大小排序
-                ramData.sort((a, b) => a.size - b.size);
-                
-                const labels = ramData.map(item => item.ram);
-                const data = ramData.map(item => item.count);
-                createRamDistributionChart(labels, data);
-            }
-        }
-    });
+    if (ok('ram_analysis')) {
+        // 对内存数据进行处理和排序
+        const ramData = widgets.ram_analysis.data.map(item => ({
+            ram: item.ram,
+            count: item.count,
+            // 提取内存大小的数字部分用于排序，">64GB" 这类无上界的桶排在同一数字的桶之后
+            size: parseInt(item.ram.match(/\d+/)[0] || 0) + (item.ram.startsWith('>') ? 0.5 : 0)
+        }));
+        
+        // 按内存大小排序
+        ramData.sort((a, b) => a.size - b.size);
+        
+        createRamDistributionChart(ramData.map(item => item.ram), ramData.map(item => item.count));
+    }
     // CPU分布
-    $.ajax({
-        url: '/api/cpu_analysis',
-        method: 'GET',
-        success: function(response) {
-            if (response.success) {
-                const labels = response.data.map(item => item.cpu);
-                const data = response.data.map(item => item.count);
-                createCpuDistributionChart(labels, data);
-            }
-        }
-    });
+    if (ok('cpu_analysis')) {
+        const rows = widgets.cpu_analysis.data;
+        createCpuDistributionChart(rows.map(item => item.cpu), rows.map(item => item.count));
+    }
 }
 
 // 创建价格分布图表
@@ -0,0 +1,59 @@
+# 数据版本模块 - 每次导入或修正数据后递增版本号，缓存与快照据此精确失效
+# 版本号是唯一的失效依据：所有写入jd表或评论的脚本都必须在提交后递增版本号（包括 import_to_mysql.py）
+import threading
+import time
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, DataVersion
+
+# 默认的数据集名称（jd 表及其评论）
+DATASET = 'jd'
+
+_cached = {}
+_lock = threading.Lock()
+
+
+def bump_data_version(name=DATASET):
+    """
+    递增数据版本号并提交，应在数据写入提交之后调用
+    :return: 新的版本号
+    """
+    updated = db.session.execute(
+        update(DataVersion).where(DataVersion.name == name).values(version=DataVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(DataVersion(name=name, version=1))
+    db.session.commit()
+    with _lock:
+        _cached.pop(name, None)
+    return read_data_version(name)
+
+
+def read_data_version(name=DATASET):
+    """
+    直接从数据库读取版本号，数据版本表不存在时返回None
+    使用独立的连接读取，不影响调用方会话中未提交的修改
+    """
+    try:
+        with db.engine.connect() as conn:
+            version = conn.execute(select(DataVersion.version).where(DataVersion.name == name)).scalar()
+    except SQLAlchemyError:
+        return None
+    return version or 0
+
+
+def current_data_version(name=DATASET):
+    """
+    读取当前数据版本号，按 DATA_VERSION_CHECK_INTERVAL 秒缓存，避免每个请求都查询数据库
+    各进程读取同一行版本号，递增后最迟一个检查间隔内全部生效
+    :return: 版本号，数据版本表不存在时为0
+    """
+    interval = current_app.config.get('DATA_VERSION_CHECK_INTERVAL', 1)
+    now = time.time()
+    entry = _cached.get(name)
+    if entry is None or now - entry[1] >= interval:
+        entry = (read_data_version(name) or 0, now)
+        with _lock:
+            _cached[name] = entry
+    return entry[0]